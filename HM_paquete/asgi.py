@@ -12,5 +12,11 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'HM_paquete.settings')
+# Habilita el seguimiento en vivo (settings.SERVIDOR_ASGI)
+os.environ.setdefault('SERVIDOR_ASGI', '1')
 
 application = get_asgi_application()
+
+from HM_paquete.precalentamiento import precalentar  # noqa: E402
+
+precalentar()
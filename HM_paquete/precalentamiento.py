@@ -0,0 +1,45 @@
+"""
+Precalentamiento de cada worker antes de atender tráfico (lo llaman wsgi.py y asgi.py).
+
+Recorre las aplicaciones instaladas y ejecuta su método precalentar(), si lo tienen.
+No se hace en AppConfig.ready() porque ready() también corre en migrate, en los tests y
+en cada comando de gestión, donde consultar la base de datos no está permitido o sobra.
+"""
+import logging
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+def precalentar():
+    """
+    Ejecuta los precalentamientos de las aplicaciones y devuelve {app: segundos}.
+    Un fallo (por ejemplo, la base de datos aún no disponible) se registra y no impide
+    arrancar: esos datos se cargarán en la primera petición que los necesite.
+    """
+    if not getattr(settings, 'PRECALENTAR_AL_INICIAR', True):
+        return {}
+    tiempos = {}
+    try:
+        for config in apps.get_app_configs():
+            if not hasattr(config, 'precalentar'):
+                continue
+            inicio = time.perf_counter()
+            try:
+                config.precalentar()
+            except Exception:
+                logger.warning('No se pudo precalentar %s', config.label, exc_info=True)
+            tiempos[config.label] = time.perf_counter() - inicio
+    finally:
+        # Con servidores que cargan la aplicación antes de hacer fork (gunicorn --preload)
+        # los procesos hijos no deben heredar la conexión abierta aquí
+        connections.close_all()
+    logger.info(
+        'Precalentamiento completado en %.0f ms', sum(tiempos.values()) * 1000,
+        extra={'campos': {app: round(segundos * 1000) for app, segundos in tiempos.items()}},
+    )
+    return tiempos
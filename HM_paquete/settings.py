@@ -16,6 +16,10 @@ import os
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Archivos que genera la aplicación (instantánea de seguimiento, perfiles), fuera del código.
+# En producción apuntar HM_DATOS_DIRECTORIO a un volumen escribible por los workers.
+DATOS_DIRECTORIO = Path(os.environ.get('HM_DATOS_DIRECTORIO', BASE_DIR / 'datos'))
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.0/howto/deployment/checklist/
@@ -44,11 +48,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'website_app.middleware.MetricasMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'website_app.middleware.PerfiladoMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -57,7 +63,7 @@ ROOT_URLCONF = 'HM_paquete.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'website_app.plantillas.DjangoTemplatesMedidas',
         'DIRS': [Path.joinpath(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -132,3 +138,162 @@ STATICFILES_DIRS = [
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Tarifa de pago al mensajero
+# El pago es PRECIO_BASE multiplicado por el factor del primer tramo cuyo
+# límite (en libras) cubre el peso del envío. Por encima del último tramo no hay pago.
+
+TARIFA_MENSAJERO = {
+    'PRECIO_BASE': 400,
+    'TRAMOS': [
+        (50, 1),
+        (100, 2),
+        (150, 2.5),
+        (200, 3),
+    ],
+}
+
+# Métricas de rendimiento (website_app.middleware.MetricasMiddleware)
+# Las peticiones más lentas que el umbral se registran con su SQL en el logger 'website_app.lentas'
+
+METRICAS_UMBRAL_LENTO_MS = 1000
+# /metrics exige un usuario staff o la cabecera `Authorization: Bearer <METRICAS_TOKEN>`
+# (el token del scraper de Prometheus); sin token solo entra el staff.
+METRICAS_TOKEN = os.environ.get('METRICAS_TOKEN', '')
+
+# Perfilado bajo demanda (website_app.middleware.PerfiladoMiddleware): un staff con ?perfilar=1
+# o la cabecera X-Perfilar firmada (comando firmar_perfilado). Los informes se ven en /perfiles.
+
+PERFILADO_DIRECTORIO = DATOS_DIRECTORIO / 'perfiles'
+PERFILADO_MAX_INFORMES = 50
+PERFILADO_MAX_CONSULTAS = 500
+PERFILADO_FIRMA_SEGUNDOS = 300
+
+# Presupuestos de consultas y latencia por vista (website_app.presupuestos). En producción
+# los excesos solo se registran; en `manage.py test` hacen fallar las pruebas. El factor
+# da margen a la latencia en máquinas de CI más lentas que la de referencia.
+
+TEST_RUNNER = 'website_app.ejecutor_pruebas.EjecutorPresupuestos'
+PRESUPUESTO_FACTOR_LATENCIA_PRUEBAS = 1.0
+
+
+# Seguimiento en vivo por server-sent events (website_app.views.eventos_envio)
+# Con SSE_CANAL_NOTIFY los cambios se difunden entre workers con LISTEN/NOTIFY de PostgreSQL;
+# con None solo llegan a los clientes conectados al mismo proceso.
+# SERVIDOR_ASGI indica que el sitio se sirve con ASGI; HM_paquete.asgi lo activa al arrancar.
+# Con WSGI cada flujo ocuparía un worker: la página no abre el EventSource y la vista responde 204.
+
+SERVIDOR_ASGI = os.environ.get('SERVIDOR_ASGI') == '1'
+SSE_MAX_CONEXIONES = 500
+SSE_LATIDO_SEGUNDOS = 20
+SSE_DURACION_MAXIMA_SEGUNDOS = 900
+SSE_CANAL_NOTIFY = 'hm_envios'
+
+# Planificador de despachos a mensajeros (comando planificar_despachos): límites de cada carga.
+
+PLANIFICADOR_DESPACHO = {
+    'PESO_MAXIMO': 60,      # kg por carga
+    'ENVIOS_MAXIMOS': 40,   # envíos por carga
+}
+
+# Archivo de envíos entregados (comando archivar_envios). Por defecto solo copia; con --purgar
+# borra de Envio e ItemDocumento los envíos cuyo archivo se verificó. Debe ser mayor que la
+# ventana de calcular_eta (180 días) para no quitarle historial.
+
+ARCHIVO_DIAS_ENTREGADO = 365
+
+# Modo degradado de seguimiento (website_app.instantanea). La instantánea la genera
+# periódicamente exportar_instantanea_seguimiento; si la base de datos falla o la petición
+# supera SEGUIMIENTO_UMBRAL_LENTO_MS, shipment_details responde desde ella. Con
+# SEGUIMIENTO_FALLAS_DEGRADADO fallas en SEGUIMIENTO_VENTANA_FALLAS_SEGUNDOS el proceso
+# consulta primero la instantánea durante SEGUIMIENTO_DEGRADADO_SEGUNDOS.
+
+SEGUIMIENTO_INSTANTANEA = DATOS_DIRECTORIO / 'instantanea_seguimiento.bin'
+SEGUIMIENTO_UMBRAL_LENTO_MS = 2000
+SEGUIMIENTO_FALLAS_DEGRADADO = 3
+SEGUIMIENTO_VENTANA_FALLAS_SEGUNDOS = 10
+SEGUIMIENTO_DEGRADADO_SEGUNDOS = 30
+
+# Precalentamiento de cada worker al cargar wsgi.py/asgi.py (HM_paquete.precalentamiento):
+# ContentType de los documentos, provincias/municipios, tarifas, servicios y plantillas.
+
+PRECALENTAR_AL_INICIAR = True
+
+# Datos de referencia en memoria de cada proceso (hmpaquetesapp.service.cache_service.CargaVersionada):
+# tarifas, provincias y municipios, servicios, tiempos de entrega y mapas de permisos. La versión
+# compartida en la caché se consulta como mucho cada INTERVALO segundos. Con la caché por proceso
+# por defecto (LocMem) las invalidaciones de otro worker no llegan y los datos se recargan al
+# superar EDAD_MAXIMA segundos; con varios workers conviene configurar CACHES con Redis o Memcached.
+
+CACHE_INTERVALO_VERSION_SEGUNDOS = 5
+CACHE_EDAD_MAXIMA_SEGUNDOS = 60
+
+# Avisos de cotizaciones nuevas (cotizacion_app.notificaciones): un correo por servicio cada
+# INTERVALO segundos con las cotizaciones recibidas, enviado desde un hilo fuera de la
+# petición con EMAIL_BACKEND. Sin destinatarios no se envía nada.
+
+NOTIFICACIONES_COTIZACION_DESTINATARIOS = []
+NOTIFICACIONES_COTIZACION_INTERVALO_SEGUNDOS = 300
+NOTIFICACIONES_COTIZACION_REINTENTOS = 5
+
+
+# Logging
+# Los loggers de website_app escriben a través de una cola (website_app.registro.ManejadorCola):
+# el formateo y la escritura se hacen en un hilo aparte, fuera de la petición. La cola admite
+# como mucho LOGS_COLA_MAXIMO registros; los que no caben se descartan.
+# MUESTREO_LOGS fija la fracción de registros INFO/DEBUG que se conservan por logger.
+
+MUESTREO_LOGS = {
+    'website_app.views': 0.1,
+}
+
+LOGS_COLA_MAXIMO = 10000
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'muestreo': {
+            '()': 'website_app.registro.FiltroMuestreo',
+            'tasas': MUESTREO_LOGS,
+        },
+    },
+    'formatters': {
+        'estructurado': {
+            '()': 'website_app.registro.FormateadorEstructurado',
+            'format': '%(asctime)s %(levelname)s %(name)s %(message)s',
+        },
+    },
+    'handlers': {
+        'consola': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'estructurado',
+        },
+        'cola': {
+            'class': 'website_app.registro.ManejadorCola',
+            'queue': {'()': 'queue.Queue', 'maxsize': LOGS_COLA_MAXIMO},
+            'handlers': ['consola'],
+            'listener': 'website_app.registro.OyenteCola',
+            'respect_handler_level': True,
+            'filters': ['muestreo'],
+        },
+    },
+    'loggers': {
+        'HM_paquete': {
+            'handlers': ['cola'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'website_app': {
+            'handlers': ['cola'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'cotizacion_app': {
+            'handlers': ['cola'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
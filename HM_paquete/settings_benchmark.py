@@ -0,0 +1,13 @@
+"""
+Ajustes para ejecutar los benchmarks sin PostgreSQL, sobre una base SQLite desechable:
+
+    python manage.py benchmark_tracking --settings=HM_paquete.settings_benchmark
+"""
+from HM_paquete.settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'benchmark.sqlite3',  # noqa: F405
+    }
+}
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'HM_paquete.settings')
 
 application = get_wsgi_application()
+
+from HM_paquete.precalentamiento import precalentar  # noqa: E402
+
+precalentar()
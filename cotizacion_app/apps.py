@@ -0,0 +1,16 @@
+from django.apps import AppConfig
+
+
+class CotizacionAppConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'cotizacion_app'
+
+    def ready(self):
+        # Registrar los receptores de señales
+        from cotizacion_app import signals  # noqa: F401
+
+    def precalentar(self):
+        """Carga el catálogo de servicios que muestra el formulario de cotización."""
+        from cotizacion_app.service.cotizacion_service import CatalogoServicios
+
+        CatalogoServicios.obtener()
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from cotizacion_app.models import Cotizacion
+
+
+class Command(BaseCommand):
+    help = (
+        "Crea los índices de Cotizacion.Meta.indexes que falten. cotizacion_app no tiene "
+        "migraciones, así que en bases existentes los índices nuevos no se crean solos."
+    )
+
+    def handle(self, *args, **options):
+        tabla = Cotizacion._meta.db_table
+        with connection.cursor() as cursor:
+            existentes = connection.introspection.get_constraints(cursor, tabla)
+
+        with connection.schema_editor() as editor:
+            for indice in Cotizacion._meta.indexes:
+                if indice.name in existentes:
+                    self.stdout.write(f"Ya existe: {indice.name}")
+                    continue
+                editor.add_index(Cotizacion, indice)
+                self.stdout.write(self.style.SUCCESS(f"Creado: {indice.name} en {tabla}"))
@@ -17,5 +17,17 @@ class Cotizacion(models.Model):
     atendido = models.BooleanField(default=False)
 
     def __str__(self):
-        nombres_servicios = ', '.join(self.servicios.all().values_list('nombre', flat=True))
-        return f"Cotizacion del cliente: ->{self.servicio.nombre} Fecha: -> {self.fecha_solicitud} Servicios: -> {nombres_servicios} (Atendico: {self.atendido})"
\ No newline at end of file
+        # servicios.all() aprovecha el prefetch_related del listado, si lo hay
+        nombres_servicios = ', '.join(servicio.nombre for servicio in self.servicios.all())
+        return f"Cotizacion del cliente: ->{self.nombre_cliente} Fecha: -> {self.fecha_solicitud} Servicios: -> {nombres_servicios} (Atendido: {self.atendido})"
+
+    class Meta:
+        indexes = [
+            # Bandeja de pendientes: filtro atendido=False y orden por (fecha_solicitud, id).
+            # En bases existentes lo crea el comando crear_indices_cotizacion
+            models.Index(
+                fields=['fecha_solicitud', 'id'],
+                condition=models.Q(atendido=False),
+                name='cotizacion_pendiente_idx',
+            ),
+        ]
@@ -0,0 +1,192 @@
+"""
+Avisos al equipo de ventas de las cotizaciones nuevas, agrupados en resúmenes por servicio.
+
+ServicioCotizacion.insertar_cotizacion llama a encolar(); el evento entra en la cola en
+memoria del proceso cuando la transacción se confirma, así que una cotización revertida no
+se avisa y la petición no espera al servidor de correo. Un hilo (Despachador) junta los
+eventos durante NOTIFICACIONES_COTIZACION_INTERVALO_SEGUNDOS y envía un correo por servicio.
+Si el envío falla, el resumen se reintenta con espera creciente hasta
+NOTIFICACIONES_COTIZACION_REINTENTOS veces. Los eventos que no llegan a enviarse (por ejemplo,
+si el proceso muere) no se pierden para ventas: las cotizaciones siguen en la bandeja.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Longitud máxima de los detalles de cada cotización en el resumen
+LARGO_DETALLES = 300
+# Espera máxima entre reintentos
+ESPERA_MAXIMA_SEGUNDOS = 3600
+
+_despachador = None
+_despachador_lock = threading.Lock()
+
+
+def destinatarios():
+    return list(getattr(settings, 'NOTIFICACIONES_COTIZACION_DESTINATARIOS', ()))
+
+
+def encolar(cotizacion, servicio):
+    """Avisa de la cotización cuando se confirme la transacción actual. Sin destinatarios no hace nada."""
+    if not destinatarios():
+        return
+    evento = {
+        'id': cotizacion.pk,
+        'servicio': servicio.nombre,
+        'fecha': cotizacion.fecha_solicitud,
+        'nombre_cliente': cotizacion.nombre_cliente,
+        'email': cotizacion.email,
+        'detalles': (cotizacion.detalles_adicionales or '')[:LARGO_DETALLES],
+    }
+    transaction.on_commit(lambda: despachador().agregar(evento))
+
+
+def despachador():
+    """Despachador del proceso; se arranca con el primer evento."""
+    global _despachador
+    if _despachador is None:
+        with _despachador_lock:
+            if _despachador is None:
+                _despachador = Despachador()
+                _despachador.start()
+                atexit.register(_despachador.vaciar, 10)
+    return _despachador
+
+
+def vaciar(timeout=30):
+    """Envía ya los resúmenes pendientes (al terminar el proceso o en pruebas)."""
+    if _despachador is not None:
+        return _despachador.vaciar(timeout)
+    return True
+
+
+def resumen(servicio, eventos):
+    """Correo con las cotizaciones de un servicio."""
+    cantidad = len(eventos)
+    asunto = f"{cantidad} cotización nueva de {servicio}" if cantidad == 1 else f"{cantidad} cotizaciones nuevas de {servicio}"
+    bloques = []
+    for evento in eventos:
+        bloque = f"#{evento['id']} {timezone.localtime(evento['fecha']):%Y-%m-%d %H:%M} {evento['nombre_cliente']} <{evento['email']}>"
+        if evento['detalles']:
+            bloque += f"\n    {evento['detalles']}"
+        bloques.append(bloque)
+    cuerpo = '\n\n'.join(bloques) + '\n\nPendientes de atender en la bandeja de cotizaciones.'
+    return EmailMessage(subject=asunto, body=cuerpo, to=destinatarios())
+
+
+class Despachador(threading.Thread):
+    """
+    Hilo que agrupa los eventos por servicio y envía los resúmenes periódicamente.
+    Solo este hilo toca los pendientes; los demás se comunican con él por la cola.
+    """
+
+    daemon = True
+
+    def __init__(self):
+        super().__init__(name='notificaciones-cotizacion')
+        self.cola = queue.Queue()
+        # servicio → eventos, intentos fallidos y momento (monotónico) del próximo envío
+        self.pendientes = {}
+
+    def agregar(self, evento):
+        self.cola.put(evento)
+
+    def vaciar(self, timeout=30):
+        """
+        Pide enviar ya todos los resúmenes, con un único intento, y espera el resultado.
+
+        Returns:
+            True si no quedó nada pendiente
+        """
+        listo = threading.Event()
+        self.cola.put(listo)
+        return listo.wait(timeout) and not self.pendientes
+
+    def _intervalo(self):
+        return getattr(settings, 'NOTIFICACIONES_COTIZACION_INTERVALO_SEGUNDOS', 300)
+
+    def _acumular(self, evento):
+        pendiente = self.pendientes.get(evento['servicio'])
+        if pendiente is None:
+            pendiente = self.pendientes[evento['servicio']] = {
+                'eventos': [], 'intentos': 0, 'envio': time.monotonic() + self._intervalo(),
+            }
+        pendiente['eventos'].append(evento)
+
+    def _espera(self):
+        if not self.pendientes:
+            return None
+        return max(0.0, min(pendiente['envio'] for pendiente in self.pendientes.values()) - time.monotonic())
+
+    def _enviar(self, todos=False):
+        ahora = time.monotonic()
+        listos = [servicio for servicio, pendiente in self.pendientes.items() if todos or pendiente['envio'] <= ahora]
+        if not listos:
+            return
+        try:
+            conexion = get_connection(fail_silently=False)
+            conexion.open()
+        except Exception:
+            logger.exception('No se pudo conectar con el servidor de correo')
+            for servicio in listos:
+                self._fallido(servicio)
+            return
+        try:
+            for servicio in listos:
+                pendiente = self.pendientes[servicio]
+                try:
+                    conexion.send_messages([resumen(servicio, pendiente['eventos'])])
+                except Exception:
+                    logger.exception('No se pudo enviar el resumen de cotizaciones de %s', servicio)
+                    self._fallido(servicio)
+                else:
+                    del self.pendientes[servicio]
+                    logger.info('Resumen de %s cotizaciones de %s enviado', len(pendiente['eventos']), servicio)
+        finally:
+            try:
+                conexion.close()
+            except Exception:
+                pass
+
+    def _fallido(self, servicio):
+        pendiente = self.pendientes[servicio]
+        pendiente['intentos'] += 1
+        if pendiente['intentos'] > getattr(settings, 'NOTIFICACIONES_COTIZACION_REINTENTOS', 5):
+            del self.pendientes[servicio]
+            logger.error(
+                'Se descartó el resumen de %s cotizaciones de %s tras %s intentos (ids %s)',
+                len(pendiente['eventos']), servicio, pendiente['intentos'],
+                [evento['id'] for evento in pendiente['eventos']],
+            )
+            return
+        espera = min(self._intervalo() * 2 ** (pendiente['intentos'] - 1), ESPERA_MAXIMA_SEGUNDOS)
+        pendiente['envio'] = time.monotonic() + espera
+
+    def run(self):
+        while True:
+            try:
+                mensaje = self.cola.get(timeout=self._espera())
+            except queue.Empty:
+                mensaje = None
+            try:
+                if isinstance(mensaje, threading.Event):
+                    try:
+                        self._enviar(todos=True)
+                    finally:
+                        mensaje.set()
+                    continue
+                if mensaje is not None:
+                    self._acumular(mensaje)
+                self._enviar()
+            except Exception:
+                # El hilo no debe morir: los siguientes eventos se siguen atendiendo
+                logger.exception('Error en el despachador de notificaciones de cotización')
@@ -1,5 +1,35 @@
+import threading
+from datetime import datetime, timedelta, timezone
+
 from django.db import transaction
+from django.db.models import Prefetch, Q
+from cotizacion_app import notificaciones
 from cotizacion_app.models import Cotizacion, Servicio
+from hmpaquetesapp.service.cache_service import CargaVersionada
+
+LIMITE_BANDEJA = 200
+
+EPOCA = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSEGUNDO = timedelta(microseconds=1)
+
+
+def _leer_cursor(cursor):
+    """
+    El cursor es 'microsegundos:id' de la última cotización de la página anterior;
+    la fecha va en microsegundos desde 1970 para que el cursor no necesite escaparse en la URL.
+    """
+    if not cursor:
+        return None
+    try:
+        microsegundos, cotizacion_id = cursor.split(':')
+        return EPOCA + int(microsegundos) * MICROSEGUNDO, int(cotizacion_id)
+    except (ValueError, OverflowError):
+        raise ValueError(f"Cursor de bandeja inválido: {cursor}")
+
+
+def _crear_cursor(cotizacion):
+    return f"{(cotizacion.fecha_solicitud - EPOCA) // MICROSEGUNDO}:{cotizacion.pk}"
+
 
 class ServicioCotizacion:
     @staticmethod
@@ -35,9 +65,84 @@ class ServicioCotizacion:
         # Asignar el servicio a la relación ManyToMany
         # Si esto falla, la transacción se revertirá y la cotización no se creará
         cotizacion.servicios.add(servicio)
-        
+
+        # Aviso a ventas tras el commit, desde el hilo de notificaciones
+        notificaciones.encolar(cotizacion, servicio)
+
         return cotizacion
     
+    @staticmethod
+    def bandeja(cursor=None, limite=50):
+        """
+        Cotizaciones sin atender, de la más antigua a la más reciente, paginadas por
+        cursor (fecha_solicitud, id): cada página cuesta lo mismo sin importar su profundidad.
+
+        Returns:
+            dict con 'resultados' (lista de dicts) y 'cursor_siguiente' (None si no hay más).
+        Raise:
+            ValueError: si el cursor no es válido
+        """
+        limite = max(1, min(limite, LIMITE_BANDEJA))
+        cotizaciones = Cotizacion.objects.filter(atendido=False)
+        posicion = _leer_cursor(cursor)
+        if posicion:
+            fecha, cotizacion_id = posicion
+            cotizaciones = cotizaciones.filter(
+                Q(fecha_solicitud__gt=fecha) | Q(fecha_solicitud=fecha, pk__gt=cotizacion_id)
+            )
+        cotizaciones = list(
+            cotizaciones.order_by('fecha_solicitud', 'pk')
+            .prefetch_related(Prefetch('servicios', queryset=Servicio.objects.only('nombre')))
+            [:limite + 1]
+        )
+
+        hay_mas = len(cotizaciones) > limite
+        cotizaciones = cotizaciones[:limite]
+        return {
+            'resultados': [
+                {
+                    'id': cotizacion.pk,
+                    'fecha_solicitud': cotizacion.fecha_solicitud.isoformat(),
+                    'nombre_cliente': cotizacion.nombre_cliente,
+                    'email': cotizacion.email,
+                    'detalles_adicionales': cotizacion.detalles_adicionales or '',
+                    'servicios': [servicio.nombre for servicio in cotizacion.servicios.all()],
+                }
+                for cotizacion in cotizaciones
+            ],
+            'cursor_siguiente': _crear_cursor(cotizaciones[-1]) if hay_mas else None,
+        }
+
+    @staticmethod
+    def marcar_atendidas(ids):
+        """
+        Marca como atendidas las cotizaciones indicadas con un único UPDATE.
+
+        Returns:
+            número de cotizaciones que estaban pendientes y se marcaron
+        """
+        return Cotizacion.objects.filter(pk__in=ids, atendido=False).update(atendido=True)
+
     @staticmethod
     def listar_servicios_activos():
-        return Servicio.objects.filter(activo=True)
\ No newline at end of file
+        return CatalogoServicios.obtener().activos
+
+
+class CatalogoServicios(CargaVersionada):
+    """
+    Servicios activos en memoria para el formulario de cotización de cada página.
+    Se recarga cuando se guarda o elimina un Servicio (ver CargaVersionada).
+    """
+
+    CLAVE_VERSION = 'servicios:version'
+
+    _actual = None
+    _lock = threading.Lock()
+
+    def __init__(self, activos, version=0):
+        self.activos = list(activos)
+        self.version = version
+
+    @classmethod
+    def cargar(cls, version=0):
+        return cls(Servicio.objects.filter(activo=True).order_by('pk'), version)
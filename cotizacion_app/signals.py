@@ -0,0 +1,9 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from cotizacion_app.models import Servicio
+from cotizacion_app.service.cotizacion_service import CatalogoServicios
+
+
+@receiver([post_save, post_delete], sender=Servicio)
+def invalidar_catalogo_servicios(sender, **kwargs):
+    CatalogoServicios.invalidar()
@@ -0,0 +1,190 @@
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from django.core import mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from cotizacion_app import notificaciones
+from cotizacion_app.models import Cotizacion, Servicio
+from cotizacion_app.service.cotizacion_service import CatalogoServicios, ServicioCotizacion, _crear_cursor, _leer_cursor
+
+POR_PROCESO = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def nombres_activos():
+    return [servicio.nombre for servicio in ServicioCotizacion.listar_servicios_activos()]
+
+
+@override_settings(CACHE_INTERVALO_VERSION_SEGUNDOS=0)
+class PruebasCatalogoServicios(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.aereo = Servicio.objects.create(nombre='Aéreo')
+        cls.maritimo = Servicio.objects.create(nombre='Marítimo')
+        Servicio.objects.create(nombre='Inactivo', activo=False)
+
+    def setUp(self):
+        CatalogoServicios.invalidar()
+
+    def test_invalidacion_por_senal(self):
+        self.assertEqual(nombres_activos(), ['Aéreo', 'Marítimo'])
+        self.maritimo.activo = False
+        self.maritimo.save()
+        self.assertEqual(nombres_activos(), ['Aéreo'])
+
+    @override_settings(CACHE_EDAD_MAXIMA_SEGUNDOS=0, CACHES=POR_PROCESO)
+    def test_recarga_por_edad_con_cache_por_proceso(self):
+        self.assertEqual(nombres_activos(), ['Aéreo', 'Marítimo'])
+        # Desactivado desde otro worker: update() no envía señales
+        Servicio.objects.filter(pk=self.aereo.pk).update(activo=False)
+        self.assertEqual(nombres_activos(), ['Marítimo'])
+
+    @override_settings(CACHE_EDAD_MAXIMA_SEGUNDOS=3600, CACHES=POR_PROCESO)
+    def test_sin_recarga_antes_de_la_edad_maxima(self):
+        catalogo = CatalogoServicios.obtener()
+        with self.assertNumQueries(0):
+            self.assertIs(CatalogoServicios.obtener(), catalogo)
+
+
+class PruebasCursorBandeja(SimpleTestCase):
+
+    def test_ida_y_vuelta(self):
+        for fecha in (
+            datetime(2024, 3, 10, 12, 30, 15, 123456, tzinfo=timezone.utc),
+            datetime(1969, 12, 31, 23, 59, 59, 999999, tzinfo=timezone.utc),
+        ):
+            with self.subTest(fecha=fecha):
+                cursor = _crear_cursor(Cotizacion(pk=42, fecha_solicitud=fecha))
+                self.assertEqual(_leer_cursor(cursor), (fecha, 42))
+
+    def test_cursor_invalido(self):
+        self.assertIsNone(_leer_cursor(None))
+        for cursor in ('abc', '1:2:3', '1:x', '9' * 30 + ':1'):
+            with self.subTest(cursor=cursor), self.assertRaises(ValueError):
+                _leer_cursor(cursor)
+
+
+class PruebasBandeja(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Cotizacion.objects.bulk_create(
+            Cotizacion(nombre_cliente=f'Cliente {n}', email='cliente@example.com', atendido=n % 5 == 0) for n in range(30)
+        )
+        # Varias cotizaciones con la misma fecha: el id desempata
+        base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        for n, cotizacion_id in enumerate(Cotizacion.objects.order_by('pk').values_list('pk', flat=True)):
+            Cotizacion.objects.filter(pk=cotizacion_id).update(fecha_solicitud=base + timedelta(seconds=n // 4))
+
+    def paginas(self, limite):
+        ids, cursor = [], None
+        while True:
+            pagina = ServicioCotizacion.bandeja(cursor, limite)
+            ids.extend(resultado['id'] for resultado in pagina['resultados'])
+            cursor = pagina['cursor_siguiente']
+            if cursor is None:
+                return ids
+
+    def test_recorre_todas_sin_repetir(self):
+        esperados = list(Cotizacion.objects.filter(atendido=False).order_by('fecha_solicitud', 'pk').values_list('pk', flat=True))
+        for limite in (1, 3, 7, len(esperados), 500):
+            with self.subTest(limite=limite):
+                self.assertEqual(self.paginas(limite), esperados)
+
+    def test_atender_entre_paginas(self):
+        primera = ServicioCotizacion.bandeja(limite=5)
+        restantes = list(
+            Cotizacion.objects.filter(atendido=False).order_by('fecha_solicitud', 'pk').values_list('pk', flat=True)[5:]
+        )
+        self.assertEqual(ServicioCotizacion.marcar_atendidas(restantes[:3]), 3)
+        segunda = ServicioCotizacion.bandeja(primera['cursor_siguiente'], limite=5)
+        self.assertEqual([resultado['id'] for resultado in segunda['resultados']], restantes[3:8])
+
+
+class CorreoCaido(BaseEmailBackend):
+    """Backend de correo que no logra enviar nada."""
+
+    def send_messages(self, email_messages):
+        raise ConnectionError('Servidor de correo caído')
+
+
+CORREO_CAIDO = 'cotizacion_app.tests.CorreoCaido'
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    NOTIFICACIONES_COTIZACION_DESTINATARIOS=['ventas@example.com'],
+    NOTIFICACIONES_COTIZACION_REINTENTOS=1,
+)
+class PruebasNotificaciones(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.aereo = Servicio.objects.create(nombre='Aéreo')
+        cls.maritimo = Servicio.objects.create(nombre='Marítimo')
+
+    def setUp(self):
+        # Un despachador nuevo por prueba: no hereda pendientes de otras
+        parche = mock.patch.object(notificaciones, '_despachador', None)
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def cotizar(self, *servicios):
+        with self.captureOnCommitCallbacks(execute=True):
+            for n, servicio in enumerate(servicios):
+                ServicioCotizacion.insertar_cotizacion({
+                    'servicios': servicio.pk, 'nombre': f'Cliente {n}', 'email': 'cliente@example.com', 'descripcion': 'Prueba',
+                })
+
+    def vaciar_con(self, backend):
+        with self.settings(EMAIL_BACKEND=backend):
+            return notificaciones.vaciar()
+
+    def test_un_resumen_por_servicio(self):
+        self.cotizar(self.aereo, self.maritimo, self.aereo)
+        self.assertTrue(notificaciones.vaciar())
+        self.assertEqual(
+            sorted(mensaje.subject for mensaje in mail.outbox),
+            ['1 cotización nueva de Marítimo', '2 cotizaciones nuevas de Aéreo'],
+        )
+        self.assertTrue(all(mensaje.to == ['ventas@example.com'] for mensaje in mail.outbox))
+        # Lo enviado no se repite
+        self.assertTrue(notificaciones.vaciar())
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_reintenta_tras_fallo(self):
+        self.cotizar(self.aereo)
+        with self.assertLogs('cotizacion_app.notificaciones', 'ERROR'):
+            self.assertFalse(self.vaciar_con(CORREO_CAIDO))
+        self.assertEqual(mail.outbox, [])
+        self.assertTrue(notificaciones.vaciar())
+        self.assertEqual([mensaje.subject for mensaje in mail.outbox], ['1 cotización nueva de Aéreo'])
+
+    def test_descarta_tras_los_reintentos(self):
+        self.cotizar(self.aereo)
+        with self.assertLogs('cotizacion_app.notificaciones', 'ERROR') as registros:
+            self.assertFalse(self.vaciar_con(CORREO_CAIDO))
+            self.assertTrue(self.vaciar_con(CORREO_CAIDO))
+        self.assertIn('Se descartó el resumen', registros.output[-1])
+        self.assertTrue(notificaciones.vaciar())
+        self.assertEqual(mail.outbox, [])
+
+    def test_sin_aviso_si_se_revierte(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                ServicioCotizacion.insertar_cotizacion({
+                    'servicios': self.aereo.pk, 'nombre': 'Cliente', 'email': 'cliente@example.com',
+                })
+                raise RuntimeError('Falla posterior en la misma transacción')
+        self.assertEqual(callbacks, [])
+        self.assertFalse(Cotizacion.objects.exists())
+        self.assertTrue(notificaciones.vaciar())
+        self.assertEqual(mail.outbox, [])
+
+    @override_settings(NOTIFICACIONES_COTIZACION_DESTINATARIOS=[])
+    def test_sin_destinatarios(self):
+        self.cotizar(self.aereo)
+        self.assertIsNone(notificaciones._despachador)
+        self.assertEqual(mail.outbox, [])
@@ -0,0 +1,24 @@
+from django.apps import AppConfig
+
+
+class HmpaquetesappConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'hmpaquetesapp'
+
+    def ready(self):
+        # Registrar los receptores de señales
+        from hmpaquetesapp import signals  # noqa: F401
+
+    def precalentar(self):
+        """
+        Deja en la caché de ContentType los tipos de documento de ItemDocumento y carga
+        los directorios de referencia (provincias, municipios, locaciones y tarifas).
+        """
+        from django.contrib.contenttypes.models import ContentType
+        from hmpaquetesapp.models import DespachoMensajero, EntradaRecibida, Envio, TransferenciaAlmacen
+        from hmpaquetesapp.service.referencia_service import DirectorioReferencias
+        from hmpaquetesapp.service.tarifa_impuesto_service import MotorTarifaImpuesto
+
+        ContentType.objects.get_for_models(EntradaRecibida, TransferenciaAlmacen, DespachoMensajero, Envio)
+        DirectorioReferencias.obtener()
+        MotorTarifaImpuesto.obtener()
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+# Funciones IMMUTABLE para poder indexar el nombre normalizado: unaccent y concat_ws
+# son STABLE y PostgreSQL no las acepta directamente en un índice de expresión.
+SENTENCIAS = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    """
+    CREATE OR REPLACE FUNCTION hm_nombre_busqueda(text, text, text, text)
+    RETURNS text LANGUAGE sql IMMUTABLE PARALLEL SAFE AS
+    $$ SELECT lower(public.unaccent('public.unaccent'::regdictionary, concat_ws(' ', $1, $2, $3, $4))) $$
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS hmpaquetesapp_persona_nombre_trgm
+    ON hmpaquetesapp_persona USING gin (
+        hm_nombre_busqueda(primer_nombre, segundo_nombre, primer_apellido, segundo_apellido) gin_trgm_ops
+    )
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS hmpaquetesapp_persona_carnet_prefijo
+    ON hmpaquetesapp_persona (carnet_de_identificacion varchar_pattern_ops)
+    """,
+]
+
+
+class Command(BaseCommand):
+    help = "Crea las extensiones, funciones e índices de PostgreSQL usados por la búsqueda de destinatarios."
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Los índices de búsqueda solo aplican a PostgreSQL; otros backends usan el índice en memoria.")
+
+        # CREATE INDEX CONCURRENTLY no puede ejecutarse dentro de una transacción
+        with connection.cursor() as cursor:
+            for sentencia in SENTENCIAS:
+                cursor.execute(sentencia)
+                self.stdout.write(f"OK: {' '.join(sentencia.split())[:80]}")
@@ -0,0 +1,51 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from hmpaquetesapp.models import Envio, Mensajero
+from hmpaquetesapp.service.pago_mensajero_service import ServicioPagoMensajero
+
+
+class Command(BaseCommand):
+    help = "Recalcula el pago al mensajero de los envíos con la tarifa vigente (settings.TARIFA_MENSAJERO)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help="Fecha de imposición inicial (AAAA-MM-DD)")
+        parser.add_argument('--hasta', help="Fecha de imposición final (AAAA-MM-DD)")
+        parser.add_argument('--manifiesto', type=int, help="Limitar a un manifiesto postal")
+        parser.add_argument(
+            '--por-lotes',
+            action='store_true',
+            help="Calcular en Python y escribir solo los envíos que cambian, en lotes",
+        )
+        parser.add_argument('--tamano-lote', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        envios = Envio.objects.all()
+        try:
+            if options['desde']:
+                envios = envios.filter(fecha_imposicion__gte=date.fromisoformat(options['desde']))
+            if options['hasta']:
+                envios = envios.filter(fecha_imposicion__lte=date.fromisoformat(options['hasta']))
+        except ValueError as e:
+            raise CommandError(f"Fecha inválida: {e}")
+        if options['manifiesto']:
+            envios = envios.filter(manifiesto_id=options['manifiesto'])
+
+        resultado = ServicioPagoMensajero.recalcular(
+            envios,
+            por_lotes=options['por_lotes'],
+            tamano_lote=options['tamano_lote'],
+        )
+
+        self.stdout.write(f"Envíos actualizados: {resultado['envios_actualizados']}")
+        por_mensajero = resultado['por_mensajero']
+        if not por_mensajero:
+            self.stdout.write("Sin cambios en los totales por mensajero.")
+            return
+
+        nombres = dict(
+            Mensajero.objects.filter(pk__in=[pk for pk in por_mensajero if pk]).values_list('pk', 'name')
+        )
+        for id_mensajero, diferencia in sorted(por_mensajero.items(), key=lambda fila: fila[0] or 0):
+            nombre = nombres.get(id_mensajero, 'Sin mensajero')
+            self.stdout.write(f"  {nombre}: {diferencia:+}")
@@ -10,6 +10,73 @@ from django.contrib.contenttypes.fields import GenericRelation
 # 🛑 ATENCIÓN: Todos los modelos tienen ahora managed=False y db_table
 # ----------------------------------------------------------------------
 
+class SeguimientoCambiosMixin:
+    """
+    Guarda los valores con que se cargó la instancia para que save() escriba solo
+    las columnas modificadas y no escriba nada si no hubo cambios.
+    Si el llamador indica update_fields se respetan tal cual.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        instancia._tomar_instantanea()
+        return instancia
+
+    def _tomar_instantanea(self, campos=None):
+        """Registra los valores actuales de los campos cargados (o solo de campos) como guardados."""
+        deferidos = self.get_deferred_fields()
+        instantanea = getattr(self, '_valores_cargados', {}) if campos is not None else {}
+        for field in self._meta.concrete_fields:
+            if field.attname in deferidos or (campos is not None and field.name not in campos and field.attname not in campos):
+                continue
+            valor = getattr(self, field.attname)
+            # Los FieldFile se comparan por nombre
+            instantanea[field.attname] = getattr(valor, 'name', valor) if isinstance(field, models.FileField) else valor
+        self._valores_cargados = instantanea
+
+    def valor_cargado(self, campo):
+        """Valor del campo (attname) según la última lectura o escritura en la base de datos."""
+        return getattr(self, '_valores_cargados', {}).get(campo)
+
+    def campos_modificados(self):
+        """
+        Nombres de los campos cuyo valor difiere del cargado.
+
+        Returns:
+            lista de nombres de campo, o None si la instancia no viene de la base de datos
+        """
+        instantanea = getattr(self, '_valores_cargados', None)
+        if instantanea is None or self._state.adding:
+            return None
+        deferidos = self.get_deferred_fields()
+        modificados = []
+        for field in self._meta.concrete_fields:
+            if field.primary_key:
+                continue
+            if field.attname not in instantanea:
+                # Un campo diferido solo cuenta si se le asignó un valor
+                if field.attname not in deferidos:
+                    modificados.append(field.name)
+                continue
+            if getattr(self, field.attname) != instantanea[field.attname]:
+                modificados.append(field.name)
+        return modificados
+
+    def save(self, *args, **kwargs):
+        if kwargs.get('update_fields') is None and not args and not kwargs.get('force_insert'):
+            modificados = self.campos_modificados()
+            if modificados is not None:
+                if not modificados:
+                    return
+                kwargs['update_fields'] = modificados
+        super().save(*args, **kwargs)
+        self._tomar_instantanea(kwargs.get('update_fields'))
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        self._tomar_instantanea(fields)
+
 # Modelo para la gestión de provincias
 class Provincia(models.Model):
     nombre = models.CharField(max_length=30, verbose_name="Nombre de la provincia")
@@ -70,7 +137,7 @@ class Municipio(models.Model):
 
 
 # Modelo para domicilios
-class Domicilio(models.Model):
+class Domicilio(SeguimientoCambiosMixin, models.Model):
     calle = models.CharField(max_length=255, blank=True,  null=True, verbose_name="Calle")
     entre_calle = models.CharField(max_length=255, blank=True, null=True, verbose_name="Entre calle")
     y_calle = models.CharField(max_length=255, blank=True, null=True, verbose_name="Y calle")
@@ -102,13 +169,24 @@ class Domicilio(models.Model):
     )
 
     def save(self, *args, **kwargs):
-        # Asignar la provincia automáticamente si el código de provincia está presente
-        if self.codigo_provincia:
-            self.provincia = Provincia.objects.filter(codigo_aduana=self.codigo_provincia).first()
-        
-        # Asignar el municipio automáticamente si el código de municipio está presente y la provincia también
-        if self.codigo_municipio and self.provincia:
-            self.municipio = Municipio.objects.filter(codigo_aduana=self.codigo_municipio, provincia=self.provincia).first()
+        from hmpaquetesapp.service.referencia_service import DirectorioReferencias
+
+        modificados = self.campos_modificados()
+        # Las búsquedas solo se repiten si cambiaron los códigos (o es un domicilio nuevo)
+        cambio_provincia = modificados is None or 'codigo_provincia' in modificados
+        cambio_municipio = cambio_provincia or 'codigo_municipio' in modificados
+        if cambio_municipio:
+            directorio = DirectorioReferencias.obtener()
+
+            # Asignar la provincia automáticamente si el código de provincia está presente.
+            # La relación apunta a codigo_aduana, así que el propio código es la clave
+            if cambio_provincia and self.codigo_provincia:
+                existe = directorio.resolver_provincia(self.codigo_provincia)
+                self.provincia_id = self.codigo_provincia if existe else None
+
+            # Asignar el municipio automáticamente si el código de municipio está presente y la provincia también
+            if self.codigo_municipio and self.provincia_id:
+                self.municipio_id = directorio.resolver_municipio(self.provincia_id, self.codigo_municipio)
 
         super().save(*args, **kwargs)
 
@@ -195,7 +273,7 @@ class ManifiestoPostal(models.Model):
 
 
 # Modelo de envío, que se asocia a un destinatario y un manifiesto
-class Envio(models.Model):
+class Envio(SeguimientoCambiosMixin, models.Model):
     no_envio = models.CharField(max_length=30, verbose_name="Número de envío", db_index=True)
     peso = models.FloatField(verbose_name="Peso")
     pais_origen_destino = models.CharField(max_length=3, verbose_name="País de origen/destino")
@@ -234,28 +312,25 @@ class Envio(models.Model):
     def calcular_pago_mensajero(self):
         """
         Calcula el pago al mensajero según el peso del envío.
+        Los tramos de la tarifa se configuran en settings.TARIFA_MENSAJERO.
+
+        Devuelve un Decimal con dos decimales, el mismo tipo que el campo pago_mensajero
+        (antes devolvía int o float). Quien necesite operar con float debe convertirlo.
         """
-        PRECIO_BASE = 400  # Precio base por peso
-        try:
-            peso_kg = float(self.peso)  # Convertir el peso a float si es necesario
-            peso_libras = peso_kg * 2.2  # Convertir de kg a libras
-            if peso_libras <= 50:
-                return PRECIO_BASE
-            elif 50 < peso_libras <= 100:
-                return PRECIO_BASE * 2
-            elif 100 < peso_libras <= 150:
-                return PRECIO_BASE * 2.5
-            elif 150 < peso_libras <= 200:
-                return PRECIO_BASE * 3
-            else:
-                return 0  # En caso de que el peso exceda los 200 libras, sin especificar
-        except (ValueError, TypeError):
-            # Si el peso no es válido, devuelve 0
-            return 0
+        from hmpaquetesapp.service.pago_mensajero_service import ServicioPagoMensajero
+        return ServicioPagoMensajero.calcular(self.peso)
 
     def save(self, *args, **kwargs):
-        # Calcular el pago al mensajero antes de guardar
-        self.pago_mensajero = self.calcular_pago_mensajero()
+        # Calcular el pago al mensajero antes de guardar, solo si el peso cambió
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            if 'peso' in update_fields:
+                self.pago_mensajero = self.calcular_pago_mensajero()
+                kwargs['update_fields'] = set(update_fields) | {'pago_mensajero'}
+        else:
+            modificados = self.campos_modificados()
+            if modificados is None or 'peso' in modificados:
+                self.pago_mensajero = self.calcular_pago_mensajero()
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -464,15 +539,17 @@ class ItemDocumento(models.Model):
         """     
         if not self.es_despacho_mensajero:
             raise ValueError("Solo se pueden devolver envíos de despachos a mensajeros")
-        
+
+        from hmpaquetesapp.service.item_documento_service import ServicioItemDocumento
+        # Actualiza item y envío con dos UPDATE, sin volver a guardar todas las columnas del envío
+        ServicioItemDocumento.devolver_items([self.pk])
+
         self.devuelto = True
         # Resetear confirmado
-        self.confirmado = False  
-        self.save()
-        
-        # Actualizar estado del envío
-        self.envio.estado = 'Recibido'
-        self.envio.save()
+        self.confirmado = False
+        if ItemDocumento.envio.is_cached(self):
+            self.envio.estado = 'Recibido'
+            self.envio._tomar_instantanea(['estado'])
 
 
     def __str__(self):
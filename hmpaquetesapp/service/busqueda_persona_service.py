@@ -0,0 +1,276 @@
+import threading
+import unicodedata
+from bisect import bisect_left
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import CharField, DecimalField, Q
+from django.db.models.expressions import RawSQL
+from hmpaquetesapp.models import Persona
+from hmpaquetesapp.service.cache_service import CargaVersionada, incrementar_version
+
+# Expresión indexada en PostgreSQL (ver el comando crear_indices_busqueda_persona).
+# Debe coincidir exactamente con la del índice para que el planificador lo use.
+EXPRESION_NOMBRE = (
+    'hm_nombre_busqueda("hmpaquetesapp_persona"."primer_nombre", "hmpaquetesapp_persona"."segundo_nombre", '
+    '"hmpaquetesapp_persona"."primer_apellido", "hmpaquetesapp_persona"."segundo_apellido")'
+)
+
+LIMITE_MAXIMO = 100
+
+
+def normalizar(texto):
+    """Minúsculas, sin tildes ni espacios repetidos: 'José  Pérez' -> 'jose perez'."""
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    sin_tildes = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return ' '.join(sin_tildes.lower().split())
+
+
+def _nombre_completo(primer_nombre, segundo_nombre, primer_apellido, segundo_apellido):
+    return ' '.join(p for p in (primer_nombre, segundo_nombre, primer_apellido, segundo_apellido) if p)
+
+
+def _leer_cursor(cursor):
+    """El cursor es 'rango:id' del último resultado de la página anterior."""
+    if not cursor:
+        return None
+    try:
+        rango, persona_id = cursor.split(':')
+        return float(rango), int(persona_id)
+    except ValueError:
+        raise ValueError(f"Cursor de búsqueda inválido: {cursor}")
+
+
+def _crear_cursor(resultado):
+    return f"{resultado['rango']:.4f}:{resultado['id']}"
+
+
+class IndicePersonasMemoria(CargaVersionada):
+    """
+    Índice en memoria para backends sin pg_trgm (SQLite en pruebas y desarrollo).
+    Guarda los tokens normalizados de los nombres y los carnés en listas ordenadas
+    y resuelve prefijos con búsqueda binaria.
+
+    Cada cambio de una Persona incrementa la versión y deja su id en la caché bajo
+    'busqueda_persona:cambio:<versión>'. Al ver una versión nueva, cada proceso lee solo
+    esas personas y actualiza una copia del índice; si falta alguna entrada (expiró, o
+    son más de MAXIMO_CAMBIOS) lo reconstruye entero (ver CargaVersionada).
+    """
+
+    CLAVE_VERSION = 'busqueda_persona:version'
+    CLAVE_CAMBIO = 'busqueda_persona:cambio:{}'
+    TIEMPO_CAMBIOS = 60 * 60 * 24
+    MAXIMO_CAMBIOS = 1000
+
+    _actual = None
+    _lock = threading.Lock()
+
+    def __init__(self, filas, version=0):
+        self.version = version
+        self._personas = {}
+        for persona_id, p_nombre, s_nombre, p_apellido, s_apellido, carnet in filas:
+            nombre = _nombre_completo(p_nombre, s_nombre, p_apellido, s_apellido)
+            self._personas[persona_id] = (nombre, carnet, normalizar(nombre))
+        self._tokens = sorted(self._entradas_tokens(self._personas))
+        self._carnets = sorted(self._entradas_carnets(self._personas))
+
+    @staticmethod
+    def _entradas_tokens(personas):
+        return [
+            (token, persona_id)
+            for persona_id, (_, _, normalizado) in personas.items()
+            for token in set(normalizado.split())
+        ]
+
+    @staticmethod
+    def _entradas_carnets(personas):
+        return [(carnet, persona_id) for persona_id, (_, carnet, _) in personas.items() if carnet]
+
+    @staticmethod
+    def _filas(personas):
+        return personas.values_list(
+            'pk', 'primer_nombre', 'segundo_nombre', 'primer_apellido', 'segundo_apellido',
+            'carnet_de_identificacion',
+        )
+
+    @classmethod
+    def cargar(cls, version=0):
+        return cls(cls._filas(Persona.objects.all()).iterator(chunk_size=5000), version)
+
+    @classmethod
+    def recargar(cls, actual, version):
+        if actual is None or not actual.version < version <= actual.version + cls.MAXIMO_CAMBIOS:
+            return cls.cargar(version)
+        claves = [cls.CLAVE_CAMBIO.format(v) for v in range(actual.version + 1, version + 1)]
+        cambios = cache.get_many(claves)
+        if len(cambios) < len(claves):
+            return cls.cargar(version)
+        return actual.con_cambios(set(cambios.values()), version)
+
+    def con_cambios(self, persona_ids, version):
+        """
+        Copia del índice con las personas indicadas releídas de la base de datos
+        (las que ya no existen se quitan). El índice actual no se modifica porque
+        otros hilos pueden estar buscando en él.
+        """
+        nuevas = IndicePersonasMemoria(self._filas(Persona.objects.filter(pk__in=persona_ids)))
+        indice = IndicePersonasMemoria((), version)
+        indice._personas = {
+            persona_id: datos for persona_id, datos in self._personas.items() if persona_id not in persona_ids
+        }
+        indice._personas.update(nuevas._personas)
+        indice._tokens = [entrada for entrada in self._tokens if entrada[1] not in persona_ids]
+        indice._tokens.extend(nuevas._tokens)
+        indice._tokens.sort()
+        indice._carnets = [entrada for entrada in self._carnets if entrada[1] not in persona_ids]
+        indice._carnets.extend(nuevas._carnets)
+        indice._carnets.sort()
+        return indice
+
+    @classmethod
+    def registrar_cambio(cls, persona_id):
+        """Publica el cambio de una persona para que cada proceso actualice su índice."""
+        version = incrementar_version(cls.CLAVE_VERSION)
+        cache.set(cls.CLAVE_CAMBIO.format(version), persona_id, cls.TIEMPO_CAMBIOS)
+        if cls._actual is not None and cls._actual.version == version - 1:
+            # Este proceso actualiza el suyo sin esperar al intervalo de comprobación
+            with cls._lock:
+                if cls._actual is not None and cls._actual.version == version - 1:
+                    cls._actual = cls._actual.con_cambios({persona_id}, version)
+
+    @staticmethod
+    def _rango_prefijo(lista, prefijo):
+        inicio = bisect_left(lista, (prefijo,))
+        fin = bisect_left(lista, (prefijo + '\uffff',))
+        return lista[inicio:fin]
+
+    def _resultado(self, persona_id, rango):
+        nombre, carnet, _ = self._personas[persona_id]
+        return {'id': persona_id, 'nombre_completo': nombre, 'carnet': carnet, 'rango': rango}
+
+    def buscar_nombre(self, consulta):
+        tokens = consulta.split()
+        candidatos = None
+        for token in tokens:
+            ids = {persona_id for _, persona_id in self._rango_prefijo(self._tokens, token)}
+            candidatos = ids if candidatos is None else candidatos & ids
+            if not candidatos:
+                return []
+        resultados = []
+        for persona_id in candidatos:
+            normalizado = self._personas[persona_id][2]
+            rango = round(min(len(consulta) / len(normalizado), 1.0), 4)
+            resultados.append(self._resultado(persona_id, rango))
+        return resultados
+
+    def buscar_carnet(self, consulta):
+        return [
+            self._resultado(persona_id, 1.0 if carnet == consulta else 0.5)
+            for carnet, persona_id in self._rango_prefijo(self._carnets, consulta)
+        ]
+
+
+class ServicioBusquedaPersona:
+    """
+    Búsqueda de destinatarios por nombre (por prefijo de palabra, sin tildes)
+    o por carné (exacto o por prefijo), con resultados ordenados por relevancia
+    y paginados por cursor (rango, id).
+
+    En PostgreSQL la búsqueda usa el índice trigram creado por
+    crear_indices_busqueda_persona; en otros backends se usa IndicePersonasMemoria.
+    """
+
+    @staticmethod
+    def buscar(texto, cursor=None, limite=20):
+        """
+        Returns:
+            dict con 'resultados' (lista de {'id', 'nombre_completo', 'carnet', 'rango'})
+            y 'cursor_siguiente' (None si no hay más páginas).
+        Raise:
+            ValueError: si el cursor no es válido
+        """
+        limite = max(1, min(limite, LIMITE_MAXIMO))
+        consulta = normalizar(texto)
+        if not consulta:
+            return {'resultados': [], 'cursor_siguiente': None}
+
+        posicion = _leer_cursor(cursor)
+        es_carnet = consulta.isdigit()
+
+        if connection.vendor == 'postgresql':
+            if es_carnet:
+                resultados = ServicioBusquedaPersona._carnet_postgres(consulta, posicion, limite + 1)
+            else:
+                resultados = ServicioBusquedaPersona._nombre_postgres(consulta, posicion, limite + 1)
+        else:
+            indice = ServicioBusquedaPersona.indice_memoria()
+            if es_carnet:
+                candidatos = indice.buscar_carnet(consulta)
+            else:
+                candidatos = indice.buscar_nombre(consulta)
+            candidatos.sort(key=lambda r: (-r['rango'], r['id']))
+            if posicion:
+                rango, persona_id = posicion
+                candidatos = [
+                    r for r in candidatos
+                    if r['rango'] < rango or (r['rango'] == rango and r['id'] > persona_id)
+                ]
+            resultados = candidatos[:limite + 1]
+
+        hay_mas = len(resultados) > limite
+        resultados = resultados[:limite]
+        return {
+            'resultados': resultados,
+            'cursor_siguiente': _crear_cursor(resultados[-1]) if hay_mas else None,
+        }
+
+    @staticmethod
+    def _paginar(queryset, posicion, limite):
+        if posicion:
+            rango, persona_id = posicion
+            queryset = queryset.filter(Q(rango__lt=rango) | Q(rango=rango, pk__gt=persona_id))
+        filas = queryset.order_by('-rango', 'pk').values_list(
+            'pk', 'primer_nombre', 'segundo_nombre', 'primer_apellido', 'segundo_apellido',
+            'carnet_de_identificacion', 'rango',
+        )[:limite]
+        return [
+            {
+                'id': persona_id,
+                'nombre_completo': _nombre_completo(p_nombre, s_nombre, p_apellido, s_apellido),
+                'carnet': carnet,
+                'rango': float(rango),
+            }
+            for persona_id, p_nombre, s_nombre, p_apellido, s_apellido, carnet, rango in filas
+        ]
+
+    @staticmethod
+    def _nombre_postgres(consulta, posicion, limite):
+        personas = Persona.objects.annotate(
+            nombre_busqueda=RawSQL(EXPRESION_NOMBRE, [], output_field=CharField()),
+            rango=RawSQL(
+                f'round(similarity({EXPRESION_NOMBRE}, %s)::numeric, 4)',
+                [consulta],
+                output_field=DecimalField(max_digits=5, decimal_places=4),
+            ),
+        )
+        for token in consulta.split():
+            personas = personas.filter(
+                Q(nombre_busqueda__startswith=token) | Q(nombre_busqueda__contains=f' {token}')
+            )
+        return ServicioBusquedaPersona._paginar(personas, posicion, limite)
+
+    @staticmethod
+    def _carnet_postgres(consulta, posicion, limite):
+        personas = Persona.objects.filter(carnet_de_identificacion__startswith=consulta).annotate(
+            rango=RawSQL(
+                'CASE WHEN "hmpaquetesapp_persona"."carnet_de_identificacion" = %s THEN 1.0 ELSE 0.5 END',
+                [consulta],
+                output_field=DecimalField(max_digits=5, decimal_places=4),
+            ),
+        )
+        return ServicioBusquedaPersona._paginar(personas, posicion, limite)
+
+    @staticmethod
+    def indice_memoria():
+        """Índice en memoria del proceso, al día con los cambios de Persona."""
+        return IndicePersonasMemoria.obtener()
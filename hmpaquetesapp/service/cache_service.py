@@ -0,0 +1,101 @@
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Backends cuyo contenido no ven los demás procesos
+BACKENDS_POR_PROCESO = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# Activa mientras obtener() consulta la versión o recarga los datos. Los presupuestos de
+# consultas por vista (website_app.presupuestos) no cuentan esas consultas: se hacen una
+# vez por proceso y por cambio, no en cada petición.
+en_carga = ContextVar('en_carga', default=False)
+
+
+def cache_compartida():
+    """Indica si la caché por defecto la comparten todos los procesos (no es LocMem ni Dummy)."""
+    return settings.CACHES['default']['BACKEND'] not in BACKENDS_POR_PROCESO
+
+
+def obtener_version(clave):
+    """Versión actual de un contador de invalidación guardado en la caché."""
+    return cache.get(clave, 0)
+
+
+def incrementar_version(clave):
+    """
+    Incrementa un contador de invalidación. Los datos cacheados bajo la versión
+    anterior quedan huérfanos y expiran solos.
+    """
+    cache.add(clave, 0, timeout=None)
+    try:
+        return cache.incr(clave)
+    except ValueError:
+        # La clave expiró o fue desalojada entre add e incr
+        cache.set(clave, 1, timeout=None)
+        return 1
+
+
+class CargaVersionada:
+    """
+    Datos de referencia que cada proceso guarda en memoria y recarga cuando cambia su
+    versión en la caché. Las subclases definen CLAVE_VERSION, su propio _lock y el
+    classmethod cargar(version), que devuelve una instancia con el atributo version.
+    Las que saben aplicar cambios sueltos sobrescriben recargar(actual, version).
+
+    obtener() consulta la versión como mucho cada CACHE_INTERVALO_VERSION_SEGUNDOS.
+    Con una caché por proceso (LocMem) la invalidación hecha en otro worker no llega,
+    así que además se recarga todo cuando los datos superan CACHE_EDAD_MAXIMA_SEGUNDOS.
+    """
+
+    CLAVE_VERSION = None
+
+    _actual = None
+    _lock = None
+    # Momentos (monotónicos) de la última consulta de la versión y de la última carga
+    _comprobado = 0.0
+    _cargado = 0.0
+
+    @classmethod
+    def _caducado(cls, actual, version, ahora):
+        if actual is None or actual.version != version:
+            return True
+        edad_maxima = getattr(settings, 'CACHE_EDAD_MAXIMA_SEGUNDOS', 60)
+        return not cache_compartida() and ahora - cls._cargado >= edad_maxima
+
+    @classmethod
+    def obtener(cls):
+        ahora = time.monotonic()
+        actual = cls._actual
+        intervalo = getattr(settings, 'CACHE_INTERVALO_VERSION_SEGUNDOS', 5)
+        if actual is not None and ahora - cls._comprobado < intervalo:
+            return actual
+        token = en_carga.set(True)
+        try:
+            version = obtener_version(cls.CLAVE_VERSION)
+            if cls._caducado(actual, version, ahora):
+                with cls._lock:
+                    actual = cls._actual
+                    if cls._caducado(actual, version, ahora):
+                        actual = cls.recargar(actual, version)
+                        cls._actual = actual
+                        cls._cargado = ahora
+        finally:
+            en_carga.reset(token)
+        cls._comprobado = ahora
+        return actual
+
+    @classmethod
+    def recargar(cls, actual, version):
+        """Datos para la versión indicada; actual es la copia caducada (o None)."""
+        return cls.cargar(version)
+
+    @classmethod
+    def invalidar(cls):
+        """Marca los datos como modificados para que cada proceso los recargue."""
+        incrementar_version(cls.CLAVE_VERSION)
+        cls._actual = None
@@ -0,0 +1,99 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.dispatch import Signal
+from hmpaquetesapp.models import Auditoria, DespachoMensajero, Envio, ItemDocumento
+
+# Emitida después de crear o actualizar en bloque items de despacho y el estado de sus envíos.
+# Argumentos: accion ('despachar', 'devolver' o 'confirmar'), items (lista de ids) y
+# envios (lista de (envio_id, no_envio, manifiesto_id, estado_anterior, estado_nuevo)).
+items_despacho_actualizados = Signal()
+
+
+class ServicioItemDocumento:
+    # accion: (campos del item, estado nuevo del envío)
+    ACCIONES = {
+        'devolver': ({'devuelto': True, 'confirmado': False}, 'Recibido'),
+        'confirmar': ({'confirmado': True, 'devuelto': False}, 'Entregado'),
+    }
+
+    @staticmethod
+    def _bloquear(ids):
+        """
+        Items con sus envíos, bloqueados en orden de pk. FOR UPDATE OF se limita a esas dos
+        tablas (ContentType no se bloquea); OF solo se aplica a modelos cargados con
+        select_related, no a values_list.
+        """
+        return ItemDocumento.objects.select_for_update(of=('self', 'envio')).select_related('envio').filter(
+            pk__in=ids
+        ).order_by('pk').only('pk', 'documento_type_id', 'envio__no_envio', 'envio__manifiesto_id', 'envio__estado')
+
+    @staticmethod
+    def _actualizar(accion, ids, usuario=None, ip=None):
+        """
+        Actualiza items de despachos a mensajeros y sus envíos con una consulta de validación
+        y dos UPDATE, dentro de la transacción del llamador.
+
+        Raise:
+            ValueError: si algún id no existe o no pertenece a un despacho a mensajero
+        """
+        campos_item, estado_nuevo = ServicioItemDocumento.ACCIONES[accion]
+        ids = set(ids)
+        if not ids:
+            return []
+
+        items = list(ServicioItemDocumento._bloquear(ids))
+        faltantes = ids - {item.pk for item in items}
+        if faltantes:
+            raise ValueError(f"No existen los items: {sorted(faltantes)}")
+        tipo_despacho = ContentType.objects.get_for_model(DespachoMensajero)
+        invalidos = sorted(item.pk for item in items if item.documento_type_id != tipo_despacho.pk)
+        if invalidos:
+            raise ValueError(f"Solo se pueden {accion} envíos de despachos a mensajeros (items {invalidos})")
+
+        envios = {}
+        for item in items:
+            envio = item.envio
+            envios[envio.pk] = (envio.pk, envio.no_envio, envio.manifiesto_id, envio.estado, estado_nuevo)
+
+        ItemDocumento.objects.filter(pk__in=ids).update(**campos_item)
+        Envio.objects.filter(pk__in=envios).update(estado=estado_nuevo)
+
+        if usuario is not None:
+            tipo_envio = ContentType.objects.get_for_model(Envio)
+            Auditoria.objects.bulk_create([
+                Auditoria(
+                    usuario=usuario, accion=Auditoria.Accion.CAMBIO_ESTADO_ENVIO, ip=ip,
+                    content_type=tipo_envio, object_id=envio_id,
+                )
+                for envio_id, _, _, estado, _ in envios.values() if estado != estado_nuevo
+            ])
+
+        envios = list(envios.values())
+        items_despacho_actualizados.send(
+            sender=ItemDocumento, accion=accion, items=sorted(ids), envios=envios
+        )
+        return envios
+
+    @staticmethod
+    @transaction.atomic
+    def devolver_items(ids, usuario=None, ip=None):
+        """
+        Marca los items como devueltos al almacén y sus envíos como 'Recibido'.
+        Si se indica el usuario se registra un cambio de estado en Auditoria por envío.
+
+        Returns:
+            lista de (envio_id, no_envio, manifiesto_id, estado_anterior, estado_nuevo)
+        """
+        return ServicioItemDocumento._actualizar('devolver', ids, usuario, ip)
+
+    @staticmethod
+    @transaction.atomic
+    def confirmar_items(ids, usuario=None, ip=None):
+        """
+        Marca los items como entregados y sus envíos como 'Entregado'.
+        Si se indica el usuario se registra un cambio de estado en Auditoria por envío.
+
+        Returns:
+            lista de (envio_id, no_envio, manifiesto_id, estado_anterior, estado_nuevo)
+        """
+        return ServicioItemDocumento._actualizar('confirmar', ids, usuario, ip)
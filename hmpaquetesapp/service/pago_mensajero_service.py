@@ -0,0 +1,157 @@
+import math
+from bisect import bisect_left
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.lookups import LessThanOrEqual
+from hmpaquetesapp.models import DespachoMensajero, Envio, ItemDocumento
+
+LIBRAS_POR_KG = 2.2
+
+
+class ServicioPagoMensajero:
+    @staticmethod
+    def tramos():
+        """
+        Devuelve los tramos de la tarifa como (limites_lb, importes), ordenados por límite.
+        El importe de cada tramo es PRECIO_BASE * factor, ya redondeado a centavos.
+        """
+        tarifa = settings.TARIFA_MENSAJERO
+        precio_base = Decimal(str(tarifa['PRECIO_BASE']))
+        limites = []
+        importes = []
+        for limite, factor in sorted(tarifa['TRAMOS']):
+            limites.append(float(limite))
+            importes.append((precio_base * Decimal(str(factor))).quantize(Decimal('0.01')))
+        return limites, importes
+
+    @staticmethod
+    def calcular_lote(pesos, tramos=None):
+        """
+        Calcula el pago al mensajero para una secuencia de pesos (en kg) en una sola pasada.
+        Los pesos nulos, no numéricos o no finitos (NaN) y los que superan el último tramo pagan 0.
+        """
+        limites, importes = tramos or ServicioPagoMensajero.tramos()
+        cero = Decimal('0.00')
+        pagos = []
+        for peso in pesos:
+            try:
+                peso_libras = float(peso) * LIBRAS_POR_KG
+            except (ValueError, TypeError):
+                pagos.append(cero)
+                continue
+            if not math.isfinite(peso_libras):
+                pagos.append(cero)
+                continue
+            indice = bisect_left(limites, peso_libras)
+            pagos.append(importes[indice] if indice < len(limites) else cero)
+        return pagos
+
+    @staticmethod
+    def calcular(peso):
+        """Pago al mensajero de un envío como Decimal con dos decimales."""
+        return ServicioPagoMensajero.calcular_lote([peso])[0]
+
+    @staticmethod
+    def expresion_sql():
+        """
+        Expresión CASE equivalente a calcular_lote, para actualizar el pago
+        directamente en la base de datos sin traer las filas.
+        """
+        limites, importes = ServicioPagoMensajero.tramos()
+        peso_libras = F('peso') * Value(LIBRAS_POR_KG)
+        return Case(
+            *[
+                When(LessThanOrEqual(peso_libras, Value(limite)), then=Value(importe))
+                for limite, importe in zip(limites, importes)
+            ],
+            default=Value(Decimal('0.00')),
+            output_field=DecimalField(max_digits=10, decimal_places=2),
+        )
+
+    @staticmethod
+    def totales_por_mensajero(queryset):
+        """
+        Suma de pago_mensajero de los envíos del queryset agrupada por el mensajero
+        de su despacho vigente (no devuelto). Los envíos sin despacho se agrupan en None.
+        """
+        tipo_despacho = ContentType.objects.get_for_model(DespachoMensajero)
+        mensajero_despacho = DespachoMensajero.objects.filter(
+            pk=OuterRef('documento_id')
+        ).values('mensajero_id')[:1]
+        mensajero_item = ItemDocumento.objects.filter(
+            envio=OuterRef('pk'),
+            documento_type=tipo_despacho,
+            devuelto=False,
+        ).order_by('-pk').annotate(
+            id_mensajero=Subquery(mensajero_despacho)
+        ).values('id_mensajero')[:1]
+
+        filas = queryset.order_by().annotate(
+            id_mensajero=Subquery(mensajero_item)
+        ).values('id_mensajero').annotate(total=Sum('pago_mensajero'))
+        return {fila['id_mensajero']: fila['total'] or Decimal('0.00') for fila in filas}
+
+    @staticmethod
+    @transaction.atomic
+    def recalcular(queryset, por_lotes=False, tamano_lote=2000):
+        """
+        Recalcula pago_mensajero para todos los envíos del queryset.
+        Los totales previos, la actualización y los totales posteriores van en una misma
+        transacción, para que el informe corresponda a lo que se escribió.
+
+        Por defecto se emite un único UPDATE con la expresión CASE de la tarifa.
+        Con por_lotes=True se recorren los envíos en lotes ordenados por pk,
+        se calcula el pago en Python y solo se escriben los que cambian (bulk_update).
+
+        Returns:
+            dict con 'envios_actualizados' y 'por_mensajero' ({mensajero_id: diferencia}).
+        """
+        antes = ServicioPagoMensajero.totales_por_mensajero(queryset)
+
+        if por_lotes:
+            actualizados = ServicioPagoMensajero._recalcular_por_lotes(queryset, tamano_lote)
+        else:
+            actualizados = queryset.order_by().update(
+                pago_mensajero=ServicioPagoMensajero.expresion_sql()
+            )
+
+        despues = ServicioPagoMensajero.totales_por_mensajero(queryset)
+        por_mensajero = {}
+        for id_mensajero in antes.keys() | despues.keys():
+            diferencia = despues.get(id_mensajero, Decimal('0.00')) - antes.get(id_mensajero, Decimal('0.00'))
+            if diferencia:
+                por_mensajero[id_mensajero] = diferencia
+
+        return {
+            'envios_actualizados': actualizados,
+            'por_mensajero': por_mensajero,
+        }
+
+    @staticmethod
+    def _recalcular_por_lotes(queryset, tamano_lote):
+        tramos = ServicioPagoMensajero.tramos()
+        queryset = queryset.order_by('pk')
+        ultimo_pk = 0
+        actualizados = 0
+        while True:
+            lote = list(
+                queryset.filter(pk__gt=ultimo_pk).values_list('pk', 'peso', 'pago_mensajero')[:tamano_lote]
+            )
+            if not lote:
+                break
+            ultimo_pk = lote[-1][0]
+
+            pagos = ServicioPagoMensajero.calcular_lote([peso for _, peso, _ in lote], tramos)
+            cambios = [
+                Envio(pk=pk, pago_mensajero=pago)
+                for (pk, _, actual), pago in zip(lote, pagos)
+                if actual != pago
+            ]
+            if cambios:
+                Envio.objects.bulk_update(cambios, ['pago_mensajero'])
+                actualizados += len(cambios)
+        return actualizados
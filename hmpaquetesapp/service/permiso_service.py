@@ -0,0 +1,139 @@
+import threading
+
+from django.core.cache import cache
+from hmpaquetesapp.models import Permiso
+from hmpaquetesapp.service.cache_service import CargaVersionada, incrementar_version
+
+
+class MapasPermisos(CargaVersionada):
+    """
+    Mapas {propiedad: frozenset(valores)} de los usuarios en memoria de cada proceso.
+    Cada mapa se calcula con una sola consulta la primera vez que se pide; después
+    resolver un permiso es una búsqueda en diccionarios.
+
+    Un cambio en Permiso o PermisoValor incrementa la versión y deja el id del usuario
+    en la caché bajo 'permisos:cambio:<versión>': al ver la versión nueva, cada proceso
+    descarta solo esos mapas. Un cambio en Propiedad los descarta todos (invalidar()).
+    Si falta alguna entrada (expiró, o son más de MAXIMO_CAMBIOS) se descartan todos.
+    """
+
+    CLAVE_VERSION = 'permisos:version'
+    CLAVE_CAMBIO = 'permisos:cambio:{}'
+    TIEMPO_CAMBIOS = 60 * 60 * 24
+    MAXIMO_CAMBIOS = 1000
+
+    _actual = None
+    _lock = threading.Lock()
+
+    def __init__(self, version=0, mapas=None):
+        self.version = version
+        self._mapas = mapas or {}
+
+    @classmethod
+    def cargar(cls, version=0):
+        # Los mapas se calculan por usuario al pedirlos
+        return cls(version)
+
+    @classmethod
+    def recargar(cls, actual, version):
+        if actual is None or not actual.version < version <= actual.version + cls.MAXIMO_CAMBIOS:
+            return cls.cargar(version)
+        claves = [cls.CLAVE_CAMBIO.format(v) for v in range(actual.version + 1, version + 1)]
+        cambios = cache.get_many(claves)
+        if len(cambios) < len(claves):
+            return cls.cargar(version)
+        return actual.sin_usuarios(set(cambios.values()), version)
+
+    def sin_usuarios(self, user_ids, version):
+        """Copia sin los mapas de los usuarios indicados; la actual la pueden estar leyendo otros hilos."""
+        return MapasPermisos(
+            version, {user_id: mapa for user_id, mapa in self._mapas.items() if user_id not in user_ids},
+        )
+
+    @staticmethod
+    def calcular(user_id):
+        """Construye el mapa de permisos del usuario directamente desde la base de datos."""
+        mapa = {}
+        filas = Permiso.objects.filter(idUser_id=user_id).values_list(
+            'idPropiedad__descripcion', 'valores__valor'
+        )
+        for propiedad, valor in filas:
+            valores = mapa.setdefault(propiedad, set())
+            if valor is not None:
+                valores.add(valor)
+        return {propiedad: frozenset(valores) for propiedad, valores in mapa.items()}
+
+    def mapa(self, user_id):
+        mapa = self._mapas.get(user_id)
+        if mapa is None:
+            # Dos hilos pueden calcular el mismo mapa a la vez: ambos obtienen el mismo resultado
+            mapa = self._mapas[user_id] = self.calcular(user_id)
+        return mapa
+
+    @classmethod
+    def registrar_cambio(cls, user_id):
+        """Publica el cambio de permisos de un usuario para que cada proceso descarte su mapa."""
+        version = incrementar_version(cls.CLAVE_VERSION)
+        cache.set(cls.CLAVE_CAMBIO.format(version), user_id, cls.TIEMPO_CAMBIOS)
+        if cls._actual is not None and cls._actual.version == version - 1:
+            # Este proceso descarta el suyo sin esperar al intervalo de comprobación
+            with cls._lock:
+                if cls._actual is not None and cls._actual.version == version - 1:
+                    cls._actual = cls._actual.sin_usuarios({user_id}, version)
+
+
+class ServicioPermisos:
+    """
+    Resolución de permisos Permiso/PermisoValor/Propiedad por usuario (ver MapasPermisos).
+
+    Con una caché compartida (Redis, Memcached) una revocación llega a los demás procesos
+    en CACHE_INTERVALO_VERSION_SEGUNDOS como mucho; con la caché por proceso por defecto
+    (LocMem) llega al recargar los mapas, cada CACHE_EDAD_MAXIMA_SEGUNDOS.
+    """
+
+    @staticmethod
+    def calcular_mapa(user_id):
+        return MapasPermisos.calcular(user_id)
+
+    @staticmethod
+    def mapa(user):
+        """
+        Mapa {propiedad: frozenset(valores)} del usuario.
+        Se memoriza también en la instancia del usuario para el resto de la petición.
+        """
+        user_id = getattr(user, 'pk', user)
+        if user_id is None:
+            return {}
+
+        memo = getattr(user, '_mapa_permisos', None)
+        if memo is not None:
+            return memo
+
+        mapa = MapasPermisos.obtener().mapa(user_id)
+        if hasattr(user, 'pk'):
+            user._mapa_permisos = mapa
+        return mapa
+
+    @staticmethod
+    def has(user, propiedad, valor=None):
+        """
+        Indica si el usuario tiene la propiedad y, si se indica, el valor dado.
+        Propiedad y valor se comparan en minúsculas, como se guardan.
+        """
+        valores = ServicioPermisos.mapa(user).get(propiedad.lower())
+        if valores is None:
+            return False
+        return valor is None or valor.lower() in valores
+
+    @staticmethod
+    def valores(user, propiedad):
+        """Valores permitidos al usuario para una propiedad (vacío si no la tiene)."""
+        return ServicioPermisos.mapa(user).get(propiedad.lower(), frozenset())
+
+    @staticmethod
+    def invalidar_usuario(user_id):
+        MapasPermisos.registrar_cambio(user_id)
+
+    @staticmethod
+    def invalidar_todos():
+        MapasPermisos.invalidar()
@@ -0,0 +1,71 @@
+import threading
+
+from hmpaquetesapp.models import Municipio, Provincia
+from hmpaquetesapp.service.cache_service import CargaVersionada
+
+
+class DirectorioReferencias(CargaVersionada):
+    """
+    Provincias y municipios en memoria, indexados por su código de aduana.
+    Domicilio.save los resuelve sin consultas; el directorio se recarga cuando cambian
+    (ver CargaVersionada), así que puede tener hasta CACHE_EDAD_MAXIMA_SEGUNDOS de
+    antigüedad con la caché por proceso. Por eso resolver_provincia y resolver_municipio
+    confirman en la base de datos los códigos que no encuentran.
+
+    Uso:
+        directorio = DirectorioReferencias.obtener()
+        directorio.existe_provincia('PR')
+        directorio.municipio_id('PR', 'MU')
+    """
+
+    CLAVE_VERSION = 'referencias:version'
+
+    _actual = None
+    _lock = threading.Lock()
+
+    def __init__(self, provincias, municipios, version=0):
+        """
+        Args:
+            provincias: iterable de (provincia_id, codigo_aduana)
+            municipios: iterable de (municipio_id, provincia_id, codigo_aduana) ordenado por id
+            version: versión de las referencias con la que se construyó el directorio
+        """
+        self.version = version
+        self._provincias = {codigo: provincia_id for provincia_id, codigo in provincias}
+        self._municipios = {}
+        for municipio_id, provincia_id, codigo in municipios:
+            # Con códigos repetidos gana el de menor id, como haría .first()
+            self._municipios.setdefault((provincia_id, codigo), municipio_id)
+
+    @classmethod
+    def cargar(cls, version=0):
+        return cls(
+            Provincia.objects.values_list('pk', 'codigo_aduana'),
+            Municipio.objects.order_by('pk').values_list('pk', 'provincia_id', 'codigo_aduana'),
+            version,
+        )
+
+    def existe_provincia(self, codigo_provincia):
+        return codigo_provincia in self._provincias
+
+    def municipio_id(self, codigo_provincia, codigo_municipio):
+        """Id del municipio con ese código dentro de la provincia, o None."""
+        provincia_id = self._provincias.get(codigo_provincia)
+        if provincia_id is None:
+            return None
+        return self._municipios.get((provincia_id, codigo_municipio))
+
+    def resolver_provincia(self, codigo_provincia):
+        """Como existe_provincia, consultando la base de datos si el código no está en memoria."""
+        return self.existe_provincia(codigo_provincia) or Provincia.objects.filter(
+            codigo_aduana=codigo_provincia
+        ).exists()
+
+    def resolver_municipio(self, codigo_provincia, codigo_municipio):
+        """Como municipio_id, consultando la base de datos si el municipio no está en memoria."""
+        municipio_id = self.municipio_id(codigo_provincia, codigo_municipio)
+        if municipio_id is None:
+            municipio_id = Municipio.objects.filter(
+                provincia__codigo_aduana=codigo_provincia, codigo_aduana=codigo_municipio,
+            ).order_by('pk').values_list('pk', flat=True).first()
+        return municipio_id
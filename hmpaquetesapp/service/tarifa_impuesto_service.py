@@ -0,0 +1,147 @@
+import logging
+import math
+import threading
+from bisect import bisect_right
+from decimal import Decimal
+
+from hmpaquetesapp.models import Envio, Locacion, TarifaImpuesto
+from hmpaquetesapp.service.cache_service import CargaVersionada
+from hmpaquetesapp.service.pago_mensajero_service import LIBRAS_POR_KG
+
+logger = logging.getLogger(__name__)
+
+# Menor diferencia representable en las bandas (DecimalField con 2 decimales)
+PASO_LB = 0.01
+
+
+class MotorTarifaImpuesto(CargaVersionada):
+    """
+    Bandas de TarifaImpuesto cargadas en memoria como arreglos ordenados por locación.
+    Las consultas de precio se resuelven con búsqueda binaria, sin ir a la base de datos.
+    Se recarga cuando cambian las tarifas o las locaciones (ver CargaVersionada).
+
+    Uso:
+        motor = MotorTarifaImpuesto.obtener()
+        motor.precio_for(locacion, 12.5)
+        motor.precios_manifiesto(manifiesto_id)
+    """
+
+    CLAVE_VERSION = 'tarifas_impuesto:version'
+
+    _actual = None
+    _lock = threading.Lock()
+
+    def __init__(self, filas, locaciones=(), version=0):
+        """
+        Args:
+            filas: iterable de (locacion_id, peso_minimo_lb, peso_maximo_lb, precio)
+                   ordenado por locacion_id y peso_minimo_lb
+            locaciones: iterable de (nombre, locacion_id) para resolver Envio.locacion
+            version: versión de las tarifas con la que se construyó el motor
+        """
+        self.version = version
+        self.anomalias = []
+        self._bandas = {}
+        # Banda con el mayor peso máximo visto hasta ahora en cada locación: una banda ancha
+        # puede contener a varias de las siguientes, no solo solaparse con la anterior
+        techos = {}
+        self._por_nombre = {}
+        for nombre, locacion_id in locaciones:
+            self._por_nombre.setdefault(nombre, locacion_id)
+
+        for locacion_id, minimo, maximo, precio in filas:
+            minimos, maximos, precios = self._bandas.setdefault(locacion_id, ([], [], []))
+            minimo, maximo = float(minimo), float(maximo)
+            if maximo < minimo:
+                self.anomalias.append(
+                    f"Locación {locacion_id}: banda invertida {minimo}lb - {maximo}lb"
+                )
+                continue
+            techo = techos.get(locacion_id)
+            if techo is not None:
+                techo_minimo, techo_maximo = techo
+                if minimo < techo_maximo:
+                    self.anomalias.append(
+                        f"Locación {locacion_id}: la banda {minimo}lb - {maximo}lb se solapa "
+                        f"con {techo_minimo}lb - {techo_maximo}lb"
+                    )
+                elif minimo - techo_maximo > PASO_LB + 1e-9:
+                    self.anomalias.append(
+                        f"Locación {locacion_id}: hueco entre {techo_maximo}lb y {minimo}lb"
+                    )
+            if techo is None or maximo > techo[1]:
+                techos[locacion_id] = (minimo, maximo)
+            minimos.append(minimo)
+            maximos.append(maximo)
+            precios.append(precio)
+
+        for anomalia in self.anomalias:
+            logger.warning('Tarifa de impuesto: %s', anomalia)
+
+    @classmethod
+    def cargar(cls, version=0):
+        """Construye el motor con dos consultas: bandas y nombres de locaciones."""
+        filas = TarifaImpuesto.objects.order_by(
+            'locacion_id', 'peso_minimo_lb', 'peso_maximo_lb'
+        ).values_list('locacion_id', 'peso_minimo_lb', 'peso_maximo_lb', 'precio')
+        locaciones = Locacion.objects.order_by('pk').values_list('nombre', 'pk')
+        return cls(filas, locaciones, version)
+
+    def locacion_id(self, locacion):
+        """Acepta una Locacion, su id o su nombre (como en Envio.locacion)."""
+        if isinstance(locacion, Locacion):
+            return locacion.pk
+        if isinstance(locacion, str):
+            return self._por_nombre.get(locacion)
+        return locacion
+
+    def precio_for(self, locacion, peso_lb):
+        """
+        Precio de la banda de la locación que contiene peso_lb.
+        El peso se redondea a centésimas, la misma precisión de las bandas.
+
+        Returns:
+            Decimal con el precio, o None si la locación no tiene una banda para ese peso
+            o el peso no es finito (NaN o infinito).
+        """
+        bandas = self._bandas.get(self.locacion_id(locacion))
+        if bandas is None or peso_lb is None:
+            return None
+        peso_lb = float(peso_lb)
+        if not math.isfinite(peso_lb):
+            return None
+        minimos, maximos, precios = bandas
+        peso_lb = round(peso_lb, 2)
+        indice = bisect_right(minimos, peso_lb) - 1
+        if indice < 0 or peso_lb > maximos[indice]:
+            return None
+        return precios[indice]
+
+    def precios_envios(self, envios):
+        """
+        Precios para una secuencia de envíos en una sola pasada.
+
+        Args:
+            envios: iterable de (envio_id, peso_kg, locacion) o de instancias de Envio
+
+        Returns:
+            dict {envio_id: Decimal o None}
+        """
+        resultado = {}
+        for envio in envios:
+            if isinstance(envio, Envio):
+                envio = (envio.pk, envio.peso, envio.locacion)
+            envio_id, peso, locacion = envio
+            peso_lb = float(peso) * LIBRAS_POR_KG if peso is not None else None
+            resultado[envio_id] = self.precio_for(locacion, peso_lb)
+        return resultado
+
+    def precios_manifiesto(self, manifiesto_id):
+        """Precios de todos los envíos de un manifiesto con una única consulta."""
+        envios = Envio.objects.filter(manifiesto_id=manifiesto_id).values_list('pk', 'peso', 'locacion')
+        return self.precios_envios(envios.iterator(chunk_size=2000))
+
+    @staticmethod
+    def total(precios):
+        """Suma los precios resueltos de un resultado de precios_envios."""
+        return sum((precio for precio in precios.values() if precio is not None), Decimal('0.00'))
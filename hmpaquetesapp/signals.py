@@ -0,0 +1,53 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from hmpaquetesapp.models import (
+    Locacion, Municipio, Permiso, PermisoValor, Persona, Propiedad, Provincia, TarifaImpuesto,
+)
+from hmpaquetesapp.service.busqueda_persona_service import IndicePersonasMemoria
+from hmpaquetesapp.service.permiso_service import ServicioPermisos
+from hmpaquetesapp.service.referencia_service import DirectorioReferencias
+from hmpaquetesapp.service.tarifa_impuesto_service import MotorTarifaImpuesto
+
+
+@receiver([post_save, post_delete], sender=TarifaImpuesto)
+@receiver([post_save, post_delete], sender=Locacion)
+def invalidar_tarifas_impuesto(sender, **kwargs):
+    """Las bandas y los nombres de locación forman parte del motor de tarifas."""
+    MotorTarifaImpuesto.invalidar()
+
+
+@receiver([post_save, post_delete], sender=Provincia)
+@receiver([post_save, post_delete], sender=Municipio)
+def invalidar_referencias(sender, **kwargs):
+    DirectorioReferencias.invalidar()
+
+
+# Tras confirmar, como en la búsqueda de personas: un proceso que recalculara el mapa antes
+# guardaría los permisos viejos con la versión nueva
+
+@receiver([post_save, post_delete], sender=Permiso)
+def invalidar_permisos_usuario(sender, instance, **kwargs):
+    transaction.on_commit(partial(ServicioPermisos.invalidar_usuario, instance.idUser_id))
+
+
+@receiver([post_save, post_delete], sender=PermisoValor)
+def invalidar_permisos_valor(sender, instance, **kwargs):
+    user_id = Permiso.objects.filter(pk=instance.permiso_id).values_list('idUser_id', flat=True).first()
+    if user_id is None:
+        transaction.on_commit(ServicioPermisos.invalidar_todos)
+    else:
+        transaction.on_commit(partial(ServicioPermisos.invalidar_usuario, user_id))
+
+
+@receiver([post_save, post_delete], sender=Propiedad)
+def invalidar_permisos_propiedad(sender, **kwargs):
+    transaction.on_commit(ServicioPermisos.invalidar_todos)
+
+
+@receiver([post_save, post_delete], sender=Persona)
+def actualizar_busqueda_persona(sender, instance, **kwargs):
+    # Tras confirmar: un proceso que releyera antes vería la fila vieja con la versión nueva
+    transaction.on_commit(partial(IndicePersonasMemoria.registrar_cambio, instance.pk))
@@ -0,0 +1,459 @@
+import math
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import Group, User
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from hmpaquetesapp.models import (
+    Auditoria, Contacto, DespachoMensajero, Destinatario, Domicilio, EntradaRecibida, Envio, ItemDocumento, Locacion,
+    ManifiestoPostal, Mensajero, Municipio, Permiso, PermisoValor, Persona, Propiedad, Provincia, TarifaImpuesto,
+)
+from hmpaquetesapp.service.item_documento_service import ServicioItemDocumento, items_despacho_actualizados
+from hmpaquetesapp.service.busqueda_persona_service import IndicePersonasMemoria, ServicioBusquedaPersona
+from hmpaquetesapp.service.pago_mensajero_service import LIBRAS_POR_KG, ServicioPagoMensajero
+from hmpaquetesapp.service.permiso_service import MapasPermisos, ServicioPermisos
+from hmpaquetesapp.service.referencia_service import DirectorioReferencias
+from hmpaquetesapp.service.tarifa_impuesto_service import MotorTarifaImpuesto
+
+
+def crear_envios(pesos, **campos):
+    """Un manifiesto y un destinatario con un envío por peso (kg)."""
+    domicilio = Domicilio.objects.create(codigo_provincia='', codigo_municipio='')
+    contacto = Contacto.objects.create(telefono='5000000', domicilio=domicilio)
+    persona = Persona.objects.create(
+        primer_nombre='Ana', primer_apellido='Pérez', nacionalidad='CUB',
+        carnet_de_identificacion=f'P{Persona.objects.count()}',
+    )
+    destinatario = Destinatario.objects.create(persona=persona, contacto=contacto)
+    manifiesto = ManifiestoPostal.objects.create(
+        operador='Operador', codigo_aduana='ADU', agencia_origen='Agencia', no_ga='GA1', no_vuelo='V1',
+        cantidad_bultos=len(pesos),
+    )
+    return [
+        Envio.objects.create(
+            no_envio=f'HM{manifiesto.pk:04d}{n:04d}CU', peso=peso, pais_origen_destino='USA', descripcion='',
+            destinatario=destinatario, manifiesto=manifiesto, **campos,
+        )
+        for n, peso in enumerate(pesos)
+    ]
+
+
+def crear_items(documento, envios):
+    tipo = ContentType.objects.get_for_model(documento)
+    return [
+        ItemDocumento.objects.create(documento_type=tipo, documento_id=documento.pk, envio=envio)
+        for envio in envios
+    ]
+
+
+@override_settings(TARIFA_MENSAJERO={'PRECIO_BASE': 400, 'TRAMOS': [(50, 1), (100, 2), (150, 2.5), (200, 3)]})
+class PruebasPagoMensajero(TestCase):
+
+    # Pesos en kg a ambos lados de cada límite en libras, además del límite exacto
+    PESOS = [0, 1, 22.72, 50 / LIBRAS_POR_KG, 22.73, 45.45, 45.46, 68.18, 68.19, 90.9, 90.91, 200]
+
+    def test_tramos(self):
+        esperados = {1: '400.00', 22.72: '400.00', 22.73: '800.00', 45.46: '1000.00', 68.19: '1200.00', 90.91: '0.00'}
+        for peso, pago in esperados.items():
+            with self.subTest(peso=peso):
+                self.assertEqual(ServicioPagoMensajero.calcular(peso), Decimal(pago))
+
+    def test_pesos_invalidos_pagan_cero(self):
+        pagos = ServicioPagoMensajero.calcular_lote([None, 'abc', math.nan, math.inf, Decimal('NaN')])
+        self.assertEqual(pagos, [Decimal('0.00')] * 5)
+
+    def test_envio_guarda_decimal(self):
+        envio = crear_envios([30])[0]
+        pago = envio.calcular_pago_mensajero()
+        self.assertIsInstance(pago, Decimal)
+        self.assertEqual(pago, Decimal('800.00'))
+        envio.refresh_from_db()
+        self.assertEqual(envio.pago_mensajero, pago)
+
+    @override_settings(TARIFA_MENSAJERO={'PRECIO_BASE': 100, 'TRAMOS': [(20, 2), (10, 1)]})
+    def test_tarifa_de_settings(self):
+        # Los tramos se ordenan por límite aunque vengan desordenados
+        self.assertEqual(ServicioPagoMensajero.calcular_lote([4, 5, 10]), [Decimal('100.00'), Decimal('200.00'), Decimal('0.00')])
+
+    def test_paridad_case_python(self):
+        envios = crear_envios(self.PESOS)
+        queryset = Envio.objects.filter(pk__in=[envio.pk for envio in envios])
+        esperados = ServicioPagoMensajero.calcular_lote(self.PESOS)
+        for por_lotes in (False, True):
+            with self.subTest(por_lotes=por_lotes):
+                queryset.update(pago_mensajero=Decimal('1.00'))
+                ServicioPagoMensajero.recalcular(queryset, por_lotes=por_lotes, tamano_lote=5)
+                self.assertEqual(list(queryset.order_by('pk').values_list('pago_mensajero', flat=True)), esperados)
+
+    def test_informe_por_mensajero(self):
+        envios = crear_envios([1, 30])
+        queryset = Envio.objects.filter(pk__in=[envio.pk for envio in envios])
+        with override_settings(TARIFA_MENSAJERO={'PRECIO_BASE': 500, 'TRAMOS': [(50, 1), (100, 2)]}):
+            resultado = ServicioPagoMensajero.recalcular(queryset)
+        # Sin despacho los envíos se agrupan en None: (500 - 400) + (1000 - 800)
+        self.assertEqual(resultado, {'envios_actualizados': 2, 'por_mensajero': {None: Decimal('300.00')}})
+
+
+
+class PruebasGuardadoCambios(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.envio = crear_envios([1])[0]
+
+    def updates(self, instancia, **kwargs):
+        """Sentencias UPDATE sobre la tabla del envío durante instancia.save()."""
+        with CaptureQueriesContext(connection) as consultas:
+            instancia.save(**kwargs)
+        tabla = f'UPDATE "{Envio._meta.db_table}"'
+        return [consulta['sql'] for consulta in consultas.captured_queries if consulta['sql'].startswith(tabla)]
+
+    def test_sin_cambios_no_escribe(self):
+        envio = Envio.objects.get(pk=self.envio.pk)
+        self.assertEqual(self.updates(envio), [])
+
+    def test_solo_columnas_modificadas(self):
+        envio = Envio.objects.get(pk=self.envio.pk)
+        envio.observacion = 'Frágil'
+        sentencias = self.updates(envio)
+        self.assertEqual(len(sentencias), 1)
+        self.assertIn('"observacion"', sentencias[0])
+        self.assertNotIn('"peso"', sentencias[0])
+        # Lo guardado pasa a ser el nuevo valor cargado
+        self.assertEqual(envio.campos_modificados(), [])
+        self.assertEqual(self.updates(envio), [])
+        self.assertEqual(Envio.objects.get(pk=self.envio.pk).observacion, 'Frágil')
+
+    def test_campos_diferidos(self):
+        envio = Envio.objects.only('pk', 'estado').get(pk=self.envio.pk)
+        self.assertEqual(envio.campos_modificados(), [])
+        envio.estado = 'Recibido'
+        envio.observacion = 'asignado sin cargar'
+        self.assertEqual(sorted(envio.campos_modificados()), ['estado', 'observacion'])
+        self.assertEqual(len(self.updates(envio)), 1)
+
+    def test_update_fields_explicito(self):
+        envio = Envio.objects.get(pk=self.envio.pk)
+        envio.observacion = 'no se guarda'
+        envio.estado = 'Recibido'
+        sentencias = self.updates(envio, update_fields=['estado'])
+        self.assertNotIn('"observacion"', sentencias[0])
+        self.assertEqual(envio.campos_modificados(), ['observacion'])
+
+    def test_refresh_from_db(self):
+        envio = Envio.objects.get(pk=self.envio.pk)
+        Envio.objects.filter(pk=envio.pk).update(observacion='otro proceso')
+        envio.refresh_from_db(fields=['observacion'])
+        self.assertEqual(envio.valor_cargado('observacion'), 'otro proceso')
+        self.assertEqual(self.updates(envio), [])
+
+class PruebasDirectorioReferencias(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        provincia = Provincia.objects.create(nombre='Provincia', descripcion='', codigo_aduana='PR')
+        cls.municipio = Municipio.objects.create(nombre='Municipio', codigo_aduana='MU', provincia=provincia)
+
+    def setUp(self):
+        DirectorioReferencias.invalidar()
+
+    def test_resuelve_sin_consultas(self):
+        DirectorioReferencias.obtener()
+        with self.assertNumQueries(1):
+            domicilio = Domicilio.objects.create(codigo_provincia='PR', codigo_municipio='MU')
+        self.assertEqual((domicilio.provincia_id, domicilio.municipio_id), ('PR', self.municipio.pk))
+
+    def test_directorio_desactualizado_consulta(self):
+        DirectorioReferencias.obtener()
+        # Creadas en otro proceso: este todavía no vio la versión nueva
+        with mock.patch.object(DirectorioReferencias, 'invalidar'):
+            provincia = Provincia.objects.create(nombre='Nueva', descripcion='', codigo_aduana='NU')
+            municipio = Municipio.objects.create(nombre='Nuevo', codigo_aduana='NM', provincia=provincia)
+        self.assertFalse(DirectorioReferencias.obtener().existe_provincia('NU'))
+        domicilio = Domicilio.objects.create(codigo_provincia='NU', codigo_municipio='NM')
+        self.assertEqual((domicilio.provincia_id, domicilio.municipio_id), ('NU', municipio.pk))
+        domicilio = Domicilio.objects.create(codigo_provincia='XX', codigo_municipio='NM')
+        self.assertEqual((domicilio.provincia_id, domicilio.municipio_id), (None, None))
+
+
+class PruebasMotorTarifaImpuesto(SimpleTestCase):
+
+    def motor(self, *bandas):
+        filas = sorted((1, minimo, maximo, Decimal(precio)) for minimo, maximo, precio in bandas)
+        return MotorTarifaImpuesto(filas, [('Almacén', 1)])
+
+    def test_busqueda_por_intervalo(self):
+        motor = self.motor((0, 10, '5'), (10.01, 20, '8'), (20.01, 50, '12'))
+        casos = {0: '5', 10: '5', 10.004: '5', 10.01: '8', 19.999: '8', 20.01: '12', 50: '12'}
+        for peso, precio in casos.items():
+            with self.subTest(peso=peso):
+                self.assertEqual(motor.precio_for(1, peso), Decimal(precio))
+        self.assertIsNone(motor.precio_for(1, 50.01))
+        self.assertIsNone(motor.precio_for(2, 5))
+        self.assertEqual(motor.precio_for('Almacén', 5), Decimal('5'))
+        self.assertEqual(motor.anomalias, [])
+
+    def test_pesos_no_finitos(self):
+        motor = self.motor((0, 10, '5'), (10.01, 50, '12'))
+        for peso in (math.nan, math.inf, -math.inf, Decimal('NaN')):
+            with self.subTest(peso=peso):
+                self.assertIsNone(motor.precio_for(1, peso))
+        self.assertEqual(motor.precios_envios([(1, math.nan, 1), (2, 1, 1)]), {1: None, 2: Decimal('5')})
+
+    def test_hueco(self):
+        with self.assertLogs('hmpaquetesapp.service.tarifa_impuesto_service', 'WARNING'):
+            motor = self.motor((0, 10, '5'), (12, 20, '8'))
+        self.assertIsNone(motor.precio_for(1, 11))
+        self.assertEqual(len(motor.anomalias), 1)
+        self.assertIn('hueco', motor.anomalias[0])
+
+    def test_solapamiento_con_banda_ancha(self):
+        # 0-100 contiene a las dos siguientes, que no se solapan entre sí
+        with self.assertLogs('hmpaquetesapp.service.tarifa_impuesto_service', 'WARNING'):
+            motor = self.motor((0, 100, '5'), (10, 20, '8'), (30, 40, '9'))
+        self.assertEqual(len(motor.anomalias), 2)
+        self.assertTrue(all('0.0lb - 100.0lb' in anomalia for anomalia in motor.anomalias))
+
+    def test_banda_invertida(self):
+        with self.assertLogs('hmpaquetesapp.service.tarifa_impuesto_service', 'WARNING'):
+            motor = self.motor((20, 10, '5'))
+        self.assertIn('invertida', motor.anomalias[0])
+        self.assertIsNone(motor.precio_for(1, 15))
+
+
+@override_settings(CACHE_INTERVALO_VERSION_SEGUNDOS=0)
+class PruebasRecargaTarifas(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        provincia = Provincia.objects.create(nombre='Prueba', descripcion='', codigo_aduana='99')
+        cls.locacion = Locacion.objects.create(nombre='Almacén prueba', provincia=provincia)
+        cls.tarifa = TarifaImpuesto.objects.create(
+            locacion=cls.locacion, peso_minimo_lb=0, peso_maximo_lb=10, precio=Decimal('5.00'),
+        )
+
+    def setUp(self):
+        MotorTarifaImpuesto.invalidar()
+
+    def test_invalidacion_por_senal(self):
+        self.assertEqual(MotorTarifaImpuesto.obtener().precio_for(self.locacion, 5), Decimal('5.00'))
+        self.tarifa.precio = Decimal('7.00')
+        self.tarifa.save()
+        self.assertEqual(MotorTarifaImpuesto.obtener().precio_for(self.locacion, 5), Decimal('7.00'))
+
+    @override_settings(CACHE_EDAD_MAXIMA_SEGUNDOS=0)
+    def test_recarga_por_edad_con_cache_por_proceso(self):
+        self.assertEqual(MotorTarifaImpuesto.obtener().precio_for(self.locacion, 5), Decimal('5.00'))
+        # Un cambio hecho en otro proceso no pasa por las señales de este
+        TarifaImpuesto.objects.filter(pk=self.tarifa.pk).update(precio=Decimal('9.00'))
+        with self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertEqual(MotorTarifaImpuesto.obtener().precio_for(self.locacion, 5), Decimal('9.00'))
+
+    @override_settings(CACHE_INTERVALO_VERSION_SEGUNDOS=60)
+    def test_version_consultada_por_intervalo(self):
+        motor = MotorTarifaImpuesto.obtener()
+        with self.assertNumQueries(0):
+            self.assertIs(MotorTarifaImpuesto.obtener(), motor)
+
+
+@override_settings(CACHE_INTERVALO_VERSION_SEGUNDOS=0)
+class PruebasPermisos(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('almacenero')
+        cls.otro = User.objects.create_user('chofer')
+        grupo = Group.objects.create(name='Almacén')
+        cls.propiedad = Propiedad.objects.create(descripcion='Locacion')
+        cls.permiso = Permiso.objects.create(idUser=cls.usuario, idGroup=grupo, idPropiedad=cls.propiedad)
+        cls.valor = PermisoValor.objects.create(permiso=cls.permiso, valor='Central')
+        permiso_otro = Permiso.objects.create(idUser=cls.otro, idGroup=grupo, idPropiedad=cls.propiedad)
+        PermisoValor.objects.create(permiso=permiso_otro, valor='Norte')
+
+    def setUp(self):
+        MapasPermisos.invalidar()
+
+    def usuario_nuevo(self):
+        # Cada petición carga su propio usuario, sin el mapa memorizado
+        return User.objects.get(pk=self.usuario.pk)
+
+    def test_mapa(self):
+        usuario = self.usuario_nuevo()
+        self.assertTrue(ServicioPermisos.has(usuario, 'LOCACION'))
+        self.assertTrue(ServicioPermisos.has(usuario, 'locacion', 'central'))
+        self.assertFalse(ServicioPermisos.has(usuario, 'locacion', 'norte'))
+        self.assertFalse(ServicioPermisos.has(usuario, 'otra'))
+        self.assertEqual(ServicioPermisos.valores(usuario, 'locacion'), frozenset({'central'}))
+
+    @override_settings(CACHE_INTERVALO_VERSION_SEGUNDOS=60)
+    def test_consulta_en_memoria(self):
+        ServicioPermisos.mapa(self.usuario.pk)
+        with self.assertNumQueries(0):
+            for _ in range(3):
+                self.assertTrue(ServicioPermisos.has(self.usuario.pk, 'locacion', 'central'))
+
+    def test_invalidacion_al_revocar(self):
+        self.assertTrue(ServicioPermisos.has(self.usuario_nuevo(), 'locacion', 'central'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.valor.delete()
+        self.assertFalse(ServicioPermisos.has(self.usuario_nuevo(), 'locacion', 'central'))
+        with self.captureOnCommitCallbacks(execute=True):
+            PermisoValor.objects.create(permiso=self.permiso, valor='Norte')
+        self.assertTrue(ServicioPermisos.has(self.usuario_nuevo(), 'locacion', 'norte'))
+
+    def test_solo_descarta_el_usuario_cambiado(self):
+        mapa_otro = ServicioPermisos.mapa(self.otro.pk)
+        ServicioPermisos.mapa(self.usuario.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.valor.delete()
+        mapas = MapasPermisos.obtener()
+        self.assertNotIn(self.usuario.pk, mapas._mapas)
+        self.assertIs(mapas._mapas[self.otro.pk], mapa_otro)
+
+    def test_invalidacion_al_cambiar_propiedad(self):
+        self.assertTrue(ServicioPermisos.has(self.usuario_nuevo(), 'locacion'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.propiedad.descripcion = 'Almacen'
+            self.propiedad.save()
+        usuario = self.usuario_nuevo()
+        self.assertFalse(ServicioPermisos.has(usuario, 'locacion'))
+        self.assertTrue(ServicioPermisos.has(usuario, 'almacen', 'central'))
+
+    def test_revocacion_en_otro_proceso(self):
+        self.assertTrue(ServicioPermisos.has(self.usuario.pk, 'locacion', 'central'))
+        # Otro worker revoca y publica el cambio; la copia de este proceso no se toca
+        PermisoValor.objects.filter(pk=self.valor.pk).update(valor='sur')
+        with mock.patch.object(MapasPermisos, '_actual', None):
+            MapasPermisos.registrar_cambio(self.usuario.pk)
+        self.assertFalse(ServicioPermisos.has(self.usuario.pk, 'locacion', 'central'))
+        self.assertTrue(ServicioPermisos.has(self.usuario.pk, 'locacion', 'sur'))
+
+
+@override_settings(CACHE_INTERVALO_VERSION_SEGUNDOS=0)
+class PruebasBusquedaPersona(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.jose = Persona.objects.create(
+            primer_nombre='José', primer_apellido='Pérez', nacionalidad='CUB', carnet_de_identificacion='85010112345',
+        )
+        cls.josefa = Persona.objects.create(
+            primer_nombre='Josefa', segundo_nombre='María', primer_apellido='López', nacionalidad='CUB',
+            carnet_de_identificacion='85010154321',
+        )
+        Persona.objects.create(
+            primer_nombre='Raúl', primer_apellido='Pérez', nacionalidad='CUB', carnet_de_identificacion='90020267890',
+        )
+
+    def setUp(self):
+        IndicePersonasMemoria.invalidar()
+
+    def ids(self, texto, **kwargs):
+        return [resultado['id'] for resultado in ServicioBusquedaPersona.buscar(texto, **kwargs)['resultados']]
+
+    def test_nombre_y_carnet(self):
+        self.assertEqual(self.ids('jose perez'), [self.jose.pk])
+        self.assertEqual(self.ids('MARIA'), [self.josefa.pk])
+        self.assertEqual(self.ids('850101'), [self.jose.pk, self.josefa.pk])
+        self.assertEqual(self.ids('85010154321'), [self.josefa.pk])
+
+    def test_cursor(self):
+        primera = ServicioBusquedaPersona.buscar('jos', limite=1)
+        segunda = ServicioBusquedaPersona.buscar('jos', cursor=primera['cursor_siguiente'], limite=1)
+        self.assertIsNone(segunda['cursor_siguiente'])
+        self.assertEqual(
+            {primera['resultados'][0]['id'], segunda['resultados'][0]['id']}, {self.jose.pk, self.josefa.pk},
+        )
+        with self.assertRaises(ValueError):
+            ServicioBusquedaPersona.buscar('jos', cursor='x')
+
+    def test_actualizacion_incremental(self):
+        self.assertEqual(self.ids('perez'), [self.jose.pk, Persona.objects.get(primer_nombre='Raúl').pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.jose.primer_apellido = 'Gómez'
+            self.jose.save()
+            Persona.objects.get(primer_nombre='Raúl').delete()
+        with mock.patch.object(IndicePersonasMemoria, 'cargar', side_effect=AssertionError('reconstrucción completa')):
+            self.assertEqual(self.ids('perez'), [])
+            self.assertEqual(self.ids('gomez'), [self.jose.pk])
+
+    def test_cambio_de_otro_proceso(self):
+        indice = IndicePersonasMemoria.obtener()
+        # Otro proceso publica el cambio: este lo aplica releyendo solo esa persona
+        Persona.objects.filter(pk=self.josefa.pk).update(primer_nombre='Rosa')
+        IndicePersonasMemoria.registrar_cambio(self.josefa.pk)
+        IndicePersonasMemoria._actual = indice
+        with mock.patch.object(IndicePersonasMemoria, 'cargar', side_effect=AssertionError('reconstrucción completa')):
+            self.assertEqual(self.ids('rosa'), [self.josefa.pk])
+        self.assertEqual(self.ids('josefa'), [])
+
+
+class PruebasItemsDespacho(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('almacen')
+        provincia = Provincia.objects.create(nombre='Prueba', descripcion='', codigo_aduana='99')
+        locacion = Locacion.objects.create(nombre='Almacén prueba', provincia=provincia)
+        cls.envios = crear_envios([1, 2, 3], estado='Enviado')
+        despacho = DespachoMensajero.objects.create(
+            locacion_origen=locacion, provincia=provincia, usuario='almacen',
+            mensajero=Mensajero.objects.create(name='Mensajero'),
+        )
+        cls.items = crear_items(despacho, cls.envios)
+        cls.entrada = crear_items(EntradaRecibida.objects.create(locacion_origen=locacion, usuario='almacen'), cls.envios[:1])[0]
+
+    def setUp(self):
+        self.senales = []
+        receptor = lambda sender, **kwargs: self.senales.append(kwargs)
+        items_despacho_actualizados.connect(receptor, weak=False)
+        self.addCleanup(items_despacho_actualizados.disconnect, receptor)
+
+    def estados(self):
+        return list(Envio.objects.filter(pk__in=[envio.pk for envio in self.envios]).order_by('pk').values_list('estado', flat=True))
+
+    def test_devolver_y_confirmar(self):
+        ids = [item.pk for item in self.items[:2]]
+        envios = ServicioItemDocumento.devolver_items(ids, usuario=self.usuario, ip='127.0.0.1')
+        self.assertEqual([(envio[0], envio[3], envio[4]) for envio in envios], [
+            (self.envios[0].pk, 'Enviado', 'Recibido'), (self.envios[1].pk, 'Enviado', 'Recibido'),
+        ])
+        self.assertEqual(self.estados(), ['Recibido', 'Recibido', 'Enviado'])
+        self.assertEqual(
+            list(ItemDocumento.objects.filter(pk__in=ids).values_list('devuelto', 'confirmado').distinct()), [(True, False)],
+        )
+        self.assertEqual(Auditoria.objects.filter(accion=Auditoria.Accion.CAMBIO_ESTADO_ENVIO).count(), 2)
+
+        ServicioItemDocumento.confirmar_items([item.pk for item in self.items])
+        self.assertEqual(self.estados(), ['Entregado'] * 3)
+        self.assertEqual(
+            list(ItemDocumento.objects.filter(pk__in=ids).values_list('devuelto', 'confirmado').distinct()), [(False, True)],
+        )
+        self.assertEqual([senal['accion'] for senal in self.senales], ['devolver', 'confirmar'])
+        self.assertEqual(self.senales[1]['items'], sorted(item.pk for item in self.items))
+
+    def test_ids_invalidos_no_cambian_nada(self):
+        for ids in ([self.items[0].pk, 0], [self.items[0].pk, self.entrada.pk]):
+            with self.subTest(ids=ids), self.assertRaises(ValueError):
+                ServicioItemDocumento.confirmar_items(ids)
+        self.assertEqual(self.estados(), ['Enviado'] * 3)
+        self.assertEqual(self.senales, [])
+
+    def test_marcar_como_devuelto(self):
+        item = ItemDocumento.objects.select_related('envio').get(pk=self.items[2].pk)
+        item.marcar_como_devuelto()
+        self.assertEqual((item.devuelto, item.envio.estado), (True, 'Recibido'))
+        self.assertEqual(self.estados()[2], 'Recibido')
+
+    def test_bloqueo_solo_items_y_envios(self):
+        consulta = ServicioItemDocumento._bloquear({self.items[0].pk}).query
+        with mock.patch.multiple(connection.features, has_select_for_update=True, has_select_for_update_of=True):
+            sql, _ = consulta.get_compiler(connection=connection).as_sql()
+        self.assertIn('FOR UPDATE OF', sql)
+        bloqueadas = sql.split('FOR UPDATE OF')[1]
+        self.assertIn(ItemDocumento._meta.db_table, bloqueadas)
+        self.assertIn(Envio._meta.db_table, bloqueadas)
+        self.assertNotIn(ContentType._meta.db_table, sql)
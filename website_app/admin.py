@@ -1,3 +1,39 @@
 from django.contrib import admin
+from website_app.models import (
+    ContadorManifiesto, EnvioArchivado, LiquidacionDiariaMensajero, OcupacionEnvio, TiempoEntrega,
+)
 
-# Register your models here.
+
+@admin.register(ContadorManifiesto)
+class ContadorManifiestoAdmin(admin.ModelAdmin):
+    list_display = ('manifiesto_id', 'estado', 'cantidad')
+    list_filter = ('estado',)
+    search_fields = ('manifiesto_id',)
+
+
+@admin.register(OcupacionEnvio)
+class OcupacionEnvioAdmin(admin.ModelAdmin):
+    list_display = ('envio_id', 'locacion_id', 'item_id', 'actualizado')
+    list_filter = ('locacion_id',)
+    search_fields = ('envio_id',)
+
+
+@admin.register(TiempoEntrega)
+class TiempoEntregaAdmin(admin.ModelAdmin):
+    list_display = ('etapa', 'origen_id', 'destino_id', 'muestras', 'p50', 'p80', 'p95', 'calculado')
+    list_filter = ('etapa',)
+
+
+@admin.register(EnvioArchivado)
+class EnvioArchivadoAdmin(admin.ModelAdmin):
+    list_display = ('no_envio', 'manifiesto_id', 'fecha_entrega', 'archivado')
+    search_fields = ('clave',)
+    exclude = ('datos',)
+
+
+@admin.register(LiquidacionDiariaMensajero)
+class LiquidacionDiariaMensajeroAdmin(admin.ModelAdmin):
+    list_display = ('mensajero_id', 'fecha', 'entregados', 'devueltos', 'total', 'actualizado')
+    list_filter = ('fecha',)
+    search_fields = ('mensajero_id',)
+    date_hierarchy = 'fecha'
@@ -4,3 +4,19 @@ from django.apps import AppConfig
 class WebsiteAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'website_app'
+
+    def ready(self):
+        # Registrar los receptores de señales
+        from website_app import signals  # noqa: F401
+
+    def precalentar(self):
+        """Resuelve las URLs, compila la plantilla de inicio y carga el motor de ETA."""
+        from django.template.loader import get_template
+        from django.urls import reverse
+        from website_app import instantanea
+        from website_app.service.eta_service import MotorEta
+
+        reverse('website_app:index')
+        get_template('website_app/index.html')
+        MotorEta.obtener()
+        instantanea.obtener()
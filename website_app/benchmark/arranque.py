@@ -0,0 +1,120 @@
+"""
+Costo de arranque de un worker: tiempo de importación y latencia de la primera petición,
+con y sin el precalentamiento de HM_paquete.precalentamiento.
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.template import engines
+from django.test import Client
+from django.urls import clear_url_caches, reverse
+from cotizacion_app.service.cotizacion_service import CatalogoServicios
+from HM_paquete.precalentamiento import precalentar
+from hmpaquetesapp.models import Envio
+from hmpaquetesapp.service.referencia_service import DirectorioReferencias
+from hmpaquetesapp.service.tarifa_impuesto_service import MotorTarifaImpuesto
+from website_app.metricas import Medicion
+from website_app.service.eta_service import MotorEta
+
+# Se ejecuta en un intérprete nuevo: en este proceso los módulos ya están importados
+SCRIPT_IMPORTACION = '''
+import json, sys, time
+inicio = time.perf_counter()
+import django
+django.setup()
+configurado = time.perf_counter()
+from django.conf import settings
+from django.core.wsgi import get_wsgi_application
+from importlib import import_module
+get_wsgi_application()
+import_module(settings.ROOT_URLCONF)
+fin = time.perf_counter()
+print(json.dumps({
+    'setup_ms': round((configurado - inicio) * 1000, 1),
+    'aplicacion_ms': round((fin - configurado) * 1000, 1),
+    'total_ms': round((fin - inicio) * 1000, 1),
+    'modulos': len(sys.modules),
+    'pillow_cargado': 'PIL' in sys.modules,
+}))
+'''
+
+
+def medir_importacion(repeticiones=3):
+    """Mediana de varios arranques en frío de django.setup() más la aplicación WSGI y las URLs."""
+    entorno = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+    mediciones = []
+    for _ in range(repeticiones):
+        salida = subprocess.run(
+            [sys.executable, '-c', SCRIPT_IMPORTACION],
+            cwd=settings.BASE_DIR, env=entorno, capture_output=True, text=True, check=True,
+        )
+        mediciones.append(json.loads(salida.stdout.strip().splitlines()[-1]))
+    mediciones.sort(key=lambda medicion: medicion['total_ms'])
+    return mediciones[len(mediciones) // 2]
+
+
+def _enfriar():
+    """Descarta las cachés de proceso que llena el precalentamiento."""
+    ContentType.objects.clear_cache()
+    DirectorioReferencias._actual = None
+    MotorTarifaImpuesto._actual = None
+    MotorEta._actual = None
+    CatalogoServicios._actual = None
+    clear_url_caches()
+    for motor in engines.all():
+        for cargador in motor.engine.template_loaders:
+            if hasattr(cargador, 'reset'):
+                cargador.reset()
+
+
+def _peticion(cliente, url):
+    medicion = Medicion()
+    with connection.execute_wrapper(medicion):
+        inicio = time.perf_counter()
+        cliente.get(url)
+        duracion = (time.perf_counter() - inicio) * 1000
+    return round(duracion, 3), medicion.consultas
+
+
+def medir_primera_peticion(precalentado):
+    """
+    Latencia y consultas de la primera y la segunda petición de index y shipment_details
+    tras vaciar las cachés del proceso.
+    """
+    codigo = Envio.objects.order_by('pk').values_list('no_envio', flat=True).first()
+    urls = {
+        'index': reverse('website_app:index'),
+        'shipment_details': reverse('website_app:shipment_details', args=[codigo]),
+    }
+    _enfriar()
+    resultado = {}
+    if precalentado:
+        inicio = time.perf_counter()
+        precalentar()
+        resultado['precalentamiento_ms'] = round((time.perf_counter() - inicio) * 1000, 3)
+
+    cliente = Client()
+    for nombre, url in urls.items():
+        primera_ms, primeras_consultas = _peticion(cliente, url)
+        segunda_ms, segundas_consultas = _peticion(cliente, url)
+        resultado[nombre] = {
+            'primera_ms': primera_ms,
+            'primera_consultas': primeras_consultas,
+            'segunda_ms': segunda_ms,
+            'segunda_consultas': segundas_consultas,
+        }
+    return resultado
+
+
+def medir_arranque(repeticiones=3):
+    return {
+        'importacion': medir_importacion(repeticiones),
+        'sin_precalentar': medir_primera_peticion(False),
+        'precalentado': medir_primera_peticion(True),
+    }
@@ -0,0 +1,302 @@
+"""
+Generación de datos sintéticos para medir el rendimiento del seguimiento de envíos.
+
+Los modelos de hmpaquetesapp son managed=False, así que las tablas no existen en la
+base de datos de pruebas; crear_tablas_no_gestionadas() las crea a partir de los modelos.
+"""
+import random
+from datetime import date, datetime, time, timedelta
+
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+from cotizacion_app.models import Servicio
+from hmpaquetesapp.models import (
+    Contacto, DespachoMensajero, Destinatario, Domicilio, EntradaRecibida, Envio, ItemDocumento,
+    Locacion, ManifiestoPostal, Mensajero, Municipio, Persona, Provincia, TransferenciaAlmacen,
+)
+from website_app.service.liquidacion_service import ServicioLiquidacion
+from website_app.service.manifiesto_service import ServicioContadoresManifiesto
+from website_app.service.ocupacion_service import ServicioOcupacion
+
+NOMBRES = ['José', 'María', 'Ángel', 'Lázaro', 'Yamilé', 'Raúl', 'Dayana', 'Ernesto', 'Idania', 'Osmany', 'Yunior', 'Liset']
+APELLIDOS = ['Pérez', 'González', 'Rodríguez', 'Hernández', 'Díaz', 'Martínez', 'Núñez', 'Fernández', 'Álvarez', 'Castillo']
+PROVINCIAS = [
+    ('Pinar del Río', '21'), ('Artemisa', '22'), ('La Habana', '23'), ('Mayabeque', '24'),
+    ('Matanzas', '25'), ('Cienfuegos', '26'), ('Villa Clara', '27'), ('Sancti Spíritus', '28'),
+    ('Ciego de Ávila', '29'), ('Camagüey', '30'), ('Las Tunas', '31'), ('Holguín', '32'),
+    ('Granma', '33'), ('Santiago de Cuba', '34'), ('Guantánamo', '35'), ('Isla de la Juventud', '40'),
+]
+SERVICIOS = ['Carga aérea', 'Carga marítima', 'Transporte terrestre', 'Almacenaje']
+
+# Distribución de estados de los envíos generados
+ESTADOS = [
+    ('No Recibido', 10), ('Desaforado', 2), ('Recibido', 25),
+    ('En Trayecto', 10), ('Enviado', 13), ('Entregado', 40),
+]
+
+ENVIOS_POR_MANIFIESTO = 500
+ENVIOS_POR_DESPACHO = 40
+
+
+def crear_tablas_no_gestionadas():
+    """
+    Crea las tablas de los modelos managed=False que aún no existan, con sus índices.
+    create_model() omite los índices de los modelos no gestionados (claves foráneas y
+    db_index), así que se crean aparte para que las consultas se midan como en producción.
+    """
+    existentes = set(connection.introspection.table_names())
+    with connection.schema_editor() as editor:
+        for modelo in apps.get_models():
+            if not modelo._meta.managed and modelo._meta.db_table not in existentes:
+                editor.create_model(modelo)
+                existentes.add(modelo._meta.db_table)
+                for field in modelo._meta.local_concrete_fields:
+                    if editor._field_should_be_indexed(modelo, field):
+                        editor.execute(editor._create_index_sql(modelo, fields=[field]))
+
+
+class _Buffer:
+    """
+    Acumula instancias por modelo y las inserta con bulk_create en lotes.
+    Todos los modelos se vacían juntos y en el orden en que aparecieron,
+    para que las claves foráneas siempre apunten a filas ya insertadas.
+    """
+
+    def __init__(self, lote):
+        self.lote = lote
+        self.pendientes = {}
+        self.fechas = {}
+        self.totales = {}
+
+    def agregar(self, instancia, fecha_creacion=None):
+        modelo = type(instancia)
+        self.pendientes.setdefault(modelo, []).append(instancia)
+        if fecha_creacion is not None:
+            instancia._fecha_simulada = fecha_creacion
+            self.fechas.setdefault(modelo, []).append(instancia)
+        if len(self.pendientes[modelo]) >= self.lote:
+            self.vaciar()
+
+    @transaction.atomic
+    def vaciar(self):
+        for modelo, instancias in self.pendientes.items():
+            if not instancias:
+                continue
+            modelo.objects.bulk_create(instancias, batch_size=self.lote)
+            # auto_now_add pisa la fecha en bulk_create; se restablece la fecha simulada
+            con_fecha = self.fechas.pop(modelo, [])
+            if con_fecha:
+                for instancia in con_fecha:
+                    instancia.fecha_creacion = instancia._fecha_simulada
+                modelo.objects.bulk_update(con_fecha, ['fecha_creacion'], batch_size=self.lote)
+            self.totales[modelo.__name__] = self.totales.get(modelo.__name__, 0) + len(instancias)
+            self.pendientes[modelo] = []
+
+
+def generar(envios=10000, semilla=1, lote=5000):
+    """
+    Genera un volumen realista de envíos con su historial de documentos.
+
+    Cada envío recibe, según su estado, una EntradaRecibida en el almacén central,
+    una TransferenciaAlmacen al almacén de su provincia (salvo La Habana) y un DespachoMensajero,
+    confirmado si fue entregado; un 5% de los entregados tiene además una devolución previa.
+
+    Returns:
+        dict {nombre_modelo: filas_insertadas}
+    """
+    aleatorio = random.Random(semilla)
+    buffer = _Buffer(lote)
+    ids = {}
+
+    def siguiente_id(modelo):
+        ids[modelo] = ids.get(modelo, 0) + 1
+        return ids[modelo]
+
+    # Datos de referencia
+    provincias = []
+    municipios = []
+    locaciones = []
+    for nombre, codigo in PROVINCIAS:
+        provincia = Provincia(id=siguiente_id(Provincia), nombre=nombre, descripcion=nombre, codigo_aduana=codigo)
+        provincias.append(provincia)
+        buffer.agregar(provincia)
+        for n in range(10):
+            municipio = Municipio(
+                id=siguiente_id(Municipio), nombre=f'{nombre[:20]} {n + 1}',
+                codigo_aduana=f'{codigo}{n + 1:02d}', provincia_id=provincia.id,
+            )
+            municipios.append(municipio)
+            buffer.agregar(municipio)
+        locacion = Locacion(
+            id=siguiente_id(Locacion), nombre=f'Almacén {nombre}'[:30], provincia_id=provincia.id,
+            es_almacen_central=(codigo == '23'),
+        )
+        locaciones.append(locacion)
+        buffer.agregar(locacion)
+    central = next(locacion for locacion in locaciones if locacion.es_almacen_central)
+    almacen_de_provincia = {locacion.provincia_id: locacion for locacion in locaciones}
+
+    mensajeros = []
+    for n in range(max(5, envios // 2000)):
+        mensajero = Mensajero(id=siguiente_id(Mensajero), name=f'Mensajero {n + 1}', carne_ident=f'{n:011d}')
+        mensajeros.append(mensajero)
+        buffer.agregar(mensajero)
+
+    if not Servicio.objects.exists():
+        Servicio.objects.bulk_create([Servicio(nombre=nombre, activo=True) for nombre in SERVICIOS])
+
+    tipo_entrada = ContentType.objects.get_for_model(EntradaRecibida)
+    tipo_transferencia = ContentType.objects.get_for_model(TransferenciaAlmacen)
+    tipo_despacho = ContentType.objects.get_for_model(DespachoMensajero)
+
+    estados = [estado for estado, _ in ESTADOS]
+    pesos_estados = [peso for _, peso in ESTADOS]
+    inicio = date.today() - timedelta(days=max(30, envios // ENVIOS_POR_MANIFIESTO))
+
+    def momento(dia, horas):
+        return timezone.make_aware(datetime.combine(dia, time(8))) + timedelta(hours=horas)
+
+    for numero_manifiesto in range((envios + ENVIOS_POR_MANIFIESTO - 1) // ENVIOS_POR_MANIFIESTO):
+        arribo = inicio + timedelta(days=numero_manifiesto // 10)
+        manifiesto = ManifiestoPostal(
+            id=siguiente_id(ManifiestoPostal), operador='Operador', codigo_aduana='ADU',
+            agencia_origen='Agencia', no_ga=f'GA{numero_manifiesto:06d}', no_vuelo=f'V{numero_manifiesto % 97}',
+            fecha_arribo=arribo, cantidad_bultos=ENVIOS_POR_MANIFIESTO,
+        )
+        buffer.agregar(manifiesto)
+
+        entrada = None
+        transferencias = {}
+        despachos = {}
+
+        def despachar(ubicacion, provincia):
+            """Agrupa los envíos de cada almacén en despachos de hasta ENVIOS_POR_DESPACHO."""
+            despacho, cantidad = despachos.get(ubicacion.id, (None, 0))
+            if despacho is None or cantidad >= ENVIOS_POR_DESPACHO:
+                despacho = DespachoMensajero(
+                    id=siguiente_id(DespachoMensajero), locacion_origen_id=ubicacion.id, provincia_id=provincia.id,
+                    mensajero_id=aleatorio.choice(mensajeros).id, usuario='benchmark',
+                )
+                cantidad = 0
+                buffer.agregar(despacho, momento(arribo, 120 + aleatorio.uniform(12, 96)))
+            despachos[ubicacion.id] = (despacho, cantidad + 1)
+            return despacho
+
+        cantidad = min(ENVIOS_POR_MANIFIESTO, envios - numero_manifiesto * ENVIOS_POR_MANIFIESTO)
+        for _ in range(cantidad):
+            envio_id = siguiente_id(Envio)
+            provincia = aleatorio.choice(provincias)
+            municipio = municipios[provincias.index(provincia) * 10 + aleatorio.randrange(10)]
+
+            domicilio = Domicilio(
+                id=siguiente_id(Domicilio), calle=f'Calle {aleatorio.randint(1, 300)}',
+                codigo_provincia=provincia.codigo_aduana, codigo_municipio=municipio.codigo_aduana,
+                provincia_id=provincia.codigo_aduana, municipio_id=municipio.id,
+            )
+            persona = Persona(
+                id=siguiente_id(Persona), primer_nombre=aleatorio.choice(NOMBRES),
+                segundo_nombre=aleatorio.choice(NOMBRES + [None] * 6),
+                primer_apellido=aleatorio.choice(APELLIDOS), segundo_apellido=aleatorio.choice(APELLIDOS),
+                nacionalidad='CUB', carnet_de_identificacion=f'{envio_id:011d}',
+            )
+            contacto = Contacto(id=siguiente_id(Contacto), telefono=f'5{envio_id:07d}', domicilio_id=domicilio.id)
+            destinatario = Destinatario(id=siguiente_id(Destinatario), persona_id=persona.id, contacto_id=contacto.id)
+            for instancia in (domicilio, persona, contacto, destinatario):
+                buffer.agregar(instancia)
+
+            estado = aleatorio.choices(estados, pesos_estados)[0]
+            envio = Envio(
+                id=envio_id, no_envio=f'HM{envio_id:010d}CU', peso=round(aleatorio.uniform(0.2, 60), 2),
+                pais_origen_destino='USA', descripcion='Misceláneas', fecha_imposicion=arribo - timedelta(days=5),
+                entrega_domicilio=aleatorio.random() < 0.8, estado=estado,
+                destinatario_id=destinatario.id, manifiesto_id=manifiesto.id,
+            )
+            envio.pago_mensajero = envio.calcular_pago_mensajero()
+            items = []
+
+            if estado not in ('No Recibido', 'Desaforado'):
+                horas = aleatorio.uniform(2, 48)
+                if entrada is None:
+                    entrada = EntradaRecibida(id=siguiente_id(EntradaRecibida), locacion_origen_id=central.id, usuario='benchmark')
+                    buffer.agregar(entrada, momento(arribo, horas))
+                items.append((tipo_entrada, entrada.id, False, False))
+                envio.fecha_recepcion = arribo
+                ubicacion = central
+
+                destino = almacen_de_provincia[provincia.id]
+                if destino.id != central.id:
+                    transferencia = transferencias.get(destino.id)
+                    if transferencia is None:
+                        transferencia = TransferenciaAlmacen(
+                            id=siguiente_id(TransferenciaAlmacen), locacion_origen_id=central.id,
+                            locacion_destino_id=destino.id, usuario='benchmark', confirmado=True,
+                        )
+                        transferencias[destino.id] = transferencia
+                        buffer.agregar(transferencia, momento(arribo, 48 + aleatorio.uniform(12, 96)))
+                    items.append((tipo_transferencia, transferencia.id, True, False))
+                    ubicacion = destino
+
+                if estado in ('Enviado', 'Entregado'):
+                    if estado == 'Entregado' and aleatorio.random() < 0.05:
+                        devolucion = despachar(ubicacion, provincia)
+                        items.append((tipo_despacho, devolucion.id, False, True))
+                    despacho = despachar(ubicacion, provincia)
+                    items.append((tipo_despacho, despacho.id, estado == 'Entregado', False))
+                    if estado == 'Entregado':
+                        envio.fecha_entrega = arribo + timedelta(days=aleatorio.randint(5, 12))
+                envio.locacion = ubicacion.nombre
+
+            buffer.agregar(envio)
+            for tipo, documento_id, confirmado, devuelto in items:
+                buffer.agregar(ItemDocumento(
+                    id=siguiente_id(ItemDocumento), documento_type=tipo, documento_id=documento_id,
+                    envio_id=envio_id, confirmado=confirmado, devuelto=devuelto,
+                ))
+
+    buffer.vaciar()
+    _reiniciar_secuencias()
+    # bulk_create no emite señales: las tablas derivadas se reconstruyen al final
+    reconstruir_derivadas()
+    return buffer.totales
+
+
+def reconstruir_derivadas(lote=500, dias=7):
+    """
+    Reconstruye ocupación, contadores y liquidaciones por tramos, para que ni la memoria
+    ni los parámetros de cada consulta crezcan con el volumen generado: los contadores
+    por lotes de manifiestos recorridos por id y las liquidaciones por ventanas de días.
+    """
+    ServicioOcupacion.reconstruir()
+
+    manifiestos = ManifiestoPostal.objects.order_by('pk').values_list('pk', flat=True)
+    ultimo_pk = 0
+    while True:
+        ids = list(manifiestos.filter(pk__gt=ultimo_pk)[:lote])
+        if not ids:
+            break
+        ServicioContadoresManifiesto.reconciliar(ids)
+        ultimo_pk = ids[-1]
+
+    extremos = DespachoMensajero.objects.aggregate(primero=Min('fecha_creacion'), ultimo=Max('fecha_creacion'))
+    if extremos['primero'] is None:
+        return
+    desde = timezone.localdate(extremos['primero'])
+    ultimo = timezone.localdate(extremos['ultimo'])
+    while desde <= ultimo:
+        hasta = desde + timedelta(days=dias - 1)
+        ServicioLiquidacion.reconciliar(desde, hasta)
+        desde = hasta + timedelta(days=1)
+
+
+def _reiniciar_secuencias():
+    """Los ids se asignaron explícitamente; las secuencias deben continuar después de ellos."""
+    modelos = [modelo for modelo in apps.get_models() if modelo._meta.app_label == 'hmpaquetesapp']
+    sentencias = connection.ops.sequence_reset_sql(no_style(), modelos)
+    if sentencias:
+        with connection.cursor() as cursor:
+            for sentencia in sentencias:
+                cursor.execute(sentencia)
@@ -0,0 +1,140 @@
+"""
+Escenarios de carga sobre las vistas públicas: latencia, rendimiento y consultas por petición.
+"""
+import random
+import statistics
+import time
+
+from django.db import connection
+from django.db.models import Max, Min
+from django.test import Client
+from django.urls import reverse
+from cotizacion_app.models import Servicio
+from hmpaquetesapp.models import Envio
+from website_app.metricas import Medicion
+
+
+def _percentil(valores, porcentaje):
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, max(0, round(porcentaje / 100 * (len(ordenados) - 1))))
+    return ordenados[indice]
+
+
+def medir(peticion, iteraciones, calentamiento=5):
+    """
+    Ejecuta peticion(i) iteraciones veces y resume latencias (ms) y consultas.
+    Las primeras peticiones de calentamiento no se cuentan.
+    """
+    for i in range(calentamiento):
+        peticion(i)
+
+    latencias = []
+    consultas = []
+    codigos = {}
+    inicio_total = time.perf_counter()
+    for i in range(iteraciones):
+        medicion = Medicion()
+        with connection.execute_wrapper(medicion):
+            inicio = time.perf_counter()
+            respuesta = peticion(i)
+            latencias.append((time.perf_counter() - inicio) * 1000)
+        consultas.append(medicion.consultas)
+        codigos[respuesta.status_code] = codigos.get(respuesta.status_code, 0) + 1
+    total = time.perf_counter() - inicio_total
+
+    return {
+        'iteraciones': iteraciones,
+        'latencia_ms': {
+            'media': round(statistics.fmean(latencias), 3),
+            'p50': round(_percentil(latencias, 50), 3),
+            'p95': round(_percentil(latencias, 95), 3),
+            'p99': round(_percentil(latencias, 99), 3),
+            'max': round(max(latencias), 3),
+        },
+        'peticiones_por_segundo': round(iteraciones / total, 1),
+        'consultas': {
+            'media': round(statistics.fmean(consultas), 2),
+            'max': max(consultas),
+        },
+        'codigos': {str(codigo): cantidad for codigo, cantidad in sorted(codigos.items())},
+    }
+
+
+def muestra_codigos(aleatorio, muestra, lote=500):
+    """
+    Códigos de envío al azar sin ORDER BY RANDOM() (que ordena la tabla entera): se sortean
+    ids entre el menor y el mayor y se leen en lotes acotados. Los ids que no existen se
+    omiten, así que con huecos en la secuencia la muestra puede quedar algo más corta.
+    """
+    extremos = Envio.objects.aggregate(primero=Min('pk'), ultimo=Max('pk'))
+    if extremos['primero'] is None:
+        return []
+    total = extremos['ultimo'] - extremos['primero'] + 1
+    ids = aleatorio.sample(range(extremos['primero'], extremos['ultimo'] + 1), min(muestra, total))
+    codigos = []
+    for inicio in range(0, len(ids), lote):
+        codigos.extend(Envio.objects.filter(pk__in=ids[inicio:inicio + lote]).values_list('no_envio', flat=True))
+    aleatorio.shuffle(codigos)
+    return codigos
+
+
+def escenarios(semilla=1, muestra=500):
+    """
+    Escenarios disponibles como {nombre: peticion(i)}.
+    Los códigos de envío se muestrean de todos los estados para cubrir historiales cortos y largos.
+    """
+    aleatorio = random.Random(semilla)
+    cliente = Client()
+
+    codigos = muestra_codigos(aleatorio, muestra)
+    if not codigos:
+        raise ValueError("No hay envíos en la base de datos; genere los datos sintéticos primero")
+    servicio_id = Servicio.objects.filter(activo=True).values_list('pk', flat=True).first()
+
+    url_index = reverse('website_app:index')
+    url_cotizacion = reverse('website_app:insertar_cotizacion')
+
+    def shipment_details(i):
+        return cliente.get(reverse('website_app:shipment_details', args=[codigos[i % len(codigos)]]))
+
+    def index(i):
+        return cliente.get(url_index)
+
+    def insertar_cotizacion(i):
+        return cliente.post(url_cotizacion, {
+            'nombre': f'Cliente {i}',
+            'correo': f'cliente{i}@example.com',
+            'servicios': servicio_id,
+            'descripcion': 'Cotización de prueba',
+        })
+
+    return {
+        'shipment_details': shipment_details,
+        'index': index,
+        'insertar_cotizacion': insertar_cotizacion,
+    }
+
+
+def comparar(anterior, actual):
+    """
+    Diferencias relativas entre dos resultados de benchmark.
+
+    Returns:
+        lista de (escenario, métrica, valor_anterior, valor_actual, variación_porcentual)
+    """
+    filas = []
+    metricas = [
+        ('latencia_ms', 'p50'), ('latencia_ms', 'p95'), ('latencia_ms', 'p99'),
+        ('consultas', 'media'), ('peticiones_por_segundo', None),
+    ]
+    for nombre, resultado in actual['escenarios'].items():
+        previo = anterior.get('escenarios', {}).get(nombre)
+        if not previo:
+            continue
+        for grupo, clave in metricas:
+            valor_previo = previo[grupo][clave] if clave else previo[grupo]
+            valor_actual = resultado[grupo][clave] if clave else resultado[grupo]
+            variacion = ((valor_actual - valor_previo) / valor_previo * 100) if valor_previo else 0.0
+            etiqueta = f'{grupo}.{clave}' if clave else grupo
+            filas.append((nombre, etiqueta, valor_previo, valor_actual, round(variacion, 1)))
+    return filas
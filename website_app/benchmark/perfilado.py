@@ -0,0 +1,41 @@
+"""
+Sobrecosto del perfilado bajo demanda en shipment_details: sin el middleware, con el
+middleware sin activar y con la petición perfilada.
+"""
+import tempfile
+
+from django.conf import settings
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from hmpaquetesapp.models import Envio
+from website_app import perfilado
+from website_app.benchmark.escenarios import medir
+
+MIDDLEWARE_PERFILADO = 'website_app.middleware.PerfiladoMiddleware'
+
+
+def medir_perfilado(iteraciones=200, muestra=200):
+    codigos = list(Envio.objects.order_by('pk').values_list('no_envio', flat=True)[:muestra])
+    if not codigos:
+        raise ValueError("No hay envíos en la base de datos; genere los datos sintéticos primero")
+    urls = [reverse('website_app:shipment_details', args=[codigo]) for codigo in codigos]
+    sin_middleware = [clase for clase in settings.MIDDLEWARE if clase != MIDDLEWARE_PERFILADO]
+    con_middleware = sin_middleware + [MIDDLEWARE_PERFILADO]
+
+    resultado = {}
+    with tempfile.TemporaryDirectory() as directorio:
+        modos = (
+            ('sin_middleware', sin_middleware, {}),
+            ('inactivo', con_middleware, {}),
+            ('perfilado', con_middleware, {'HTTP_X_PERFILAR': perfilado.firmar()}),
+        )
+        for nombre, middleware, cabeceras in modos:
+            with override_settings(MIDDLEWARE=middleware, PERFILADO_DIRECTORIO=directorio):
+                cliente = Client(**cabeceras)
+                resultado[nombre] = medir(lambda i: cliente.get(urls[i % len(urls)]), iteraciones)
+
+    base = resultado['sin_middleware']['latencia_ms']['p50']
+    for medicion in resultado.values():
+        medicion['sobrecosto_p50_pct'] = round((medicion['latencia_ms']['p50'] - base) / base * 100, 1) if base else 0.0
+    return resultado
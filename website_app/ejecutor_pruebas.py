@@ -0,0 +1,31 @@
+"""
+Ejecutor de pruebas del proyecto.
+
+Las tablas de hmpaquetesapp son managed=False y no tienen migraciones: tras crear la base de
+datos de pruebas se crean a partir de los modelos. Las pruebas de presupuestos de las vistas
+(website_app.tests.PruebasPresupuesto, etiqueta 'presupuestos') generan datos sintéticos y
+son las más lentas; pueden omitirse.
+
+    python manage.py test                       # todas las pruebas
+    python manage.py test --sin-presupuestos    # sin los presupuestos de las vistas
+"""
+from django.test.runner import DiscoverRunner
+from website_app.benchmark.datos import crear_tablas_no_gestionadas
+
+
+class EjecutorPresupuestos(DiscoverRunner):
+
+    def __init__(self, sin_presupuestos=False, **kwargs):
+        super().__init__(**kwargs)
+        if sin_presupuestos:
+            self.exclude_tags.add('presupuestos')
+
+    @classmethod
+    def add_arguments(cls, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--sin-presupuestos', action='store_true', help="No verificar los presupuestos de las vistas")
+
+    def setup_databases(self, **kwargs):
+        configuracion = super().setup_databases(**kwargs)
+        crear_tablas_no_gestionadas()
+        return configuracion
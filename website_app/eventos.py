@@ -0,0 +1,170 @@
+"""
+Publicación de cambios de envíos para el flujo SSE de seguimiento (views.eventos_envio).
+
+Los eventos se indexan por no_envio. En un solo proceso se publican directamente en el
+bus en memoria; con SSE_CANAL_NOTIFY configurado se envían con pg_notify y un hilo
+OyentePostgres, uno por proceso web, los reenvía al bus local de cada worker.
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+
+class Suscripcion:
+    __slots__ = ('clave', 'cola', 'loop')
+
+    def __init__(self, clave, loop):
+        self.clave = clave
+        self.cola = asyncio.Queue()
+        self.loop = loop
+
+
+class BusEventosEnvio:
+    """
+    Pub/sub en memoria por código de envío. publicar() puede llamarse desde cualquier
+    hilo; cada suscripción recibe el evento en su propio loop de asyncio.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._suscripciones = {}
+        self.conexiones = 0
+
+    @staticmethod
+    def clave(no_envio):
+        # shipment_details busca con iexact, así que las claves no distinguen mayúsculas
+        return no_envio.upper()
+
+    def suscribir(self, no_envio, max_conexiones):
+        """
+        Registra una suscripción en el loop actual.
+
+        Returns:
+            Suscripcion, o None si se alcanzó el máximo de conexiones.
+        """
+        suscripcion = Suscripcion(self.clave(no_envio), asyncio.get_running_loop())
+        with self._lock:
+            if self.conexiones >= max_conexiones:
+                return None
+            self.conexiones += 1
+            self._suscripciones.setdefault(suscripcion.clave, set()).add(suscripcion)
+        return suscripcion
+
+    def cancelar(self, suscripcion):
+        with self._lock:
+            suscripciones = self._suscripciones.get(suscripcion.clave)
+            if suscripciones and suscripcion in suscripciones:
+                suscripciones.discard(suscripcion)
+                self.conexiones -= 1
+                if not suscripciones:
+                    del self._suscripciones[suscripcion.clave]
+
+    def tiene_suscriptores(self, no_envio=None):
+        if no_envio is None:
+            return bool(self._suscripciones)
+        return self.clave(no_envio) in self._suscripciones
+
+    def publicar(self, no_envio, evento):
+        with self._lock:
+            suscripciones = list(self._suscripciones.get(self.clave(no_envio), ()))
+        for suscripcion in suscripciones:
+            try:
+                suscripcion.loop.call_soon_threadsafe(suscripcion.cola.put_nowait, evento)
+            except RuntimeError:
+                # El loop ya se cerró; la suscripción se cancela al terminar su flujo
+                pass
+
+
+bus = BusEventosEnvio()
+
+_oyente = None
+_oyente_lock = threading.Lock()
+
+
+def canal_notify():
+    """Canal de PostgreSQL para los eventos, o None si se usa solo el bus en memoria."""
+    canal = getattr(settings, 'SSE_CANAL_NOTIFY', None)
+    if canal and connection.vendor == 'postgresql':
+        return canal
+    return None
+
+
+def notificar_envio(no_envio, motivo, estado=None):
+    """
+    Publica un cambio del envío cuando la transacción actual se confirme.
+    Con pg_notify la entrega ya es transaccional: PostgreSQL la envía en el COMMIT.
+    """
+    evento = {'codigo': no_envio, 'motivo': motivo, 'estado': estado}
+    canal = canal_notify()
+    if canal:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [canal, json.dumps(evento)])
+    elif bus.tiene_suscriptores(no_envio):
+        transaction.on_commit(lambda: bus.publicar(no_envio, evento))
+
+
+def iniciar_oyente():
+    """Arranca, una sola vez por proceso, el hilo que escucha el canal de PostgreSQL."""
+    global _oyente
+    canal = canal_notify()
+    if not canal or _oyente is not None:
+        return
+    with _oyente_lock:
+        if _oyente is None:
+            _oyente = OyentePostgres(canal)
+            _oyente.start()
+
+
+class OyentePostgres(threading.Thread):
+    """Hilo con una conexión dedicada en LISTEN que reenvía las notificaciones al bus."""
+
+    daemon = True
+
+    def __init__(self, canal):
+        super().__init__(name='sse-oyente-postgres')
+        self.canal = canal
+
+    def _conectar(self):
+        import psycopg2
+        from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+        datos = settings.DATABASES['default']
+        conexion = psycopg2.connect(
+            dbname=datos['NAME'], user=datos.get('USER'), password=datos.get('PASSWORD'),
+            host=datos.get('HOST') or None, port=datos.get('PORT') or None,
+        )
+        conexion.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        with conexion.cursor() as cursor:
+            cursor.execute(f'LISTEN "{self.canal}"')
+        return conexion
+
+    def run(self):
+        while True:
+            conexion = None
+            try:
+                conexion = self._conectar()
+                while True:
+                    if select.select([conexion], [], [], 30) == ([], [], []):
+                        continue
+                    conexion.poll()
+                    while conexion.notifies:
+                        notificacion = conexion.notifies.pop(0)
+                        try:
+                            evento = json.loads(notificacion.payload)
+                            bus.publicar(evento['codigo'], evento)
+                        except (ValueError, KeyError):
+                            logger.warning('Notificación de envío inválida: %s', notificacion.payload)
+            except Exception:
+                logger.exception('Oyente de eventos de envíos desconectado; reintentando')
+                time.sleep(5)
+            finally:
+                if conexion is not None:
+                    conexion.close()
@@ -0,0 +1,262 @@
+"""
+Instantánea de seguimiento para responder shipment_details sin base de datos (modo degradado).
+
+El archivo se genera con exportar_instantanea_seguimiento y se lee con mmap: todos los
+workers comparten las mismas páginas en la caché del sistema y una búsqueda es una
+búsqueda binaria sobre el índice, sin cargar el archivo.
+
+Formato (enteros little-endian):
+    cabecera   b'HMSN' | versión u16 | reservado u16 | cantidad u32 | generada f64 (epoch)
+    índice     cantidad entradas ordenadas por clave: LARGO_CLAVE bytes de no_envio en
+               mayúsculas rellenado con ceros + u32 desplazamiento del registro
+    registros  u16 largo + JSON UTF-8 [no_envio, estado, almacen, evento, tipo, fecha]
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import DatabaseError
+
+logger = logging.getLogger(__name__)
+
+MAGICO = b'HMSN'
+VERSION = 1
+CABECERA = struct.Struct('<4sHHId')
+LARGO_CLAVE = 30
+ENTRADA = struct.Struct(f'<{LARGO_CLAVE}sI')
+LARGO_REGISTRO = struct.Struct('<H')
+
+# Cada cuánto se comprueba si el exportador reemplazó el archivo
+SEGUNDOS_REVISION = 5
+
+
+def clave(no_envio):
+    """Clave del índice: shipment_details busca sin distinguir mayúsculas."""
+    return no_envio.upper().encode('utf-8')
+
+
+def escribir(ruta, filas):
+    """
+    Escribe la instantánea a partir de filas (no_envio, estado, almacen, evento, tipo, fecha)
+    en cualquier orden. Los registros se vuelcan a un archivo temporal a medida que llegan;
+    en memoria solo quedan las claves y sus desplazamientos para ordenarlas.
+    El archivo final se publica con os.replace, así que los lectores nunca ven uno a medias.
+    Si un código se repite se conserva la última fila.
+
+    Returns:
+        cantidad de envíos escritos
+    """
+    directorio = os.path.dirname(os.path.abspath(ruta))
+    os.makedirs(directorio, exist_ok=True)
+    indice = {}
+    with tempfile.TemporaryFile(dir=directorio) as registros:
+        desplazamiento = 0
+        for fila in filas:
+            llave = clave(fila[0])
+            if len(llave) > LARGO_CLAVE:
+                continue
+            datos = json.dumps(list(fila), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            if len(datos) > 0xFFFF:
+                continue
+            registros.write(LARGO_REGISTRO.pack(len(datos)))
+            registros.write(datos)
+            indice[llave] = desplazamiento
+            desplazamiento += LARGO_REGISTRO.size + len(datos)
+
+        descriptor, temporal = tempfile.mkstemp(dir=directorio, prefix='.instantanea-')
+        try:
+            with os.fdopen(descriptor, 'wb') as salida:
+                salida.write(CABECERA.pack(MAGICO, VERSION, 0, len(indice), time.time()))
+                for llave in sorted(indice):
+                    salida.write(ENTRADA.pack(llave, indice[llave]))
+                registros.seek(0)
+                while True:
+                    bloque = registros.read(1 << 20)
+                    if not bloque:
+                        break
+                    salida.write(bloque)
+                salida.flush()
+                os.fsync(salida.fileno())
+            os.chmod(temporal, 0o644)
+            os.replace(temporal, ruta)
+        except BaseException:
+            if os.path.exists(temporal):
+                os.unlink(temporal)
+            raise
+    return len(indice)
+
+
+class InstantaneaSeguimiento:
+    """Lector de solo lectura sobre el archivo mapeado en memoria."""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        with open(ruta, 'rb') as archivo:
+            estado = os.fstat(archivo.fileno())
+            self.identidad = (estado.st_ino, estado.st_mtime_ns)
+            self._mapa = mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ)
+        magico, version, _, self.cantidad, generada = CABECERA.unpack_from(self._mapa, 0)
+        if magico != MAGICO or version != VERSION:
+            self._mapa.close()
+            raise ValueError(f"{ruta} no es una instantánea de seguimiento válida")
+        self.generada = datetime.fromtimestamp(generada, tz=dt_timezone.utc)
+        self._inicio_registros = CABECERA.size + self.cantidad * ENTRADA.size
+
+    def _clave(self, posicion):
+        inicio = CABECERA.size + posicion * ENTRADA.size
+        return self._mapa[inicio:inicio + LARGO_CLAVE].rstrip(b'\0')
+
+    def buscar(self, no_envio):
+        """
+        Returns:
+            (no_envio, estado, almacen, evento, tipo, fecha) o None si no está
+        """
+        buscada = clave(no_envio)
+        bajo, alto = 0, self.cantidad
+        while bajo < alto:
+            medio = (bajo + alto) // 2
+            if self._clave(medio) < buscada:
+                bajo = medio + 1
+            else:
+                alto = medio
+        if bajo == self.cantidad or self._clave(bajo) != buscada:
+            return None
+        _, desplazamiento = ENTRADA.unpack_from(self._mapa, CABECERA.size + bajo * ENTRADA.size)
+        inicio = self._inicio_registros + desplazamiento
+        (largo,) = LARGO_REGISTRO.unpack_from(self._mapa, inicio)
+        inicio += LARGO_REGISTRO.size
+        return tuple(json.loads(self._mapa[inicio:inicio + largo].decode('utf-8')))
+
+    def cerrar(self):
+        self._mapa.close()
+
+
+_instantanea = None
+_revisada = 0.0
+_lock = threading.Lock()
+
+
+def ruta_instantanea():
+    return getattr(settings, 'SEGUIMIENTO_INSTANTANEA', None)
+
+
+def obtener():
+    """
+    Instantánea actual del proceso, o None si no hay archivo.
+    Se reabre cuando el exportador publica uno nuevo (otro inodo o fecha de modificación).
+    """
+    global _instantanea, _revisada
+    ruta = ruta_instantanea()
+    if not ruta:
+        return None
+    ahora = time.monotonic()
+    if _instantanea is not None and ahora - _revisada < SEGUNDOS_REVISION:
+        return _instantanea
+    with _lock:
+        _revisada = ahora
+        try:
+            estado = os.stat(ruta)
+        except FileNotFoundError:
+            return _instantanea
+        if _instantanea is None or _instantanea.identidad != (estado.st_ino, estado.st_mtime_ns):
+            try:
+                # La anterior no se cierra: otro hilo puede estar leyéndola; la libera el GC
+                _instantanea = InstantaneaSeguimiento(ruta)
+            except (OSError, ValueError, struct.error):
+                logger.exception('No se pudo abrir la instantánea de seguimiento %s', ruta)
+        return _instantanea
+
+
+def respuesta(cod):
+    """
+    Respuesta de shipment_details desde la instantánea, marcada como posiblemente desactualizada.
+
+    Returns:
+        dict con la respuesta, o None si no hay instantánea o el código no está en ella
+    """
+    instantanea = obtener()
+    if instantanea is None:
+        return None
+    fila = instantanea.buscar(cod)
+    if fila is None:
+        return None
+    no_envio, estado, almacen, evento, tipo, fecha = fila
+    return {
+        'success': True,
+        'envio': {
+            'codigo': no_envio,
+            'estado': estado,
+            'almacen': almacen if estado != 'No Recibido' and almacen else '',
+            # La instantánea no permite estimarlos: la página oculta el campo
+            'dias_para_entrega': None,
+            'foto_confirmacion': '',
+        },
+        'historial': [{'evento': evento, 'fecha': fecha, 'detalle': '', 'tipo': tipo}] if evento else [],
+        'degradado': True,
+        'posiblemente_desactualizado': True,
+        'actualizado': instantanea.generada.isoformat(),
+    }
+
+
+class ConsultasLentas(DatabaseError):
+    """La petición agotó SEGUIMIENTO_UMBRAL_LENTO_MS esperando a la base de datos."""
+
+
+class PresupuestoConsultas:
+    """
+    execute_wrapper que corta la petición antes de la siguiente consulta si ya se superó
+    el presupuesto de tiempo. Una consulta colgada la acota statement_timeout de PostgreSQL.
+    """
+
+    def __init__(self, milisegundos):
+        self.limite = time.monotonic() + milisegundos / 1000
+
+    def __call__(self, execute, sql, params, many, context):
+        if time.monotonic() > self.limite:
+            raise ConsultasLentas('Presupuesto de tiempo de consultas agotado')
+        return execute(sql, params, many, context)
+
+
+_degradado_hasta = 0.0
+_fallas = deque()
+_lock_fallas = threading.Lock()
+
+
+def registrar_falla():
+    """
+    Anota una petición fallida o lenta. El proceso pasa a modo degradado cuando acumula
+    SEGUIMIENTO_FALLAS_DEGRADADO en SEGUIMIENTO_VENTANA_FALLAS_SEGUNDOS: una falla aislada
+    solo se responde desde la instantánea.
+    """
+    maximo = getattr(settings, 'SEGUIMIENTO_FALLAS_DEGRADADO', 3)
+    ventana = getattr(settings, 'SEGUIMIENTO_VENTANA_FALLAS_SEGUNDOS', 10)
+    ahora = time.monotonic()
+    with _lock_fallas:
+        _fallas.append(ahora)
+        while _fallas and ahora - _fallas[0] > ventana:
+            _fallas.popleft()
+        if len(_fallas) < maximo:
+            return
+        _fallas.clear()
+    activar_modo_degradado()
+
+
+def activar_modo_degradado():
+    """Durante SEGUIMIENTO_DEGRADADO_SEGUNDOS se responde primero desde la instantánea."""
+    global _degradado_hasta
+    segundos = getattr(settings, 'SEGUIMIENTO_DEGRADADO_SEGUNDOS', 30)
+    if not modo_degradado_activo():
+        logger.warning('Seguimiento en modo degradado durante %d s', segundos)
+    _degradado_hasta = time.monotonic() + segundos
+
+
+def modo_degradado_activo():
+    return time.monotonic() < _degradado_hasta
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from website_app.service.archivo_service import ServicioArchivo
+
+
+class Command(BaseCommand):
+    help = (
+        "Copia a EnvioArchivado los envíos entregados hace más de N días, con su historial. "
+        "Solo copia; con --purgar borra además de Envio e ItemDocumento los envíos cuyo archivo se verificó"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=None,
+                            help="Antigüedad mínima de la entrega (por defecto ARCHIVO_DIAS_ENTREGADO)")
+        parser.add_argument('--tamano-lote', type=int, default=500, help="Envíos por transacción")
+        parser.add_argument('--max-lotes', type=int, default=None, help="Detenerse después de estos lotes")
+        parser.add_argument('--purgar', action='store_true',
+                            help="Después de archivar, borrar de las tablas de trabajo los envíos archivados y verificados")
+        parser.add_argument('--simular', action='store_true', help="Solo contar los envíos a archivar")
+
+    def handle(self, *args, **options):
+        if options['simular']:
+            cantidad = ServicioArchivo.candidatos(options['dias']).count()
+            self.stdout.write(f"Envíos a archivar: {cantidad}")
+            return
+        total = ServicioArchivo.archivar(
+            dias=options['dias'], tamano_lote=options['tamano_lote'], max_lotes=options['max_lotes'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Envíos archivados: {total}"))
+        if options['purgar']:
+            purgados = ServicioArchivo.purgar(tamano_lote=options['tamano_lote'], max_lotes=options['max_lotes'])
+            self.stdout.write(self.style.SUCCESS(f"Envíos purgados: {purgados}"))
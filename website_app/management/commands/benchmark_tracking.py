@@ -0,0 +1,114 @@
+import json
+import platform
+from datetime import datetime
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from hmpaquetesapp.models import Envio
+from website_app.benchmark.arranque import medir_arranque
+from website_app.benchmark.datos import crear_tablas_no_gestionadas, generar
+from website_app.benchmark.escenarios import comparar, escenarios, medir
+from website_app.benchmark.perfilado import medir_perfilado
+
+
+class Command(BaseCommand):
+    help = (
+        "Crea una base de datos de pruebas desechable con datos sintéticos y mide latencia, "
+        "rendimiento y consultas de shipment_details, index e insertar_cotizacion "
+        "(con --arranque, también el costo de arrancar un worker). "
+        "Con SQLite: --settings=HM_paquete.settings_benchmark"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--envios', type=int, default=10000, help="Envíos sintéticos a generar")
+        parser.add_argument('--iteraciones', type=int, default=200, help="Peticiones medidas por escenario")
+        parser.add_argument('--semilla', type=int, default=1)
+        parser.add_argument('--lote', type=int, default=5000, help="Tamaño de lote de bulk_create")
+        parser.add_argument('--escenario', action='append', dest='escenarios', help="Limitar a uno o más escenarios")
+        parser.add_argument('--salida', default='benchmark_tracking.json', help="Archivo JSON de resultados")
+        parser.add_argument('--comparar', help="Resultado JSON anterior con el que comparar")
+        parser.add_argument('--arranque', action='store_true', help="Medir también importación y primera petición")
+        parser.add_argument('--perfilado', action='store_true', help="Medir el sobrecosto del perfilado bajo demanda")
+        parser.add_argument('--keepdb', action='store_true', help="Conservar y reutilizar la base de datos de pruebas")
+
+    def handle(self, *args, **options):
+        anterior = None
+        if options['comparar']:
+            try:
+                with open(options['comparar'], encoding='utf-8') as archivo:
+                    anterior = json.load(archivo)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"No se pudo leer {options['comparar']}: {e}")
+
+        nombre_original = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            crear_tablas_no_gestionadas()
+            if options['keepdb'] and Envio.objects.exists():
+                self.stdout.write("Reutilizando los datos existentes")
+                volumen = {}
+            else:
+                self.stdout.write(f"Generando {options['envios']} envíos sintéticos...")
+                volumen = generar(options['envios'], options['semilla'], options['lote'])
+                for modelo, cantidad in volumen.items():
+                    self.stdout.write(f"  {modelo}: {cantidad}")
+
+            disponibles = escenarios(options['semilla'])
+            seleccionados = options['escenarios'] or list(disponibles)
+            desconocidos = set(seleccionados) - set(disponibles)
+            if desconocidos:
+                raise CommandError(f"Escenarios desconocidos: {', '.join(sorted(desconocidos))}")
+
+            resultado = {
+                'fecha': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'base_de_datos': connection.vendor,
+                'volumen': volumen,
+                'escenarios': {},
+            }
+            for nombre in seleccionados:
+                medicion = medir(disponibles[nombre], options['iteraciones'])
+                resultado['escenarios'][nombre] = medicion
+                latencia = medicion['latencia_ms']
+                self.stdout.write(
+                    f"{nombre}: p50 {latencia['p50']} ms, p95 {latencia['p95']} ms, "
+                    f"{medicion['peticiones_por_segundo']} pet/s, {medicion['consultas']['media']} consultas"
+                )
+
+            if options['arranque']:
+                resultado['arranque'] = arranque = medir_arranque()
+                importacion = arranque['importacion']
+                self.stdout.write(
+                    f"arranque: importación {importacion['total_ms']} ms "
+                    f"({importacion['modulos']} módulos, Pillow {'sí' if importacion['pillow_cargado'] else 'no'})"
+                )
+                for modo in ('sin_precalentar', 'precalentado'):
+                    for nombre in ('index', 'shipment_details'):
+                        peticion = arranque[modo][nombre]
+                        self.stdout.write(
+                            f"  {modo} {nombre}: primera {peticion['primera_ms']} ms / "
+                            f"{peticion['primera_consultas']} consultas, segunda {peticion['segunda_ms']} ms / "
+                            f"{peticion['segunda_consultas']} consultas"
+                        )
+
+            if options['perfilado']:
+                resultado['perfilado'] = perfil = medir_perfilado(options['iteraciones'])
+                for modo, medicion in perfil.items():
+                    self.stdout.write(
+                        f"perfilado {modo}: p50 {medicion['latencia_ms']['p50']} ms "
+                        f"({medicion['sobrecosto_p50_pct']:+}%), p95 {medicion['latencia_ms']['p95']} ms"
+                    )
+        finally:
+            if not options['keepdb']:
+                connection.creation.destroy_test_db(nombre_original, verbosity=0)
+
+        with open(options['salida'], 'w', encoding='utf-8') as archivo:
+            json.dump(resultado, archivo, indent=2, ensure_ascii=False)
+        self.stdout.write(self.style.SUCCESS(f"Resultados guardados en {options['salida']}"))
+
+        if anterior:
+            self.stdout.write("Comparación con el resultado anterior:")
+            for nombre, metrica, previo, actual, variacion in comparar(anterior, resultado):
+                self.stdout.write(f"  {nombre} {metrica}: {previo} -> {actual} ({variacion:+}%)")
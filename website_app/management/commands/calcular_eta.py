@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from website_app.service.eta_service import MAX_MUESTRAS, ServicioEta
+
+
+class Command(BaseCommand):
+    help = "Recalcula los percentiles de días hasta la entrega por etapa a partir del historial (ejecución nocturna)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=180, help="Días de entregas a considerar")
+        parser.add_argument('--max-muestras', type=int, default=MAX_MUESTRAS, help="Tamaño del reservorio por etapa y ruta")
+        parser.add_argument('--semilla', type=int, default=None, help="Semilla del muestreo, para resultados reproducibles")
+
+    def handle(self, *args, **options):
+        resultado = ServicioEta.calcular(
+            dias_historial=options['dias'], max_muestras=options['max_muestras'], semilla=options['semilla'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Items procesados: {resultado['items']}; filas de tiempos de entrega: {resultado['filas']}"
+        ))
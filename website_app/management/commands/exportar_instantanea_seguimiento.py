@@ -0,0 +1,25 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from website_app import instantanea
+from website_app.service.seguimiento_service import ServicioSeguimiento
+
+
+class Command(BaseCommand):
+    help = "Genera la instantánea de seguimiento que usa shipment_details en modo degradado"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--salida', default=None, help="Ruta del archivo (por defecto SEGUIMIENTO_INSTANTANEA)")
+        parser.add_argument('--tamano-lote', type=int, default=2000, help="Envíos leídos por consulta")
+
+    def handle(self, *args, **options):
+        ruta = options['salida'] or getattr(settings, 'SEGUIMIENTO_INSTANTANEA', None)
+        if not ruta:
+            raise CommandError("Indique --salida o configure SEGUIMIENTO_INSTANTANEA")
+
+        inicio = time.perf_counter()
+        cantidad = instantanea.escribir(str(ruta), ServicioSeguimiento.filas_instantanea(options['tamano_lote']))
+        self.stdout.write(self.style.SUCCESS(
+            f"Instantánea con {cantidad} envíos escrita en {ruta} ({time.perf_counter() - inicio:.1f} s)"
+        ))
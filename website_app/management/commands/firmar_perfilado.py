@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from website_app import perfilado
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera un token para la cabecera X-Perfilar, que perfila la petición sin sesión de staff. "
+        "Caduca a los PERFILADO_FIRMA_SEGUNDOS."
+    )
+
+    def handle(self, *args, **options):
+        token = perfilado.firmar()
+        segundos = getattr(settings, 'PERFILADO_FIRMA_SEGUNDOS', 300)
+        self.stdout.write(f"X-Perfilar: {token}")
+        self.stdout.write(f"Válido durante {segundos} s")
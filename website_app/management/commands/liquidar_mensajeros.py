@@ -0,0 +1,29 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from website_app.service.liquidacion_service import ServicioLiquidacion
+
+
+class Command(BaseCommand):
+    help = "Muestra la liquidación de los mensajeros en un período sumando las liquidaciones diarias"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', type=date.fromisoformat, help="Primer día (AAAA-MM-DD); por defecto el día 1 del mes en curso")
+        parser.add_argument('--hasta', type=date.fromisoformat, help="Último día (AAAA-MM-DD); por defecto hoy")
+        parser.add_argument('--mensajero', type=int, action='append', dest='mensajeros',
+                            help="Id del mensajero (puede repetirse); por defecto todos")
+
+    def handle(self, *args, **options):
+        hoy = timezone.localdate()
+        desde = options['desde'] or hoy.replace(day=1)
+        hasta = options['hasta'] or hoy
+        filas = ServicioLiquidacion.reporte(desde, hasta, options['mensajeros'])
+        self.stdout.write(f"Liquidación del {desde} al {hasta}")
+        for fila in filas:
+            self.stdout.write(
+                f"{fila['mensajero_id']:>6}  {(fila['mensajero'] or ''):<30}  días {fila['dias']:>3}  "
+                f"entregados {fila['entregados']:>6}  devueltos {fila['devueltos']:>5}  total {fila['total']:>12}"
+            )
+        total = sum((fila['total'] for fila in filas), 0)
+        self.stdout.write(self.style.SUCCESS(f"Total a pagar: {total}"))
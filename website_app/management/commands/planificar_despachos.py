@@ -0,0 +1,54 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from hmpaquetesapp.models import Locacion
+from website_app.service.despacho_service import PlanificadorDespacho
+
+
+class Command(BaseCommand):
+    help = "Agrupa los envíos listos de un almacén por municipio y crea los despachos a mensajeros"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--locacion', type=int, required=True, help="Id del almacén de origen")
+        parser.add_argument('--usuario', required=True, help="Nombre del usuario que registra los despachos (queda en Auditoria)")
+        parser.add_argument('--mensajero', type=int, action='append', dest='mensajeros', default=[],
+                            help="Id de mensajero a asignar por turnos (puede repetirse)")
+        parser.add_argument('--peso-maximo', type=float, help="Kg por carga (por defecto PLANIFICADOR_DESPACHO)")
+        parser.add_argument('--envios-maximos', type=int, help="Envíos por carga (por defecto PLANIFICADOR_DESPACHO)")
+        parser.add_argument('--incluir-sin-domicilio', action='store_true',
+                            help="Incluir envíos sin entrega a domicilio")
+        parser.add_argument('--simular', action='store_true', help="Mostrar el plan sin crear despachos")
+
+    def handle(self, *args, **options):
+        if not Locacion.objects.filter(pk=options['locacion']).exists():
+            raise CommandError(f"No existe la locación {options['locacion']}")
+        usuario = get_user_model().objects.filter(username=options['usuario']).first()
+        if usuario is None:
+            raise CommandError(f"No existe el usuario {options['usuario']}")
+
+        inicio = time.perf_counter()
+        resultado = PlanificadorDespacho.despachar(
+            options['locacion'], usuario,
+            mensajeros=options['mensajeros'],
+            peso_maximo=options['peso_maximo'],
+            envios_maximos=options['envios_maximos'],
+            solo_domicilio=not options['incluir_sin_domicilio'],
+            simular=options['simular'],
+        )
+        duracion = (time.perf_counter() - inicio) * 1000
+
+        cargas = resultado['cargas']
+        for carga in cargas:
+            self.stdout.write(
+                f"  Provincia {carga.provincia_id} / municipio {carga.municipio_id}: "
+                f"{len(carga.envios)} envíos, {carga.peso:.2f} kg"
+            )
+        if resultado['sin_provincia']:
+            self.stdout.write(self.style.WARNING(
+                f"Envíos sin provincia en el domicilio: {len(resultado['sin_provincia'])}"
+            ))
+        accion = "planificadas" if options['simular'] else "despachadas"
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(cargas)} cargas {accion} con {sum(len(c.envios) for c in cargas)} envíos en {duracion:.0f} ms"
+        ))
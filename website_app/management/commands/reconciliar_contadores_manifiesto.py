@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from website_app.service.manifiesto_service import ServicioContadoresManifiesto
+
+
+class Command(BaseCommand):
+    help = "Recalcula los contadores de envíos por estado de los manifiestos a partir de la tabla de envíos"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--manifiesto', type=int, action='append', dest='manifiestos',
+                            help="Id del manifiesto a reconciliar (puede repetirse); por defecto todos")
+
+    def handle(self, *args, **options):
+        desactualizados = ServicioContadoresManifiesto.reconciliar(options['manifiestos'])
+        if desactualizados:
+            self.stdout.write(self.style.WARNING(f"Contadores corregidos: {desactualizados}"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Los contadores estaban al día"))
@@ -0,0 +1,24 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from website_app.service.liquidacion_service import ServicioLiquidacion
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula las liquidaciones diarias de los mensajeros a partir de los items de sus despachos "
+        "y de los envíos archivados. Conserva los días cuyos despachos ya se purgaron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', type=date.fromisoformat, help="Primer día a reconciliar (AAAA-MM-DD); por defecto todos")
+        parser.add_argument('--hasta', type=date.fromisoformat, help="Último día a reconciliar (AAAA-MM-DD)")
+        parser.add_argument('--mensajero', type=int, action='append', dest='mensajeros',
+                            help="Id del mensajero a reconciliar (puede repetirse); por defecto todos")
+
+    def handle(self, *args, **options):
+        desactualizados = ServicioLiquidacion.reconciliar(options['desde'], options['hasta'], options['mensajeros'])
+        if desactualizados:
+            self.stdout.write(self.style.WARNING(f"Liquidaciones corregidas: {desactualizados}"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Las liquidaciones estaban al día"))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from website_app.service.ocupacion_service import ServicioOcupacion
+
+
+class Command(BaseCommand):
+    help = "Reconstruye la ocupación de almacenes a partir del último item de documento de cada envío"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamano-lote', type=int, default=2000, help="Filas por INSERT")
+
+    def handle(self, *args, **options):
+        total = ServicioOcupacion.reconstruir(tamano_lote=options['tamano_lote'])
+        self.stdout.write(self.style.SUCCESS(f"Ocupación reconstruida para {total} envíos"))
+        for locacion_id, cantidad in sorted(ServicioOcupacion.inventario().items()):
+            self.stdout.write(f"  Almacén {locacion_id}: {cantidad} envíos")
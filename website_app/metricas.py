@@ -0,0 +1,150 @@
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from hmpaquetesapp.service.cache_service import en_carga
+
+# Cubetas de los histogramas (segundos y número de consultas)
+CUBETAS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CUBETAS_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+# Máximo de sentencias SQL guardadas por petición para el registro de peticiones lentas
+MAX_SENTENCIAS = 50
+
+# Sentencias de control de transacciones de los atomic() anidados; no cuentan como consultas
+# en los presupuestos (en las pruebas TestCase las multiplica)
+SAVEPOINTS = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+# Medición de la petición en curso; la usan el middleware y el backend de plantillas
+medicion_actual = ContextVar('medicion_actual', default=None)
+
+
+class Medicion:
+    """Acumula consultas, tiempo de base de datos y de plantillas de una petición."""
+
+    __slots__ = ('consultas', 'savepoints', 'cargas', 'tiempo_db', 'tiempo_plantillas', 'sentencias')
+
+    def __init__(self):
+        self.consultas = 0
+        self.savepoints = 0
+        # Consultas de CargaVersionada.obtener (versión y recarga de datos en memoria)
+        self.cargas = 0
+        self.tiempo_db = 0.0
+        self.tiempo_plantillas = 0.0
+        self.sentencias = []
+
+    def __call__(self, execute, sql, params, many, context):
+        """Envoltorio para connection.execute_wrapper."""
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracion = time.perf_counter() - inicio
+            self.consultas += 1
+            if sql.startswith(SAVEPOINTS):
+                self.savepoints += 1
+            elif en_carga.get():
+                self.cargas += 1
+            self.tiempo_db += duracion
+            if len(self.sentencias) < MAX_SENTENCIAS:
+                self.sentencias.append((sql, duracion))
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquetas(etiquetas, extra=''):
+    partes = [f'{clave}="{_escapar(valor)}"' for clave, valor in etiquetas]
+    if extra:
+        partes.append(extra)
+    return '{' + ','.join(partes) + '}' if partes else ''
+
+
+class RegistroMetricas:
+    """
+    Contadores e histogramas en memoria del proceso, expuestos en el formato
+    de texto de Prometheus. Cada worker mantiene su propio registro.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._descripciones = {}
+        self._contadores = {}
+        self._histogramas = {}
+
+    def describir(self, nombre, tipo, ayuda):
+        self._descripciones[nombre] = (tipo, ayuda)
+
+    def incrementar(self, nombre, valor=1, **etiquetas):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            self._contadores[clave] = self._contadores.get(clave, 0) + valor
+
+    def observar(self, nombre, valor, cubetas=CUBETAS_LATENCIA, **etiquetas):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        indice = bisect_left(cubetas, valor)
+        with self._lock:
+            histograma = self._histogramas.get(clave)
+            if histograma is None:
+                # [conteos por cubeta (la última es +Inf), suma, cuenta, cubetas]
+                histograma = self._histogramas[clave] = [[0] * (len(cubetas) + 1), 0.0, 0, cubetas]
+            histograma[0][indice] += 1
+            histograma[1] += valor
+            histograma[2] += 1
+
+    def valor(self, nombre, **etiquetas):
+        """Valor actual de un contador (0 si no existe)."""
+        return self._contadores.get((nombre, tuple(sorted(etiquetas.items()))), 0)
+
+    def limpiar(self):
+        with self._lock:
+            self._contadores.clear()
+            self._histogramas.clear()
+
+    def exponer(self):
+        with self._lock:
+            contadores = sorted(self._contadores.items())
+            histogramas = sorted(
+                (clave, [list(h[0]), h[1], h[2], h[3]]) for clave, h in self._histogramas.items()
+            )
+
+        lineas = []
+        descritos = set()
+
+        def cabecera(nombre, tipo):
+            if nombre in descritos:
+                return
+            descritos.add(nombre)
+            tipo, ayuda = self._descripciones.get(nombre, (tipo, ''))
+            if ayuda:
+                lineas.append(f'# HELP {nombre} {ayuda}')
+            lineas.append(f'# TYPE {nombre} {tipo}')
+
+        for (nombre, etiquetas), valor in contadores:
+            cabecera(nombre, 'counter')
+            lineas.append(f'{nombre}{_etiquetas(etiquetas)} {valor}')
+
+        for (nombre, etiquetas), (conteos, suma, cuenta, cubetas) in histogramas:
+            cabecera(nombre, 'histogram')
+            acumulado = 0
+            for limite, conteo in zip(list(cubetas) + ['+Inf'], conteos):
+                acumulado += conteo
+                le = f'le="{limite}"'
+                lineas.append(f'{nombre}_bucket{_etiquetas(etiquetas, le)} {acumulado}')
+            lineas.append(f'{nombre}_sum{_etiquetas(etiquetas)} {suma}')
+            lineas.append(f'{nombre}_count{_etiquetas(etiquetas)} {cuenta}')
+
+        return '\n'.join(lineas) + '\n'
+
+
+registro = RegistroMetricas()
+
+registro.describir('hm_peticion_duracion_segundos', 'histogram', 'Latencia de la petición por vista')
+registro.describir('hm_peticion_consultas', 'histogram', 'Consultas SQL por petición')
+registro.describir('hm_peticion_db_segundos_total', 'counter', 'Tiempo acumulado en la base de datos')
+registro.describir('hm_peticion_plantillas_segundos_total', 'counter', 'Tiempo acumulado renderizando plantillas')
+registro.describir('hm_respuesta_bytes_total', 'counter', 'Bytes enviados en el cuerpo de las respuestas')
+registro.describir('hm_peticiones_total', 'counter', 'Peticiones atendidas por vista y código HTTP')
+registro.describir('hm_peticiones_lentas_total', 'counter', 'Peticiones por encima del umbral de lentitud')
@@ -0,0 +1,111 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from website_app import perfilado, presupuestos
+from website_app.metricas import CUBETAS_CONSULTAS, Medicion, medicion_actual, registro
+
+logger_lentas = logging.getLogger('website_app.lentas')
+
+
+class MetricasMiddleware:
+    """
+    Registra por vista la latencia, el número de consultas y el tiempo de base de datos,
+    el tiempo de plantillas y el tamaño de la respuesta.
+    Las peticiones que superan METRICAS_UMBRAL_LENTO_MS se registran con su SQL.
+
+    Debe ir primero en MIDDLEWARE para medir la petición completa.
+    En vistas asíncronas las consultas se ejecutan en otros hilos y no se cuentan.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.umbral_lento = getattr(settings, 'METRICAS_UMBRAL_LENTO_MS', 1000) / 1000
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        medicion = Medicion()
+        token = medicion_actual.set(medicion)
+        inicio = time.perf_counter()
+        try:
+            with connection.execute_wrapper(medicion):
+                response = self.get_response(request)
+        finally:
+            medicion_actual.reset(token)
+        duracion = time.perf_counter() - inicio
+
+        self.registrar(request, response, medicion, duracion)
+        return response
+
+    async def __acall__(self, request):
+        medicion = Medicion()
+        token = medicion_actual.set(medicion)
+        inicio = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            medicion_actual.reset(token)
+        duracion = time.perf_counter() - inicio
+
+        self.registrar(request, response, medicion, duracion)
+        return response
+
+    def registrar(self, request, response, medicion, duracion):
+        resolver_match = getattr(request, 'resolver_match', None)
+        # Las rutas sin resolver se agrupan para no crear una serie por URL
+        vista = resolver_match.view_name if resolver_match else 'sin_resolver'
+
+        registro.incrementar('hm_peticiones_total', vista=vista, codigo=response.status_code)
+        registro.observar('hm_peticion_duracion_segundos', duracion, vista=vista)
+        registro.observar('hm_peticion_consultas', medicion.consultas, CUBETAS_CONSULTAS, vista=vista)
+        registro.incrementar('hm_peticion_db_segundos_total', medicion.tiempo_db, vista=vista)
+        if medicion.tiempo_plantillas:
+            registro.incrementar('hm_peticion_plantillas_segundos_total', medicion.tiempo_plantillas, vista=vista)
+        if not response.streaming:
+            registro.incrementar('hm_respuesta_bytes_total', len(response.content), vista=vista)
+
+        if resolver_match:
+            presupuestos.verificar(resolver_match.func, vista, medicion, duracion * 1000)
+
+        if duracion >= self.umbral_lento:
+            registro.incrementar('hm_peticiones_lentas_total', vista=vista)
+            sentencias = '\n'.join(
+                f'  [{tiempo * 1000:.1f} ms] {sql}' for sql, tiempo in medicion.sentencias
+            )
+            logger_lentas.warning(
+                'Petición lenta %s %s (%s): %.0f ms, %d consultas, %.0f ms en BD\n%s',
+                request.method, request.path, vista, duracion * 1000,
+                medicion.consultas, medicion.tiempo_db * 1000, sentencias,
+            )
+
+
+class PerfiladoMiddleware:
+    """
+    Perfila una petición concreta con cProfile y captura de SQL (ver website_app.perfilado).
+    Sin ?perfilar ni cabecera X-Perfilar solo cuesta una búsqueda en un diccionario y otra
+    en la query sin analizar.
+
+    Debe ir después de AuthenticationMiddleware. Las vistas asíncronas no se perfilan.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.asincrono = iscoroutinefunction(self.get_response)
+        if self.asincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.asincrono or not perfilado.solicitado(request):
+            return self.get_response(request)
+        return perfilado.perfilar(self.get_response, request)
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.6 on 2026-10-19 17:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadorManifiesto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('manifiesto_id', models.IntegerField(verbose_name='Manifiesto postal')),
+                ('estado', models.CharField(choices=[('Desaforado', 'Desaforado'), ('No Recibido', 'No Recibido'), ('Recibido', 'Recibido'), ('Enviado', 'Enviado'), ('Entregado', 'Entregado'), ('En Trayecto', 'En Trayecto')], max_length=20, verbose_name='Estado')),
+                ('cantidad', models.IntegerField(default=0, verbose_name='Cantidad de envíos')),
+            ],
+            options={
+                'verbose_name': 'Contador de manifiesto',
+                'verbose_name_plural': 'Contadores de manifiestos',
+                'unique_together': {('manifiesto_id', 'estado')},
+            },
+        ),
+    ]
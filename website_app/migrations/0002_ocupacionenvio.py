@@ -0,0 +1,27 @@
+# Generated by Django 5.0.6 on 2026-10-19 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OcupacionEnvio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('envio_id', models.IntegerField(unique=True, verbose_name='Envío')),
+                ('locacion_id', models.IntegerField(blank=True, db_index=True, null=True, verbose_name='Almacén actual')),
+                ('item_id', models.IntegerField(verbose_name='Último item de documento')),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Ocupación de envío',
+                'verbose_name_plural': 'Ocupación de almacenes',
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.6 on 2026-10-19 17:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website_app', '0002_ocupacionenvio'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TiempoEntrega',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('etapa', models.CharField(choices=[('entrada', 'Entrada en almacén'), ('transferencia', 'Transferencia entre almacenes'), ('despacho', 'Despacho a mensajero')], max_length=20, verbose_name='Etapa')),
+                ('origen_id', models.IntegerField(default=0, verbose_name='Locación de origen')),
+                ('destino_id', models.IntegerField(default=0, verbose_name='Destino')),
+                ('muestras', models.IntegerField(verbose_name='Envíos observados')),
+                ('p50', models.FloatField(verbose_name='Mediana (días)')),
+                ('p80', models.FloatField(verbose_name='Percentil 80 (días)')),
+                ('p95', models.FloatField(verbose_name='Percentil 95 (días)')),
+                ('calculado', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Tiempo de entrega',
+                'verbose_name_plural': 'Tiempos de entrega',
+                'unique_together': {('etapa', 'origen_id', 'destino_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.0.6 on 2026-10-19 17:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website_app', '0003_tiempoentrega'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnvioArchivado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('envio_id', models.IntegerField(unique=True, verbose_name='Envío')),
+                ('no_envio', models.CharField(max_length=30, verbose_name='Número de envío')),
+                ('clave', models.CharField(db_index=True, max_length=30)),
+                ('manifiesto_id', models.IntegerField(verbose_name='Manifiesto postal')),
+                ('fecha_entrega', models.DateField(blank=True, null=True)),
+                ('archivado', models.DateTimeField(auto_now_add=True)),
+                ('datos', models.BinaryField()),
+            ],
+            options={
+                'verbose_name': 'Envío archivado',
+                'verbose_name_plural': 'Envíos archivados',
+            },
+        ),
+    ]
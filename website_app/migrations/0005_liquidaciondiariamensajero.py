@@ -0,0 +1,30 @@
+# Generated by Django 5.0.6 on 2026-10-19 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website_app', '0004_envioarchivado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LiquidacionDiariaMensajero',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mensajero_id', models.IntegerField(verbose_name='Mensajero')),
+                ('fecha', models.DateField(verbose_name='Fecha')),
+                ('entregados', models.IntegerField(default=0, verbose_name='Envíos entregados')),
+                ('devueltos', models.IntegerField(default=0, verbose_name='Envíos devueltos')),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Pago')),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Liquidación diaria de mensajero',
+                'verbose_name_plural': 'Liquidaciones diarias de mensajeros',
+                'unique_together': {('mensajero_id', 'fecha')},
+            },
+        ),
+    ]
@@ -0,0 +1,104 @@
+from django.db import models
+from hmpaquetesapp.models import Envio
+
+# ----------------------------------------------------------------------
+# Tablas propias del sitio web. Referencian a los modelos de hmpaquetesapp
+# (managed=False, sin migraciones) por id en lugar de ForeignKey.
+# ----------------------------------------------------------------------
+
+# Cantidad de envíos por estado de cada manifiesto postal
+class ContadorManifiesto(models.Model):
+    manifiesto_id = models.IntegerField(verbose_name="Manifiesto postal")
+    estado = models.CharField(max_length=20, choices=Envio.ESTADOS_CHOICES, verbose_name="Estado")
+    cantidad = models.IntegerField(default=0, verbose_name="Cantidad de envíos")
+
+    def __str__(self):
+        return f"Manifiesto {self.manifiesto_id} | {self.estado}: {self.cantidad}"
+
+    class Meta:
+        unique_together = ('manifiesto_id', 'estado')
+        verbose_name = "Contador de manifiesto"
+        verbose_name_plural = "Contadores de manifiestos"
+
+
+# Almacén donde se encuentra físicamente cada envío, según su último ItemDocumento
+class OcupacionEnvio(models.Model):
+    envio_id = models.IntegerField(unique=True, verbose_name="Envío")
+    # Nulo si el envío está con un mensajero o ya fue entregado
+    locacion_id = models.IntegerField(null=True, blank=True, db_index=True, verbose_name="Almacén actual")
+    item_id = models.IntegerField(verbose_name="Último item de documento")
+    actualizado = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Envío {self.envio_id} | almacén {self.locacion_id if self.locacion_id else 'ninguno'}"
+
+    class Meta:
+        verbose_name = "Ocupación de envío"
+        verbose_name_plural = "Ocupación de almacenes"
+
+
+# Percentiles de días hasta la entrega desde cada etapa del recorrido (ver calcular_eta)
+class TiempoEntrega(models.Model):
+    ETAPAS_CHOICES = [
+        ('entrada', 'Entrada en almacén'),
+        ('transferencia', 'Transferencia entre almacenes'),
+        ('despacho', 'Despacho a mensajero'),
+    ]
+    etapa = models.CharField(max_length=20, choices=ETAPAS_CHOICES, verbose_name="Etapa")
+    # 0 agrupa todas las locaciones / destinos de la etapa
+    origen_id = models.IntegerField(default=0, verbose_name="Locación de origen")
+    # Locacion destino en transferencias, Provincia destino en entradas y despachos
+    destino_id = models.IntegerField(default=0, verbose_name="Destino")
+    muestras = models.IntegerField(verbose_name="Envíos observados")
+    p50 = models.FloatField(verbose_name="Mediana (días)")
+    p80 = models.FloatField(verbose_name="Percentil 80 (días)")
+    p95 = models.FloatField(verbose_name="Percentil 95 (días)")
+    calculado = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.etapa} {self.origen_id} → {self.destino_id}: p50 {self.p50} días ({self.muestras} envíos)"
+
+    class Meta:
+        unique_together = ('etapa', 'origen_id', 'destino_id')
+        verbose_name = "Tiempo de entrega"
+        verbose_name_plural = "Tiempos de entrega"
+
+
+# Envíos entregados retirados de las tablas de trabajo, con su respuesta de seguimiento
+class EnvioArchivado(models.Model):
+    envio_id = models.IntegerField(unique=True, verbose_name="Envío")
+    no_envio = models.CharField(max_length=30, verbose_name="Número de envío")
+    # no_envio en mayúsculas: shipment_details busca sin distinguir mayúsculas
+    clave = models.CharField(max_length=30, db_index=True)
+    manifiesto_id = models.IntegerField(verbose_name="Manifiesto postal")
+    fecha_entrega = models.DateField(null=True, blank=True)
+    archivado = models.DateTimeField(auto_now_add=True)
+    # JSON comprimido con zlib: respuesta de seguimiento y filas originales del envío y sus items
+    datos = models.BinaryField()
+
+    def __str__(self):
+        return f"Envío archivado {self.no_envio} ({self.fecha_entrega})"
+
+    class Meta:
+        verbose_name = "Envío archivado"
+        verbose_name_plural = "Envíos archivados"
+
+
+# Liquidación de cada mensajero por día de despacho: items confirmados y devueltos y el pago
+# de los confirmados. El reporte de un período suma estas filas en lugar de recorrer ItemDocumento.
+class LiquidacionDiariaMensajero(models.Model):
+    mensajero_id = models.IntegerField(verbose_name="Mensajero")
+    # Fecha local de creación del DespachoMensajero
+    fecha = models.DateField(verbose_name="Fecha")
+    entregados = models.IntegerField(default=0, verbose_name="Envíos entregados")
+    devueltos = models.IntegerField(default=0, verbose_name="Envíos devueltos")
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Pago")
+    actualizado = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Mensajero {self.mensajero_id} {self.fecha}: {self.entregados} entregados, {self.total}"
+
+    class Meta:
+        unique_together = ('mensajero_id', 'fecha')
+        verbose_name = "Liquidación diaria de mensajero"
+        verbose_name_plural = "Liquidaciones diarias de mensajeros"
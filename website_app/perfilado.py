@@ -0,0 +1,260 @@
+"""
+Perfilado bajo demanda de una petición (website_app.middleware.PerfiladoMiddleware).
+
+Una petición se perfila si la pide un usuario staff con ?perfilar=1 o si trae la cabecera
+X-Perfilar con un token firmado (comando firmar_perfilado). La vista corre bajo cProfile y
+cada sentencia SQL se guarda con su duración y la pila de llamadas del proyecto. El informe
+se escribe en PERFILADO_DIRECTORIO, que guarda como máximo PERFILADO_MAX_INFORMES archivos:
+al escribir uno nuevo se borran los más antiguos. El resumen de cada informe se guarda
+además en indice.json, que es lo que lee el listado de perfiles.
+"""
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+import traceback
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core import signing
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+PARAMETRO = 'perfilar'
+CABECERA = 'HTTP_X_PERFILAR'
+SAL_FIRMA = 'website_app.perfilado'
+
+# Líneas del informe de cProfile y marcos de pila guardados por sentencia
+LINEAS_PERFIL = 80
+MARCOS_PILA = 8
+
+# Solo un perfilador puede estar activo a la vez en el intérprete
+_lock = threading.Lock()
+
+_NOMBRE_VALIDO = re.compile(r'^[0-9]+-[A-Za-z0-9_-]+\.json$')
+
+INDICE = 'indice.json'
+# Campos del informe que se copian al índice
+CAMPOS_RESUMEN = ('fecha', 'metodo', 'ruta', 'usuario', 'estado', 'duracion_ms', 'consultas', 'db_ms')
+
+
+def directorio():
+    return os.fspath(getattr(settings, 'PERFILADO_DIRECTORIO', settings.DATOS_DIRECTORIO / 'perfiles'))
+
+
+def firmar():
+    """Token para la cabecera X-Perfilar; caduca a los PERFILADO_FIRMA_SEGUNDOS."""
+    return signing.TimestampSigner(salt=SAL_FIRMA).sign(str(int(time.time())))
+
+
+def firma_valida(token):
+    maximo = getattr(settings, 'PERFILADO_FIRMA_SEGUNDOS', 300)
+    try:
+        signing.TimestampSigner(salt=SAL_FIRMA).unsign(token, max_age=maximo)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def solicitado(request):
+    """
+    Indica si la petición pide perfilarse. Sin la cabecera ni el texto del parámetro en la
+    query no se verifica ninguna firma, no se arma request.GET ni se toca request.user.
+    """
+    token = request.META.get(CABECERA)
+    if token is not None:
+        return firma_valida(token)
+    if PARAMETRO not in request.META.get('QUERY_STRING', '') or PARAMETRO not in request.GET:
+        return False
+    usuario = getattr(request, 'user', None)
+    return bool(usuario is not None and usuario.is_staff)
+
+
+def _pila():
+    """Marcos del proyecto (sin Django ni dependencias) que llevaron a la sentencia."""
+    base = os.fspath(settings.BASE_DIR)
+    marcos = [
+        f'{os.path.relpath(marco.filename, base)}:{marco.lineno} en {marco.name}'
+        for marco in traceback.extract_stack()[:-3]
+        if marco.filename.startswith(base) and 'site-packages' not in marco.filename
+        and not marco.filename.endswith(('perfilado.py', 'middleware.py'))
+    ]
+    return marcos[-MARCOS_PILA:]
+
+
+class CapturaSQL:
+    """Envoltorio para connection.execute_wrapper que guarda cada sentencia con su pila."""
+
+    def __init__(self, maximo):
+        self.maximo = maximo
+        self.sentencias = []
+        self.omitidas = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracion = time.perf_counter() - inicio
+            if len(self.sentencias) < self.maximo:
+                self.sentencias.append({
+                    'sql': sql,
+                    'parametros': repr(params)[:500],
+                    'ms': round(duracion * 1000, 3),
+                    'pila': _pila(),
+                })
+            else:
+                self.omitidas += 1
+
+
+class Perfilador:
+    """Ejecuta la petición bajo cProfile y CapturaSQL y arma el informe."""
+
+    def __init__(self):
+        self.perfil = cProfile.Profile()
+        self.captura = CapturaSQL(getattr(settings, 'PERFILADO_MAX_CONSULTAS', 500))
+        self.duracion = 0.0
+
+    def ejecutar(self, get_response, request):
+        inicio = time.perf_counter()
+        with connection.execute_wrapper(self.captura):
+            self.perfil.enable()
+            try:
+                return get_response(request)
+            finally:
+                self.perfil.disable()
+                self.duracion = time.perf_counter() - inicio
+
+    def informe(self, request, response):
+        salida = io.StringIO()
+        estadisticas = pstats.Stats(self.perfil, stream=salida)
+        estadisticas.strip_dirs().sort_stats('cumulative').print_stats(LINEAS_PERFIL)
+        sentencias = self.captura.sentencias
+        usuario = getattr(request, 'user', None)
+        return {
+            'fecha': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'metodo': request.method,
+            'ruta': request.get_full_path(),
+            'usuario': usuario.get_username() if usuario is not None and usuario.is_authenticated else None,
+            'estado': response.status_code,
+            'duracion_ms': round(self.duracion * 1000, 3),
+            'consultas': len(sentencias) + self.captura.omitidas,
+            'consultas_omitidas': self.captura.omitidas,
+            'db_ms': round(sum(sentencia['ms'] for sentencia in sentencias), 3),
+            'sentencias': sentencias,
+            'perfil': salida.getvalue(),
+        }
+
+
+def _escribir(ruta_base, nombre, datos):
+    """Escribe el JSON en un temporal y lo publica con os.replace: nunca se lee a medias."""
+    temporal = os.path.join(ruta_base, f'.{nombre}.{os.getpid()}.tmp')
+    with open(temporal, 'w', encoding='utf-8') as archivo:
+        json.dump(datos, archivo, ensure_ascii=False)
+    os.replace(temporal, os.path.join(ruta_base, nombre))
+
+
+def _leer_indice():
+    try:
+        with open(os.path.join(directorio(), INDICE), encoding='utf-8') as archivo:
+            return json.load(archivo)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def guardar(informe):
+    """
+    Escribe el informe en el directorio, borra los más antiguos por encima del máximo
+    y actualiza el índice con su resumen.
+
+    Returns:
+        nombre del archivo del informe
+    """
+    ruta_base = directorio()
+    os.makedirs(ruta_base, exist_ok=True)
+    ruta_url = re.sub(r'[^A-Za-z0-9_-]+', '_', informe['ruta'].split('?')[0]).strip('_')[:60] or 'raiz'
+    nombre = f'{time.time_ns()}-{ruta_url}.json'
+    _escribir(ruta_base, nombre, informe)
+
+    maximo = getattr(settings, 'PERFILADO_MAX_INFORMES', 50)
+    nombres = listar()
+    for antiguo in nombres[maximo:]:
+        try:
+            os.remove(os.path.join(ruta_base, antiguo))
+        except FileNotFoundError:
+            # Otro worker lo borró primero
+            pass
+
+    # Dos workers a la vez pueden pisarse el índice: resumenes() relee lo que falte
+    indice = _leer_indice()
+    indice[nombre] = {campo: informe[campo] for campo in CAMPOS_RESUMEN}
+    _escribir(ruta_base, INDICE, {
+        guardado: indice[guardado] for guardado in nombres[:maximo] if guardado in indice
+    })
+    return nombre
+
+
+def listar():
+    """Nombres de los informes guardados, del más reciente al más antiguo."""
+    try:
+        nombres = os.listdir(directorio())
+    except FileNotFoundError:
+        return []
+    # El prefijo en nanosegundos ordena los informes por fecha
+    return sorted((nombre for nombre in nombres if _NOMBRE_VALIDO.match(nombre)), reverse=True)
+
+
+def resumenes():
+    """
+    Resumen de cada informe guardado (CAMPOS_RESUMEN y 'nombre'), del más reciente
+    al más antiguo. Sale del índice; solo se abre el informe si falta en él.
+    """
+    indice = _leer_indice()
+    resultado = []
+    for nombre in listar():
+        resumen = indice.get(nombre)
+        if resumen is None:
+            informe = leer(nombre)
+            if informe is None:
+                continue
+            resumen = {campo: informe.get(campo) for campo in CAMPOS_RESUMEN}
+        resultado.append({**resumen, 'nombre': nombre})
+    return resultado
+
+
+def leer(nombre):
+    """Informe guardado, o None si el nombre no es válido o ya se descartó."""
+    if not _NOMBRE_VALIDO.match(nombre):
+        return None
+    try:
+        with open(os.path.join(directorio(), nombre), encoding='utf-8') as archivo:
+            return json.load(archivo)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def perfilar(get_response, request):
+    """
+    Atiende la petición perfilada y guarda su informe.
+    Si ya hay otra petición perfilándose, esta se atiende sin perfilar.
+    """
+    if not _lock.acquire(blocking=False):
+        response = get_response(request)
+        response['X-Perfil'] = 'ocupado'
+        return response
+    try:
+        perfilador = Perfilador()
+        response = perfilador.ejecutar(get_response, request)
+    finally:
+        _lock.release()
+    try:
+        response['X-Perfil'] = guardar(perfilador.informe(request, response))
+    except OSError:
+        logger.exception('No se pudo guardar el perfil de %s', request.path)
+    return response
@@ -0,0 +1,33 @@
+import time
+
+from django.template.backends.django import DjangoTemplates, Template
+from website_app.metricas import medicion_actual
+
+
+class PlantillaMedida(Template):
+    """Plantilla que suma su tiempo de renderizado a la medición de la petición."""
+
+    def render(self, context=None, request=None):
+        medicion = medicion_actual.get()
+        if medicion is None:
+            return super().render(context, request)
+        inicio = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            medicion.tiempo_plantillas += time.perf_counter() - inicio
+
+
+class DjangoTemplatesMedidas(DjangoTemplates):
+    """
+    Backend de plantillas de Django que devuelve PlantillaMedida.
+    Solo se mide la plantilla de nivel superior; los include y extends
+    se renderizan dentro de ella.
+    """
+
+    def from_string(self, template_code):
+        return PlantillaMedida(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        plantilla = super().get_template(template_name)
+        return PlantillaMedida(plantilla.template, self)
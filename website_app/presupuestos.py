@@ -0,0 +1,67 @@
+"""
+Presupuestos de consultas y latencia por vista.
+
+Cada vista de website_app/urls.py declara el suyo con el decorador presupuesto.
+En producción MetricasMiddleware compara cada petición con él y, si lo supera, lo registra
+en el logger 'website_app.presupuestos' y en la métrica hm_presupuesto_excedido_total.
+En las pruebas (website_app.tests.PruebasPresupuesto) falla si se supera.
+"""
+import logging
+from dataclasses import dataclass
+
+from website_app.metricas import registro
+
+logger = logging.getLogger(__name__)
+
+registro.describir('hm_presupuesto_excedido_total', 'counter', 'Peticiones por encima del presupuesto de su vista')
+
+
+@dataclass(frozen=True)
+class Presupuesto:
+    consultas: int
+    # None en vistas de streaming, donde la duración depende del cliente
+    latencia_ms: float = None
+
+    def excesos(self, consultas, duracion_ms):
+        """Lista de (tipo, valor, límite) de los límites superados."""
+        excesos = []
+        if consultas > self.consultas:
+            excesos.append(('consultas', consultas, self.consultas))
+        if self.latencia_ms is not None and duracion_ms > self.latencia_ms:
+            excesos.append(('latencia', round(duracion_ms, 1), self.latencia_ms))
+        return excesos
+
+
+def presupuesto(consultas, latencia_ms=None):
+    """
+    Declara el máximo de consultas SQL y la latencia objetivo (ms) de una vista.
+    Las consultas incluyen las del middleware (sesión y usuario en las vistas de staff),
+    pero no las de los datos en memoria de cada proceso (CargaVersionada): un worker recién
+    iniciado o que ve una versión nueva no supera el presupuesto por recargarlos.
+    """
+    def decorador(vista):
+        vista.presupuesto = Presupuesto(consultas, latencia_ms)
+        return vista
+    return decorador
+
+
+def de_vista(vista):
+    return getattr(vista, 'presupuesto', None)
+
+
+def consultas_de(medicion):
+    """Consultas de una Medicion que cuentan para el presupuesto: sin savepoints ni cargas en memoria."""
+    return medicion.consultas - medicion.savepoints - medicion.cargas
+
+
+def verificar(vista, nombre, medicion, duracion_ms):
+    """Registra y cuenta los excesos de una petición atendida en producción."""
+    limite = de_vista(vista)
+    if limite is None:
+        return
+    for tipo, valor, maximo in limite.excesos(consultas_de(medicion), duracion_ms):
+        registro.incrementar('hm_presupuesto_excedido_total', vista=nombre, tipo=tipo)
+        logger.warning(
+            'Presupuesto de %s excedido en %s: %s > %s', tipo, nombre, valor, maximo,
+            extra={'campos': {'vista': nombre, 'tipo': tipo, 'valor': valor, 'limite': maximo}},
+        )
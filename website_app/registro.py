@@ -0,0 +1,119 @@
+"""
+Utilidades de logging para las rutas de petición (configuradas en settings.LOGGING).
+
+- ManejadorCola: QueueHandler que encola el registro sin formatearlo; el formateo y la
+  escritura ocurren en el hilo de OyenteCola, fuera de la petición. La cola es acotada
+  (LOGGING 'queue' con maxsize): si el hilo no da abasto se descartan registros en lugar
+  de crecer sin límite. Tras un fork (gunicorn --preload) cada hijo crea su propia cola
+  y arranca su propio oyente, porque el hilo del padre no existe en el hijo.
+- FiltroMuestreo: deja pasar solo una fracción de los registros por logger.
+- FormateadorEstructurado: añade los campos de extra={'campos': {...}} como clave=valor.
+
+Uso en las vistas (formateo diferido con %, nunca f-strings):
+
+    logger.info('Historial consultado', extra={'campos': {'codigo': cod, 'eventos': len(historial)}})
+    logger.debug('Historial completo para %s: %s', cod, historial)
+"""
+import atexit
+import copy
+import logging
+import os
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+
+
+class ManejadorCola(QueueHandler):
+    """
+    A diferencia de QueueHandler, no formatea el mensaje en el hilo que registra:
+    la cola es local al proceso y el registro viaja con msg y args intactos.
+    Los argumentos no deben modificarse después de llamar al logger.
+    """
+
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.descartados = 0
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._tras_fork)
+
+    def _tras_fork(self):
+        # La cola del padre puede quedar con su lock tomado y su oyente no existe aquí
+        self.queue = type(self.queue)(self.queue.maxsize)
+        self.descartados = 0
+        oyente = getattr(self, 'listener', None)
+        if oyente is not None:
+            oyente.queue = self.queue
+            oyente._thread = None
+            oyente.start()
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Perder un registro es preferible a bloquear la petición o agotar la memoria
+            self.descartados += 1
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        if record.exc_info:
+            # El traceback se serializa ahora porque los frames pueden cambiar
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class OyenteCola(QueueListener):
+    """QueueListener que arranca al crearse y se detiene al terminar el proceso."""
+
+    def __init__(self, queue, *handlers, respect_handler_level=False):
+        super().__init__(queue, *handlers, respect_handler_level=respect_handler_level)
+        self.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        # atexit puede llamarlo después de una parada explícita
+        if self._thread is not None:
+            super().stop()
+
+
+class FiltroMuestreo(logging.Filter):
+    """
+    Deja pasar una fracción de los registros según el logger que los emite.
+    Se aplica la tasa del prefijo más largo que coincida; WARNING y superiores siempre pasan.
+
+    Args:
+        tasas: dict {nombre_logger: fracción entre 0 y 1}
+    """
+
+    def __init__(self, tasas=None):
+        super().__init__()
+        self.tasas = sorted((tasas or {}).items(), key=lambda tasa: len(tasa[0]), reverse=True)
+        self._por_logger = {}
+
+    def _tasa(self, nombre):
+        tasa = self._por_logger.get(nombre)
+        if tasa is None:
+            tasa = 1.0
+            for prefijo, valor in self.tasas:
+                if nombre == prefijo or nombre.startswith(prefijo + '.'):
+                    tasa = valor
+                    break
+            self._por_logger[nombre] = tasa
+        return tasa
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        tasa = self._tasa(record.name)
+        return tasa >= 1.0 or random.random() < tasa
+
+
+class FormateadorEstructurado(logging.Formatter):
+    """Añade al mensaje los campos estructurados del registro como clave=valor."""
+
+    def formatMessage(self, record):
+        mensaje = super().formatMessage(record)
+        campos = getattr(record, 'campos', None)
+        if not campos:
+            return mensaje
+        return mensaje + ' ' + ' '.join(f'{clave}={valor!r}' for clave, valor in campos.items())
@@ -0,0 +1,184 @@
+import json
+import logging
+import zlib
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from hmpaquetesapp.models import Envio, ItemDocumento
+from website_app.models import EnvioArchivado
+from website_app.service.seguimiento_service import ServicioSeguimiento
+
+logger = logging.getLogger(__name__)
+
+
+class ServicioArchivo:
+    @staticmethod
+    def comprimir(datos):
+        return zlib.compress(json.dumps(datos, cls=DjangoJSONEncoder, separators=(',', ':')).encode('utf-8'))
+
+    @staticmethod
+    def descomprimir(datos):
+        return json.loads(zlib.decompress(bytes(datos)).decode('utf-8'))
+
+    @staticmethod
+    def candidatos(dias=None):
+        """Envíos entregados hace más de dias (por defecto ARCHIVO_DIAS_ENTREGADO) que aún no se archivaron."""
+        if dias is None:
+            dias = getattr(settings, 'ARCHIVO_DIAS_ENTREGADO', 365)
+        limite = timezone.localdate() - timedelta(days=dias)
+        return Envio.objects.filter(estado='Entregado', fecha_entrega__lt=limite).exclude(
+            pk__in=EnvioArchivado.objects.values('envio_id')
+        )
+
+    @staticmethod
+    @transaction.atomic
+    def archivar_lote(envio_ids):
+        """
+        Guarda la respuesta de seguimiento y las filas de los envíos en EnvioArchivado.
+        Los envíos que ya no estén entregados o ya estén archivados se omiten.
+
+        Solo copia: las filas de Envio e ItemDocumento siguen en las tablas de trabajo hasta
+        que se ejecute purgar(). Una vez purgado el envío, shipment_details responde desde el archivo.
+
+        Returns:
+            cantidad de envíos archivados
+        """
+        envios = list(
+            ServicioSeguimiento.envios().filter(pk__in=list(envio_ids), estado='Entregado')
+            .exclude(pk__in=EnvioArchivado.objects.values('envio_id')).order_by('pk')
+        )
+        if not envios:
+            return 0
+        ids = [envio.pk for envio in envios]
+
+        items = defaultdict(list)
+        for item in ServicioSeguimiento.items(ids):
+            items[item.envio_id].append(item)
+        filas_items = defaultdict(list)
+        for fila in ItemDocumento.objects.filter(envio_id__in=ids).order_by('pk').values():
+            filas_items[fila['envio_id']].append(fila)
+        filas_envios = {fila['id']: fila for fila in Envio.objects.filter(pk__in=ids).values()}
+
+        EnvioArchivado.objects.bulk_create([
+            EnvioArchivado(
+                envio_id=envio.pk,
+                no_envio=envio.no_envio,
+                clave=envio.no_envio.upper(),
+                manifiesto_id=envio.manifiesto_id,
+                fecha_entrega=envio.fecha_entrega,
+                datos=ServicioArchivo.comprimir({
+                    'respuesta': ServicioSeguimiento.respuesta(envio, items[envio.pk]),
+                    'envio': filas_envios[envio.pk],
+                    'items': filas_items[envio.pk],
+                }),
+            )
+            for envio in envios
+        ], batch_size=500, ignore_conflicts=True)
+        return len(envios)
+
+    @staticmethod
+    def archivar(dias=None, tamano_lote=500, max_lotes=None):
+        """
+        Archiva los envíos entregados hace más de dias en lotes de tamano_lote,
+        cada uno en su propia transacción.
+
+        Returns:
+            cantidad de envíos archivados
+        """
+        candidatos = ServicioArchivo.candidatos(dias).order_by('pk')
+        ultimo_pk = 0
+        total = 0
+        lotes = 0
+        while max_lotes is None or lotes < max_lotes:
+            ids = list(candidatos.filter(pk__gt=ultimo_pk).values_list('pk', flat=True)[:tamano_lote])
+            if not ids:
+                break
+            total += ServicioArchivo.archivar_lote(ids)
+            ultimo_pk = ids[-1]
+            lotes += 1
+        logger.info('Envíos archivados', extra={'campos': {'envios': total, 'lotes': lotes}})
+        return total
+
+    @staticmethod
+    def verificar(archivado, items_actuales):
+        """
+        Indica si el archivo del envío se puede leer y contiene todos sus items actuales.
+        Si el envío cambió después de archivarlo (un item nuevo), no se debe purgar.
+        """
+        try:
+            datos = ServicioArchivo.descomprimir(archivado.datos)
+        except (zlib.error, ValueError):
+            return False
+        return (
+            'respuesta' in datos
+            and datos.get('envio', {}).get('id') == archivado.envio_id
+            and {fila['id'] for fila in datos.get('items', [])} == items_actuales
+        )
+
+    @staticmethod
+    @transaction.atomic
+    def purgar_lote(envio_ids):
+        """
+        Borra de Envio e ItemDocumento los envíos del lote cuyo archivo se verificó
+        (ver verificar). Los que no estén archivados, ya no estén entregados o no pasen
+        la verificación se conservan.
+
+        Returns:
+            cantidad de envíos purgados
+        """
+        archivados = EnvioArchivado.objects.filter(
+            envio_id__in=Envio.objects.filter(pk__in=list(envio_ids), estado='Entregado').values('pk')
+        )
+        items = defaultdict(set)
+        for item_id, envio_id in ItemDocumento.objects.filter(
+            envio_id__in=[archivado.envio_id for archivado in archivados]
+        ).values_list('pk', 'envio_id'):
+            items[envio_id].add(item_id)
+
+        ids = []
+        for archivado in archivados:
+            if ServicioArchivo.verificar(archivado, items[archivado.envio_id]):
+                ids.append(archivado.envio_id)
+            else:
+                logger.warning('Archivo de envío no verificado, no se purga', extra={'campos': {'envio': archivado.envio_id}})
+        if ids:
+            ItemDocumento.objects.filter(envio_id__in=ids).delete()
+            Envio.objects.filter(pk__in=ids).delete()
+        return len(ids)
+
+    @staticmethod
+    def purgar(tamano_lote=500, max_lotes=None):
+        """
+        Purga en lotes de tamano_lote, cada uno en su propia transacción, los envíos
+        archivados que siguen en las tablas de trabajo.
+
+        Returns:
+            cantidad de envíos purgados
+        """
+        archivados = EnvioArchivado.objects.filter(
+            envio_id__in=Envio.objects.values('pk')
+        ).order_by('envio_id')
+        ultimo_id = 0
+        total = 0
+        lotes = 0
+        while max_lotes is None or lotes < max_lotes:
+            ids = list(archivados.filter(envio_id__gt=ultimo_id).values_list('envio_id', flat=True)[:tamano_lote])
+            if not ids:
+                break
+            total += ServicioArchivo.purgar_lote(ids)
+            ultimo_id = ids[-1]
+            lotes += 1
+        logger.info('Envíos purgados', extra={'campos': {'envios': total, 'lotes': lotes}})
+        return total
+
+    @staticmethod
+    def respuesta(cod):
+        """Respuesta de seguimiento archivada para el código, o None si no está archivado."""
+        datos = EnvioArchivado.objects.filter(clave=cod.upper()).values_list('datos', flat=True).first()
+        if datos is None:
+            return None
+        return ServicioArchivo.descomprimir(datos)['respuesta']
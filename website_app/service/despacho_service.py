@@ -0,0 +1,193 @@
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from hmpaquetesapp.models import Auditoria, DespachoMensajero, Envio, ItemDocumento
+from hmpaquetesapp.service.item_documento_service import items_despacho_actualizados
+from website_app.models import OcupacionEnvio
+
+class Carga:
+    """Envíos de un mismo municipio asignados a un despacho."""
+
+    __slots__ = ('provincia_id', 'municipio_id', 'envios', 'peso')
+
+    def __init__(self, provincia_id, municipio_id):
+        self.provincia_id = provincia_id
+        self.municipio_id = municipio_id
+        self.envios = []
+        self.peso = 0.0
+
+    def agregar(self, envio_id, peso):
+        self.envios.append(envio_id)
+        self.peso += peso
+
+    def __repr__(self):
+        return f"Carga(municipio={self.municipio_id}, envios={len(self.envios)}, peso={self.peso:.2f})"
+
+
+class PlanificadorDespacho:
+    @staticmethod
+    def limites():
+        configuracion = settings.PLANIFICADOR_DESPACHO
+        return float(configuracion['PESO_MAXIMO']), int(configuracion['ENVIOS_MAXIMOS'])
+
+    @staticmethod
+    def empaquetar(envios, provincia_id, municipio_id, peso_maximo, envios_maximos):
+        """
+        Reparte envíos de un municipio en cargas con best fit decreasing: cada envío, del más
+        pesado al más liviano, va a la carga abierta con menos capacidad libre que aún lo admite.
+        Las capacidades libres se mantienen ordenadas, así que cada envío cuesta O(log n).
+        Un envío más pesado que peso_maximo ocupa una carga propia.
+
+        Args:
+            envios: lista de (envio_id, peso)
+
+        Returns:
+            lista de Carga
+        """
+        cargas = []
+        # (capacidad_libre, índice de carga) de las cargas que aún admiten envíos
+        abiertas = []
+        for envio_id, peso in sorted(envios, key=lambda envio: (-envio[1], envio[0])):
+            posicion = bisect_left(abiertas, (peso, -1))
+            if posicion < len(abiertas):
+                libre, indice = abiertas.pop(posicion)
+                carga = cargas[indice]
+            else:
+                indice = len(cargas)
+                carga = Carga(provincia_id, municipio_id)
+                cargas.append(carga)
+                libre = peso_maximo
+            carga.agregar(envio_id, peso)
+            libre -= peso
+            if len(carga.envios) < envios_maximos and libre > 0:
+                insort(abiertas, (libre, indice))
+        return cargas
+
+    @staticmethod
+    def candidatos(locacion_id, solo_domicilio=True):
+        """Envíos recibidos que están en el almacén, listos para despachar."""
+        envios = Envio.objects.filter(
+            estado='Recibido',
+            pk__in=OcupacionEnvio.objects.filter(locacion_id=locacion_id).values('envio_id'),
+        )
+        if solo_domicilio:
+            envios = envios.filter(entrega_domicilio=True)
+        return envios
+
+    @staticmethod
+    def planificar(envios, peso_maximo=None, envios_maximos=None):
+        """
+        Agrupa por municipio del domicilio del destinatario y empaqueta cada grupo.
+        Los envíos sin provincia en el domicilio no se pueden despachar y se devuelven aparte.
+
+        Args:
+            envios: iterable de (envio_id, peso, provincia_id, municipio_id)
+
+        Returns:
+            (lista de Carga, lista de envio_id sin provincia)
+        """
+        limite_peso, limite_envios = PlanificadorDespacho.limites()
+        peso_maximo = peso_maximo or limite_peso
+        envios_maximos = envios_maximos or limite_envios
+
+        grupos = defaultdict(list)
+        sin_provincia = []
+        for envio_id, peso, provincia_id, municipio_id in envios:
+            if provincia_id is None:
+                sin_provincia.append(envio_id)
+                continue
+            grupos[(provincia_id, municipio_id)].append((envio_id, float(peso or 0)))
+
+        cargas = []
+        for (provincia_id, municipio_id), grupo in sorted(grupos.items(), key=lambda g: (g[0][0], g[0][1] or 0)):
+            cargas.extend(PlanificadorDespacho.empaquetar(grupo, provincia_id, municipio_id, peso_maximo, envios_maximos))
+        return cargas, sin_provincia
+
+    @staticmethod
+    @transaction.atomic
+    def despachar(locacion_id, usuario, mensajeros=(), peso_maximo=None, envios_maximos=None,
+                  solo_domicilio=True, simular=False, ip=None):
+        """
+        Planifica los envíos listos del almacén y crea un DespachoMensajero por carga, con sus
+        ItemDocumento, en inserciones masivas. Los envíos pasan a 'Enviado' con un UPDATE.
+        En Auditoria se registra cada despacho y el cambio de estado de cada envío, como en
+        ServicioItemDocumento.
+
+        Args:
+            usuario: User que registra los despachos
+            mensajeros: ids de Mensajero asignados a las cargas por turnos (sin asignar si está vacío)
+            simular: solo planificar, sin escribir
+
+        Returns:
+            dict con 'cargas' (lista de Carga), 'sin_provincia' y 'despachos' (ids creados)
+        """
+        # Se bloquean solo los envíos: con values_list y joins, FOR UPDATE OF no se aplica
+        # y se bloquearían también destinatarios, contactos y domicilios
+        bloqueados = list(
+            PlanificadorDespacho.candidatos(locacion_id, solo_domicilio).select_for_update()
+            .order_by('pk').values_list('pk', flat=True)
+        )
+        filas = Envio.objects.filter(pk__in=bloqueados).order_by('pk').values_list(
+            'pk', 'peso',
+            'destinatario__contacto__domicilio__provincia__pk',
+            'destinatario__contacto__domicilio__municipio_id',
+        )
+        cargas, sin_provincia = PlanificadorDespacho.planificar(filas, peso_maximo, envios_maximos)
+        resultado = {'cargas': cargas, 'sin_provincia': sin_provincia, 'despachos': []}
+        if simular or not cargas:
+            return resultado
+
+        mensajeros = list(mensajeros)
+        despachos = DespachoMensajero.objects.bulk_create([
+            DespachoMensajero(
+                locacion_origen_id=locacion_id,
+                provincia_id=carga.provincia_id,
+                mensajero_id=mensajeros[indice % len(mensajeros)] if mensajeros else None,
+                usuario=usuario.get_username()[:30],
+            )
+            for indice, carga in enumerate(cargas)
+        ])
+        tipo_despacho = ContentType.objects.get_for_model(DespachoMensajero)
+        items = ItemDocumento.objects.bulk_create(
+            [
+                ItemDocumento(documento_type=tipo_despacho, documento_id=despacho.pk, envio_id=envio_id)
+                for despacho, carga in zip(despachos, cargas)
+                for envio_id in carga.envios
+            ],
+            batch_size=1000,
+        )
+
+        envio_ids = [envio_id for carga in cargas for envio_id in carga.envios]
+        envios = list(
+            Envio.objects.filter(pk__in=envio_ids).values_list('pk', 'no_envio', 'manifiesto_id', 'estado')
+        )
+        Envio.objects.filter(pk__in=envio_ids).update(estado='Enviado')
+
+        tipo_envio = ContentType.objects.get_for_model(Envio)
+        Auditoria.objects.bulk_create(
+            [
+                Auditoria(
+                    usuario=usuario, accion=Auditoria.Accion.DESPACHO, ip=ip,
+                    content_type=tipo_despacho, object_id=despacho.pk,
+                )
+                for despacho in despachos
+            ] + [
+                Auditoria(
+                    usuario=usuario, accion=Auditoria.Accion.CAMBIO_ESTADO_ENVIO, ip=ip,
+                    content_type=tipo_envio, object_id=pk,
+                )
+                for pk, _, _, estado in envios if estado != 'Enviado'
+            ],
+            batch_size=1000,
+        )
+
+        # bulk_create no emite señales: se notifican los cambios en bloque
+        items_despacho_actualizados.send(
+            sender=ItemDocumento, accion='despachar', items=[item.pk for item in items],
+            envios=[(pk, no_envio, manifiesto_id, estado, 'Enviado') for pk, no_envio, manifiesto_id, estado in envios],
+        )
+        resultado['despachos'] = [despacho.pk for despacho in despachos]
+        return resultado
@@ -0,0 +1,235 @@
+import logging
+import math
+import random
+import threading
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+from hmpaquetesapp.models import DespachoMensajero, EntradaRecibida, ItemDocumento, Locacion, TransferenciaAlmacen
+from hmpaquetesapp.service.cache_service import CargaVersionada
+from website_app.models import TiempoEntrega
+
+logger = logging.getLogger(__name__)
+
+PERCENTILES = (50, 80, 95)
+# Por debajo de estas muestras se usa la clave más general de la etapa
+MIN_MUESTRAS = 5
+# Tamaño del reservorio por clave: acota la memoria del cálculo nocturno
+MAX_MUESTRAS = 1000
+
+# tipo de documento -> (etapa, modelo, campos (fecha, origen, destino))
+DOCUMENTOS = {
+    'entradarecibida': ('entrada', EntradaRecibida, ('fecha_creacion', 'locacion_origen_id')),
+    'transferenciaalmacen': ('transferencia', TransferenciaAlmacen, ('fecha_creacion', 'locacion_origen_id', 'locacion_destino_id')),
+    'despachomensajero': ('despacho', DespachoMensajero, ('fecha_creacion', 'locacion_origen_id', 'provincia_id')),
+}
+
+
+class Reservorio:
+    """Muestra uniforme de tamaño fijo sobre un flujo de duraciones (algoritmo R)."""
+
+    __slots__ = ('vistos', 'muestra')
+
+    def __init__(self):
+        self.vistos = 0
+        self.muestra = []
+
+    def agregar(self, valor, capacidad, aleatorio):
+        self.vistos += 1
+        if len(self.muestra) < capacidad:
+            self.muestra.append(valor)
+        else:
+            indice = aleatorio.randrange(self.vistos)
+            if indice < capacidad:
+                self.muestra[indice] = valor
+
+    def percentiles(self):
+        ordenados = sorted(self.muestra)
+        return tuple(
+            float(ordenados[max(0, math.ceil(porcentaje / 100 * len(ordenados)) - 1)])
+            for porcentaje in PERCENTILES
+        )
+
+
+class MotorEta(CargaVersionada):
+    """
+    Tabla de percentiles de TiempoEntrega en memoria: la estimación por petición es una
+    búsqueda en un diccionario. Se recarga cuando calcular_eta publica una versión nueva
+    (ver CargaVersionada).
+    """
+
+    CLAVE_VERSION = 'tiempos_entrega:version'
+
+    _actual = None
+    _lock = threading.Lock()
+
+    def __init__(self, filas, version=0):
+        """
+        Args:
+            filas: iterable de (etapa, origen_id, destino_id, muestras, p50, p80, p95)
+        """
+        self.version = version
+        self._tabla = {
+            (etapa, origen_id, destino_id): (p50, p80, p95)
+            for etapa, origen_id, destino_id, muestras, p50, p80, p95 in filas
+            if muestras >= MIN_MUESTRAS
+        }
+
+    @classmethod
+    def cargar(cls, version=0):
+        return cls(
+            TiempoEntrega.objects.values_list('etapa', 'origen_id', 'destino_id', 'muestras', 'p50', 'p80', 'p95'),
+            version,
+        )
+
+    def percentiles(self, etapa, origen_id, destino_id):
+        """Percentiles de la clave más específica con muestras suficientes, o None."""
+        for clave in ((etapa, origen_id or 0, destino_id or 0), (etapa, origen_id or 0, 0), (etapa, 0, 0)):
+            percentiles = self._tabla.get(clave)
+            if percentiles is not None:
+                return percentiles
+        return None
+
+    def dias_restantes(self, etapa, origen_id, destino_id, fecha, ahora=None):
+        """
+        Días que faltan para la entrega de un envío que entró en la etapa en fecha.
+        Si ya pasó la mediana se usa el siguiente percentil que todavía no se alcanzó.
+
+        Returns:
+            entero >= 1, o None si no hay historial para la etapa
+        """
+        percentiles = self.percentiles(etapa, origen_id, destino_id)
+        if percentiles is None:
+            return None
+        transcurridos = (timezone.localdate(ahora) - timezone.localtime(fecha).date()).days
+        for dias in percentiles:
+            if dias > transcurridos:
+                return max(1, math.ceil(dias - transcurridos))
+        return 1
+
+
+class ServicioEta:
+    @staticmethod
+    def anotar_destino(queryset):
+        """Anota en un queryset de Envio la provincia (pk) del domicilio del destinatario."""
+        return queryset.annotate(provincia_destino_id=F('destinatario__contacto__domicilio__provincia__pk'))
+
+    @staticmethod
+    def anotar_almacen_central(queryset):
+        """
+        Anota en un queryset de Envio si su almacén (Envio.locacion, el que ve el cliente)
+        es un almacén central, buscando la Locacion por nombre en la misma consulta.
+        """
+        return queryset.annotate(almacen_central=Exists(
+            Locacion.objects.filter(nombre=OuterRef('locacion'), es_almacen_central=True)
+        ))
+
+    @staticmethod
+    def es_almacen_central(envio):
+        if hasattr(envio, 'almacen_central'):
+            return envio.almacen_central
+        return bool(envio.locacion) and Locacion.objects.filter(nombre=envio.locacion, es_almacen_central=True).exists()
+
+    @staticmethod
+    def etapa(item, documento, provincia_destino_id=None):
+        """
+        Etapa en que se encuentra el envío según su último item y documento.
+
+        Returns:
+            (etapa, origen_id, destino_id, fecha) o None si el item no inicia una etapa
+        """
+        tipo = item.documento_type.model
+        if tipo == 'entradarecibida':
+            return 'entrada', documento.locacion_origen_id, provincia_destino_id, documento.fecha_creacion
+        if tipo == 'transferenciaalmacen':
+            return 'transferencia', documento.locacion_origen_id, documento.locacion_destino_id, documento.fecha_creacion
+        if tipo == 'despachomensajero' and not item.devuelto and not item.confirmado:
+            return 'despacho', documento.locacion_origen_id, documento.provincia_id, documento.fecha_creacion
+        return None
+
+    @staticmethod
+    def dias_para_entrega(envio, item=None, documento=None):
+        """
+        Días estimados hasta la entrega. Con historial de la etapa actual se usa la tabla
+        de percentiles; si no, los plazos fijos por estado.
+        """
+        if envio.estado not in ('Recibido', 'Enviado', 'En Trayecto'):
+            return 0
+        if item is not None and documento is not None:
+            etapa = ServicioEta.etapa(item, documento, getattr(envio, 'provincia_destino_id', None))
+            if etapa is not None:
+                dias = MotorEta.obtener().dias_restantes(*etapa)
+                if dias is not None:
+                    return dias
+
+        if envio.estado == 'Recibido':
+            return 7 if ServicioEta.es_almacen_central(envio) else 5
+        if envio.estado == 'Enviado':
+            return 1
+        return 0
+
+    @staticmethod
+    def _documentos(desde):
+        """{tipo: {documento_id: (fecha, origen_id, destino_id)}}; hay muchos menos documentos que items."""
+        documentos = {}
+        for tipo, (_, modelo, campos) in DOCUMENTOS.items():
+            filas = modelo.objects.filter(fecha_creacion__gte=desde).values_list('pk', *campos)
+            documentos[tipo] = {fila[0]: fila[1:] for fila in filas.iterator(chunk_size=5000)}
+        return documentos
+
+    @staticmethod
+    def calcular(dias_historial=180, max_muestras=MAX_MUESTRAS, semilla=None):
+        """
+        Recalcula TiempoEntrega a partir de los envíos entregados en los últimos dias_historial días.
+        Los items se recorren en streaming y cada clave guarda un reservorio de max_muestras duraciones.
+
+        Returns:
+            dict con los items procesados y las filas escritas
+        """
+        aleatorio = random.Random(semilla)
+        desde = timezone.now() - timedelta(days=dias_historial)
+        # Un envío entregado dentro de la ventana pudo entrar al almacén antes de ella
+        documentos = ServicioEta._documentos(desde - timedelta(days=dias_historial))
+        reservorios = {}
+
+        items = ItemDocumento.objects.filter(
+            envio__estado='Entregado',
+            envio__fecha_entrega__gte=desde.date(),
+        ).values_list(
+            'documento_type__model', 'documento_id', 'devuelto', 'envio__fecha_entrega',
+            'envio__destinatario__contacto__domicilio__provincia__pk',
+        )
+        procesados = 0
+        for tipo, documento_id, devuelto, fecha_entrega, provincia_id in items.iterator(chunk_size=5000):
+            documento = documentos.get(tipo, {}).get(documento_id)
+            if documento is None or devuelto:
+                continue
+            etapa = DOCUMENTOS[tipo][0]
+            fecha, origen_id = documento[0], documento[1]
+            destino_id = documento[2] if len(documento) > 2 else provincia_id
+            dias = (fecha_entrega - timezone.localtime(fecha).date()).days
+            if dias < 0:
+                continue
+            procesados += 1
+            for clave in ((etapa, origen_id, destino_id or 0), (etapa, origen_id, 0), (etapa, 0, 0)):
+                reservorio = reservorios.get(clave)
+                if reservorio is None:
+                    reservorio = reservorios[clave] = Reservorio()
+                reservorio.agregar(dias, max_muestras, aleatorio)
+
+        filas = [
+            TiempoEntrega(
+                etapa=etapa, origen_id=origen_id, destino_id=destino_id,
+                muestras=reservorio.vistos, **dict(zip(('p50', 'p80', 'p95'), reservorio.percentiles())),
+            )
+            for (etapa, origen_id, destino_id), reservorio in reservorios.items()
+        ]
+        with transaction.atomic():
+            TiempoEntrega.objects.all().delete()
+            TiempoEntrega.objects.bulk_create(filas, batch_size=1000)
+            transaction.on_commit(MotorEta.invalidar)
+
+        logger.info('Tiempos de entrega recalculados', extra={'campos': {'items': procesados, 'filas': len(filas)}})
+        return {'items': procesados, 'filas': len(filas)}
@@ -0,0 +1,238 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+from hmpaquetesapp.models import DespachoMensajero, Envio, ItemDocumento, Mensajero
+from website_app.models import EnvioArchivado, LiquidacionDiariaMensajero
+from website_app.service.archivo_service import ServicioArchivo
+
+# Ids de despacho por consulta al agregar sus items
+LOTE_DESPACHOS = 900
+
+CERO = Decimal('0.00')
+
+
+def _inicio_dia(fecha):
+    return timezone.make_aware(datetime.combine(fecha, time.min))
+
+
+class ServicioLiquidacion:
+    """
+    Mantiene LiquidacionDiariaMensajero. Cada fila (mensajero, fecha) se recalcula completa a
+    partir de los items de los despachos de ese día, así que aplicar un cambio dos veces o en
+    desorden no descuadra los totales.
+    """
+
+    @staticmethod
+    def _tipo_despacho():
+        return ContentType.objects.get_for_model(DespachoMensajero)
+
+    @staticmethod
+    def clave(mensajero_id, fecha_creacion):
+        return mensajero_id, timezone.localdate(fecha_creacion)
+
+    @staticmethod
+    def claves_de_despachos(despacho_ids):
+        """Claves (mensajero, día) de los despachos con mensajero asignado."""
+        return {
+            ServicioLiquidacion.clave(mensajero_id, fecha_creacion)
+            for mensajero_id, fecha_creacion in DespachoMensajero.objects.filter(
+                pk__in=list(despacho_ids), mensajero__isnull=False,
+            ).values_list('mensajero_id', 'fecha_creacion')
+        }
+
+    @staticmethod
+    def claves_de_items(item_ids):
+        """Claves (mensajero, día) de los despachos a los que pertenecen los items."""
+        despacho_ids = ItemDocumento.objects.filter(
+            pk__in=list(item_ids), documento_type=ServicioLiquidacion._tipo_despacho(),
+        ).order_by().values_list('documento_id', flat=True).distinct()
+        return ServicioLiquidacion.claves_de_despachos(despacho_ids)
+
+    @staticmethod
+    def claves_de_envios(envio_ids):
+        """Claves de los despachos en los que los envíos figuran como entregados."""
+        despacho_ids = ItemDocumento.objects.filter(
+            envio_id__in=list(envio_ids), documento_type=ServicioLiquidacion._tipo_despacho(), confirmado=True,
+        ).order_by().values_list('documento_id', flat=True).distinct()
+        return ServicioLiquidacion.claves_de_despachos(despacho_ids)
+
+    @staticmethod
+    def _sumar_archivados(totales, despacho_clave, desde=None):
+        """
+        Suma a totales los items de despacho de los envíos archivados cuya fila ya purgó la
+        aplicación de gestión: de ellos solo quedan las filas guardadas en EnvioArchivado.datos.
+        Un envío se entrega después de crearse cualquiera de sus despachos, así que los
+        archivados antes de desde no pueden aportar a un despacho del período.
+        """
+        if not despacho_clave:
+            return
+        tipo_id = ServicioLiquidacion._tipo_despacho().pk
+        archivados = EnvioArchivado.objects.exclude(envio_id__in=Envio.objects.values('pk'))
+        if desde is not None:
+            archivados = archivados.filter(Q(fecha_entrega__gte=desde) | Q(fecha_entrega__isnull=True))
+        for datos in archivados.values_list('datos', flat=True).iterator(chunk_size=500):
+            datos = ServicioArchivo.descomprimir(datos)
+            pago = Decimal(datos['envio']['pago_mensajero'] or 0)
+            for item in datos['items']:
+                clave = despacho_clave.get(item['documento_id']) if item['documento_type_id'] == tipo_id else None
+                if clave is None:
+                    continue
+                acumulado = totales[clave]
+                if item['confirmado']:
+                    acumulado[0] += 1
+                    acumulado[2] += pago
+                if item['devuelto']:
+                    acumulado[1] += 1
+
+    @staticmethod
+    def _totales(despacho_clave, desde=None):
+        """
+        Agrega los items de los despachos por clave, incluidos los de envíos archivados y purgados.
+
+        Args:
+            despacho_clave: dict id de despacho → clave (mensajero, día)
+            desde: día del despacho más antiguo, o None si no se conoce
+        Returns:
+            dict clave → (entregados, devueltos, total), sin las claves que quedan en cero
+        """
+        totales = defaultdict(lambda: [0, 0, CERO])
+        despacho_ids = list(despacho_clave)
+        tipo = ServicioLiquidacion._tipo_despacho()
+        for inicio in range(0, len(despacho_ids), LOTE_DESPACHOS):
+            filas = ItemDocumento.objects.filter(
+                documento_type=tipo, documento_id__in=despacho_ids[inicio:inicio + LOTE_DESPACHOS],
+            ).order_by().values('documento_id').annotate(
+                entregados=Count('pk', filter=Q(confirmado=True)),
+                devueltos=Count('pk', filter=Q(devuelto=True)),
+                total=Sum('envio__pago_mensajero', filter=Q(confirmado=True)),
+            )
+            for fila in filas:
+                acumulado = totales[despacho_clave[fila['documento_id']]]
+                acumulado[0] += fila['entregados']
+                acumulado[1] += fila['devueltos']
+                acumulado[2] += fila['total'] or CERO
+        ServicioLiquidacion._sumar_archivados(totales, despacho_clave, desde)
+        return {clave: tuple(valores) for clave, valores in totales.items() if valores[0] or valores[1]}
+
+    @staticmethod
+    def _filas(totales):
+        return [
+            LiquidacionDiariaMensajero(
+                mensajero_id=mensajero_id, fecha=fecha, entregados=entregados, devueltos=devueltos, total=total,
+            )
+            for (mensajero_id, fecha), (entregados, devueltos, total) in totales.items()
+        ]
+
+    @staticmethod
+    @transaction.atomic
+    def recalcular(claves):
+        """
+        Recalcula las filas de las claves (mensajero, día) indicadas. Lo usan las señales
+        después de confirmar, devolver o modificar items de despacho.
+        """
+        claves = {clave for clave in claves if clave[0] is not None}
+        if not claves:
+            return
+        mensajero_ids = {mensajero_id for mensajero_id, _ in claves}
+        fechas = {fecha for _, fecha in claves}
+        despachos = DespachoMensajero.objects.filter(
+            mensajero_id__in=mensajero_ids,
+            fecha_creacion__gte=_inicio_dia(min(fechas)),
+            fecha_creacion__lt=_inicio_dia(max(fechas) + timedelta(days=1)),
+        ).values_list('pk', 'mensajero_id', 'fecha_creacion')
+        despacho_clave = {}
+        for pk, mensajero_id, fecha_creacion in despachos:
+            clave = ServicioLiquidacion.clave(mensajero_id, fecha_creacion)
+            if clave in claves:
+                despacho_clave[pk] = clave
+        totales = ServicioLiquidacion._totales(despacho_clave, min(fechas))
+        ServicioLiquidacion._guardar(totales, claves - totales.keys())
+
+    @staticmethod
+    def _guardar(totales, vacias):
+        """Escribe las filas de totales (insertando o actualizando) y borra las de las claves vacías."""
+        if vacias:
+            condicion = Q()
+            for mensajero_id, fecha in vacias:
+                condicion |= Q(mensajero_id=mensajero_id, fecha=fecha)
+            LiquidacionDiariaMensajero.objects.filter(condicion).delete()
+        if totales:
+            LiquidacionDiariaMensajero.objects.bulk_create(
+                ServicioLiquidacion._filas(totales),
+                batch_size=1000,
+                update_conflicts=True,
+                unique_fields=['mensajero_id', 'fecha'],
+                update_fields=['entregados', 'devueltos', 'total', 'actualizado'],
+            )
+
+    @staticmethod
+    @transaction.atomic
+    def reconciliar(desde=None, hasta=None, mensajero_ids=None):
+        """
+        Recalcula las liquidaciones del período recorriendo todos sus despachos y corrige las
+        existentes. Corrige lo que no pasó por las señales (update() masivos, como el de
+        ServicioPagoMensajero.recalcular, o cargas con bulk_create).
+
+        Los items de los envíos archivados y ya purgados se leen de EnvioArchivado, y las filas
+        de los días que ya no tienen despachos (purgados por la aplicación de gestión) se
+        conservan: son el único registro de lo liquidado.
+
+        Returns:
+            cantidad de filas que estaban desactualizadas
+        """
+        despachos = DespachoMensajero.objects.filter(mensajero__isnull=False)
+        filas = LiquidacionDiariaMensajero.objects.all()
+        if desde is not None:
+            despachos = despachos.filter(fecha_creacion__gte=_inicio_dia(desde))
+            filas = filas.filter(fecha__gte=desde)
+        if hasta is not None:
+            despachos = despachos.filter(fecha_creacion__lt=_inicio_dia(hasta + timedelta(days=1)))
+            filas = filas.filter(fecha__lte=hasta)
+        if mensajero_ids is not None:
+            despachos = despachos.filter(mensajero_id__in=mensajero_ids)
+            filas = filas.filter(mensajero_id__in=mensajero_ids)
+
+        despacho_clave = {
+            pk: ServicioLiquidacion.clave(mensajero_id, fecha_creacion)
+            for pk, mensajero_id, fecha_creacion in despachos.values_list('pk', 'mensajero_id', 'fecha_creacion')
+        }
+        reales = ServicioLiquidacion._totales(despacho_clave, desde)
+        actuales = {
+            (mensajero_id, fecha): (entregados, devueltos, total)
+            for mensajero_id, fecha, entregados, devueltos, total in filas.values_list(
+                'mensajero_id', 'fecha', 'entregados', 'devueltos', 'total',
+            )
+        }
+        con_despachos = set(despacho_clave.values())
+        cambiadas = {clave: totales for clave, totales in reales.items() if actuales.get(clave) != totales}
+        vacias = {clave for clave in actuales.keys() - reales.keys() if clave in con_despachos}
+        ServicioLiquidacion._guardar(cambiadas, vacias)
+        return len(cambiadas) + len(vacias)
+
+    @staticmethod
+    def reporte(desde, hasta, mensajero_ids=None):
+        """
+        Liquidación del período por mensajero sumando las filas diarias.
+
+        Returns:
+            lista de dicts (mensajero_id, mensajero, dias, entregados, devueltos, total) ordenada por mensajero
+        """
+        filas = LiquidacionDiariaMensajero.objects.filter(fecha__gte=desde, fecha__lte=hasta)
+        if mensajero_ids is not None:
+            filas = filas.filter(mensajero_id__in=mensajero_ids)
+        filas = list(
+            filas.order_by('mensajero_id').values('mensajero_id').annotate(
+                dias=Count('pk'), entregados=Sum('entregados'), devueltos=Sum('devueltos'), total=Sum('total'),
+            )
+        )
+        nombres = dict(
+            Mensajero.objects.filter(pk__in=[fila['mensajero_id'] for fila in filas]).values_list('pk', 'name')
+        )
+        for fila in filas:
+            fila['mensajero'] = nombres.get(fila['mensajero_id'])
+        return filas
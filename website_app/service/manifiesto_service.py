@@ -0,0 +1,142 @@
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from hmpaquetesapp.models import Envio, ManifiestoPostal
+from website_app.models import ContadorManifiesto
+
+# Estados en los que el envío ya fue recibido físicamente
+ESTADOS_RECIBIDOS = ('Recibido', 'Enviado', 'En Trayecto', 'Entregado')
+
+# Hasta este número de claves (manifiesto, estado) se actualiza cada contador por separado
+MAX_CLAVES_INDIVIDUALES = 4
+
+
+class ServicioContadoresManifiesto:
+    @staticmethod
+    def _sumar(manifiesto_id, estado, delta):
+        actualizados = ContadorManifiesto.objects.filter(
+            manifiesto_id=manifiesto_id, estado=estado
+        ).update(cantidad=F('cantidad') + delta)
+        if actualizados:
+            return
+        try:
+            with transaction.atomic():
+                ContadorManifiesto.objects.create(manifiesto_id=manifiesto_id, estado=estado, cantidad=delta)
+        except IntegrityError:
+            # Otro proceso creó el contador entre el UPDATE y el INSERT
+            ContadorManifiesto.objects.filter(
+                manifiesto_id=manifiesto_id, estado=estado
+            ).update(cantidad=F('cantidad') + delta)
+
+    @staticmethod
+    def aplicar_transiciones(transiciones):
+        """
+        Aplica cambios de estado a los contadores. Con pocas claves afectadas se emite un UPDATE
+        por (manifiesto, estado); en lotes grandes, un UPDATE por (estado, incremento).
+
+        Args:
+            transiciones: iterable de (manifiesto_id, estado_anterior, estado_nuevo);
+                          estado_anterior es None para altas y estado_nuevo None para bajas
+        """
+        deltas = Counter()
+        for manifiesto_id, anterior, nuevo in transiciones:
+            if anterior == nuevo:
+                continue
+            if anterior is not None:
+                deltas[(manifiesto_id, anterior)] -= 1
+            if nuevo is not None:
+                deltas[(manifiesto_id, nuevo)] += 1
+        deltas = {clave: delta for clave, delta in deltas.items() if delta}
+        if len(deltas) > MAX_CLAVES_INDIVIDUALES:
+            ServicioContadoresManifiesto._sumar_lote(deltas)
+            return
+        for (manifiesto_id, estado), delta in sorted(deltas.items()):
+            ServicioContadoresManifiesto._sumar(manifiesto_id, estado, delta)
+
+    @staticmethod
+    @transaction.atomic
+    def _sumar_lote(deltas):
+        # Crea en cero los contadores que falten y agrupa las claves con el mismo incremento
+        ContadorManifiesto.objects.bulk_create(
+            [ContadorManifiesto(manifiesto_id=manifiesto_id, estado=estado) for manifiesto_id, estado in deltas],
+            ignore_conflicts=True,
+            batch_size=1000,
+        )
+        grupos = {}
+        for (manifiesto_id, estado), delta in deltas.items():
+            grupos.setdefault((estado, delta), []).append(manifiesto_id)
+        for (estado, delta), manifiesto_ids in sorted(grupos.items()):
+            ContadorManifiesto.objects.filter(
+                estado=estado, manifiesto_id__in=sorted(manifiesto_ids)
+            ).update(cantidad=F('cantidad') + delta)
+
+    @staticmethod
+    def aplicar_transicion(manifiesto_id, anterior, nuevo):
+        ServicioContadoresManifiesto.aplicar_transiciones([(manifiesto_id, anterior, nuevo)])
+
+    @staticmethod
+    @transaction.atomic
+    def reconciliar(manifiesto_ids=None):
+        """
+        Recalcula los contadores con un GROUP BY sobre los envíos y reemplaza los existentes.
+
+        Returns:
+            cantidad de contadores que estaban desactualizados
+        """
+        envios = Envio.objects.all()
+        contadores = ContadorManifiesto.objects.all()
+        if manifiesto_ids is not None:
+            envios = envios.filter(manifiesto_id__in=manifiesto_ids)
+            contadores = contadores.filter(manifiesto_id__in=manifiesto_ids)
+
+        reales = {
+            (fila['manifiesto_id'], fila['estado']): fila['cantidad']
+            for fila in envios.order_by().values('manifiesto_id', 'estado').annotate(cantidad=Count('pk'))
+        }
+        actuales = {
+            (manifiesto_id, estado): cantidad
+            for manifiesto_id, estado, cantidad in contadores.values_list('manifiesto_id', 'estado', 'cantidad')
+        }
+        desactualizados = sum(
+            1 for clave in reales.keys() | actuales.keys()
+            if reales.get(clave, 0) != actuales.get(clave, 0)
+        )
+        if desactualizados:
+            contadores.delete()
+            ContadorManifiesto.objects.bulk_create(
+                [
+                    ContadorManifiesto(manifiesto_id=manifiesto_id, estado=estado, cantidad=cantidad)
+                    for (manifiesto_id, estado), cantidad in reales.items()
+                ],
+                batch_size=1000,
+            )
+        return desactualizados
+
+    @staticmethod
+    def resumen(manifiesto_id):
+        """
+        Progreso del manifiesto leyendo solo su fila y sus contadores (a lo sumo uno por estado).
+
+        Returns:
+            dict con el resumen, o None si el manifiesto no existe
+        """
+        manifiesto = ManifiestoPostal.objects.filter(pk=manifiesto_id).values(
+            'pk', 'no_ga', 'operador', 'cantidad_bultos'
+        ).first()
+        if manifiesto is None:
+            return None
+
+        por_estado = {estado: 0 for estado, _ in Envio.ESTADOS_CHOICES}
+        por_estado.update(
+            ContadorManifiesto.objects.filter(manifiesto_id=manifiesto_id).values_list('estado', 'cantidad')
+        )
+        return {
+            'manifiesto': manifiesto['pk'],
+            'no_ga': manifiesto['no_ga'],
+            'operador': manifiesto['operador'],
+            'cantidad_bultos': manifiesto['cantidad_bultos'],
+            'total_envios': sum(por_estado.values()),
+            'recibidos': sum(por_estado[estado] for estado in ESTADOS_RECIBIDOS),
+            'por_estado': por_estado,
+        }
@@ -0,0 +1,177 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.utils import timezone
+from hmpaquetesapp.models import DespachoMensajero, EntradaRecibida, Envio, ItemDocumento, TransferenciaAlmacen
+from website_app.models import OcupacionEnvio
+
+# Envíos por consulta al calcular ocupaciones: acota los parámetros de cada IN
+LOTE_ENVIOS = 900
+
+# Campos de ubicación que se leen de cada tipo de documento
+DOCUMENTOS = {
+    'entradarecibida': (EntradaRecibida, ('locacion_origen_id',)),
+    'transferenciaalmacen': (TransferenciaAlmacen, ('locacion_origen_id', 'locacion_destino_id')),
+    'despachomensajero': (DespachoMensajero, ('locacion_origen_id',)),
+}
+
+
+class ServicioOcupacion:
+    @staticmethod
+    def locacion_de(tipo, devuelto, confirmado, locacion_origen_id, locacion_destino_id=None):
+        """
+        Almacén en el que queda el envío después de un item de documento.
+
+        Returns:
+            id de la Locacion, o None si el envío salió del almacén (despacho a mensajero)
+        """
+        if tipo == 'entradarecibida':
+            return locacion_origen_id
+        if tipo == 'transferenciaalmacen':
+            return locacion_destino_id
+        if tipo == 'despachomensajero':
+            # Un envío devuelto regresa al centro de distribución del despacho
+            return locacion_origen_id if devuelto and not confirmado else None
+        return None
+
+    @staticmethod
+    def _guardar(envio_id, item_id, locacion_id):
+        OcupacionEnvio.objects.update_or_create(
+            envio_id=envio_id, defaults={'item_id': item_id, 'locacion_id': locacion_id}
+        )
+
+    @staticmethod
+    def registrar_item(item):
+        """Actualiza la ocupación con un item recién creado, que es el último del envío."""
+        tipo = ContentType.objects.get_for_id(item.documento_type_id).model
+        modelo, campos = DOCUMENTOS.get(tipo, (None, ()))
+        if modelo is None:
+            return
+        ubicacion = modelo.objects.filter(pk=item.documento_id).values_list(*campos).first()
+        if ubicacion is None:
+            return
+        locacion_id = ServicioOcupacion.locacion_de(tipo, item.devuelto, item.confirmado, *ubicacion)
+        ServicioOcupacion._guardar(item.envio_id, item.pk, locacion_id)
+
+    @staticmethod
+    def recalcular_envio(envio_id):
+        """Recalcula la ocupación a partir del último item del envío (tras modificar o borrar items)."""
+        item = ItemDocumento.objects.filter(envio_id=envio_id).order_by('-pk').first()
+        if item is None:
+            OcupacionEnvio.objects.filter(envio_id=envio_id).delete()
+        else:
+            ServicioOcupacion.registrar_item(item)
+
+    @staticmethod
+    def _calcular(envio_ids):
+        """
+        Ocupaciones a partir de los últimos items de un lote de envíos (hasta LOTE_ENVIOS),
+        con una consulta para los items y una por tipo de documento para sus locaciones.
+        """
+        ultimos = ItemDocumento.objects.filter(envio_id__in=envio_ids).order_by().values('envio_id').annotate(
+            ultimo=Max('pk')
+        ).values('ultimo')
+        items = list(
+            ItemDocumento.objects.filter(pk__in=Subquery(ultimos)).values_list(
+                'pk', 'envio_id', 'documento_type__model', 'documento_id', 'devuelto', 'confirmado'
+            )
+        )
+
+        ubicaciones = {}
+        for tipo, (modelo, campos) in DOCUMENTOS.items():
+            ids = {documento_id for _, _, t, documento_id, _, _ in items if t == tipo}
+            if ids:
+                ubicaciones[tipo] = {
+                    fila[0]: fila[1:] for fila in modelo.objects.filter(pk__in=ids).values_list('pk', *campos).iterator()
+                }
+
+        ocupaciones = []
+        for item_id, envio_id, tipo, documento_id, devuelto, confirmado in items:
+            ubicacion = ubicaciones.get(tipo, {}).get(documento_id)
+            if ubicacion is None:
+                continue
+            ocupaciones.append(OcupacionEnvio(
+                envio_id=envio_id,
+                item_id=item_id,
+                locacion_id=ServicioOcupacion.locacion_de(tipo, devuelto, confirmado, *ubicacion),
+            ))
+        return ocupaciones
+
+    @staticmethod
+    def _lotes(envio_ids):
+        envio_ids = sorted(set(envio_ids))
+        for inicio in range(0, len(envio_ids), LOTE_ENVIOS):
+            yield envio_ids[inicio:inicio + LOTE_ENVIOS]
+
+    @staticmethod
+    @transaction.atomic
+    def recalcular_envios(envio_ids, tamano_lote=2000):
+        """Recalcula en bloque la ocupación de varios envíos (p. ej. tras devolver una ruta)."""
+        for lote in ServicioOcupacion._lotes(envio_ids):
+            ocupaciones = ServicioOcupacion._calcular(lote)
+            OcupacionEnvio.objects.filter(envio_id__in=lote).delete()
+            OcupacionEnvio.objects.bulk_create(ocupaciones, batch_size=tamano_lote)
+
+    @staticmethod
+    @transaction.atomic
+    def marcar_fuera_de_almacen(envio_ids):
+        """
+        Registra que los envíos salieron del almacén en un despacho recién creado, con un
+        UPDATE por lote: el último item de cada envío es el del despacho. Los envíos que
+        aún no tenían fila de ocupación se calculan desde sus items.
+
+        Returns:
+            cantidad de envíos registrados
+        """
+        ultimo_item = ItemDocumento.objects.filter(envio_id=OuterRef('envio_id')).order_by('-pk').values('pk')[:1]
+        total = 0
+        for lote in ServicioOcupacion._lotes(envio_ids):
+            actualizados = OcupacionEnvio.objects.filter(envio_id__in=lote).update(
+                locacion_id=None, item_id=Subquery(ultimo_item), actualizado=timezone.now()
+            )
+            if actualizados < len(lote):
+                existentes = set(OcupacionEnvio.objects.filter(envio_id__in=lote).values_list('envio_id', flat=True))
+                ocupaciones = ServicioOcupacion._calcular([envio_id for envio_id in lote if envio_id not in existentes])
+                OcupacionEnvio.objects.bulk_create(ocupaciones)
+                actualizados += len(ocupaciones)
+            total += actualizados
+        return total
+
+    @staticmethod
+    @transaction.atomic
+    def reconstruir(tamano_lote=2000):
+        """
+        Reconstruye la tabla completa recorriendo los envíos por id en lotes de LOTE_ENVIOS,
+        sin cargar todas las ocupaciones en memoria.
+
+        Returns:
+            cantidad de envíos con ocupación registrada
+        """
+        OcupacionEnvio.objects.all().delete()
+        envios = Envio.objects.order_by('pk').values_list('pk', flat=True)
+        ultimo_pk = 0
+        total = 0
+        while True:
+            lote = list(envios.filter(pk__gt=ultimo_pk)[:LOTE_ENVIOS])
+            if not lote:
+                break
+            ocupaciones = ServicioOcupacion._calcular(lote)
+            OcupacionEnvio.objects.bulk_create(ocupaciones, batch_size=tamano_lote)
+            total += len(ocupaciones)
+            ultimo_pk = lote[-1]
+        return total
+
+    @staticmethod
+    def envios_en(locacion_id):
+        """Envíos que están físicamente en el almacén."""
+        return Envio.objects.filter(
+            pk__in=OcupacionEnvio.objects.filter(locacion_id=locacion_id).values('envio_id')
+        )
+
+    @staticmethod
+    def inventario():
+        """Cantidad de envíos por almacén como {locacion_id: cantidad}."""
+        return dict(
+            OcupacionEnvio.objects.filter(locacion_id__isnull=False).order_by()
+            .values('locacion_id').annotate(cantidad=Count('pk')).values_list('locacion_id', 'cantidad')
+        )
@@ -0,0 +1,221 @@
+import logging
+
+from django.contrib.contenttypes.prefetch import GenericPrefetch
+from django.db.models import Max, Subquery
+from django.utils import timezone
+from hmpaquetesapp.models import DespachoMensajero, EntradaRecibida, Envio, ItemDocumento, TransferenciaAlmacen
+from website_app.service.eta_service import ServicioEta
+
+logger = logging.getLogger('website_app.views')
+
+DOCUMENTOS = {
+    'entradarecibida': EntradaRecibida,
+    'transferenciaalmacen': TransferenciaAlmacen,
+    'despachomensajero': DespachoMensajero,
+}
+
+
+class ServicioSeguimiento:
+    """Construcción de la respuesta de seguimiento (shipment_details) de un envío."""
+
+    @staticmethod
+    def envios():
+        """Queryset de Envio con las anotaciones que usa la respuesta (almacén central y destino)."""
+        return ServicioEta.anotar_destino(ServicioEta.anotar_almacen_central(Envio.objects))
+
+    @staticmethod
+    def items(envio_ids):
+        """
+        Items de los envíos ordenados por pk, con sus documentos y locaciones precargados:
+        una consulta para los items y una por tipo de documento, sin importar cuántos haya.
+        """
+        return ItemDocumento.objects.filter(envio_id__in=envio_ids).select_related('documento_type').prefetch_related(
+            GenericPrefetch('documento', [
+                EntradaRecibida.objects.select_related('locacion_origen'),
+                TransferenciaAlmacen.objects.select_related('locacion_origen', 'locacion_destino'),
+                DespachoMensajero.objects.select_related('locacion_origen'),
+            ])
+        ).order_by('pk')
+
+    @staticmethod
+    def nombre_evento(tipo, devuelto=False, confirmado=False):
+        if tipo == 'entradarecibida':
+            return "Entrada"
+        if tipo == 'transferenciaalmacen':
+            return "Transferencia"
+        if tipo == 'despachomensajero':
+            if devuelto:
+                return "Devolución"
+            if confirmado:
+                return "Entrega Exitosa"
+            return "Despachado a Mensajero"
+        return "Desconocido"
+
+    @staticmethod
+    def filas_instantanea(tamano_lote=2000):
+        """
+        Recorre todos los envíos en lotes por pk y produce, para la instantánea de seguimiento,
+        (no_envio, estado, almacen, evento, tipo, fecha) con el último evento de cada uno.
+        Cada lote cuesta una consulta de envíos, una de últimos items y una por tipo de documento.
+        """
+        ultimo_pk = 0
+        while True:
+            envios = list(
+                Envio.objects.filter(pk__gt=ultimo_pk).order_by('pk')
+                .values_list('pk', 'no_envio', 'estado', 'locacion')[:tamano_lote]
+            )
+            if not envios:
+                return
+            ultimo_pk = envios[-1][0]
+            ids = [envio[0] for envio in envios]
+
+            ultimos = ItemDocumento.objects.filter(envio_id__in=ids).order_by().values('envio_id').annotate(
+                ultimo=Max('pk')
+            ).values('ultimo')
+            items = {
+                envio_id: (tipo, documento_id, devuelto, confirmado)
+                for envio_id, tipo, documento_id, devuelto, confirmado in ItemDocumento.objects.filter(
+                    pk__in=Subquery(ultimos)
+                ).values_list('envio_id', 'documento_type__model', 'documento_id', 'devuelto', 'confirmado')
+            }
+            fechas = {}
+            for tipo, modelo in DOCUMENTOS.items():
+                documento_ids = {item[1] for item in items.values() if item[0] == tipo}
+                if documento_ids:
+                    fechas[tipo] = dict(modelo.objects.filter(pk__in=documento_ids).values_list('pk', 'fecha_creacion'))
+
+            for envio_id, no_envio, estado, locacion in envios:
+                item = items.get(envio_id)
+                if item is None:
+                    yield no_envio, estado, locacion or '', '', '', ''
+                    continue
+                tipo, documento_id, devuelto, confirmado = item
+                fecha = fechas.get(tipo, {}).get(documento_id)
+                yield (
+                    no_envio, estado, locacion or '',
+                    ServicioSeguimiento.nombre_evento(tipo, devuelto, confirmado), tipo,
+                    fecha.strftime('%d/%m/%Y %I:%M %p') if fecha else 'N/A',
+                )
+
+    @staticmethod
+    def _foto_url(envio_obj):
+        # Obtener URL de foto de forma segura
+        if envio_obj.estado == 'Entregado' and envio_obj.foto_entrega:
+            try:
+                return envio_obj.foto_entrega.url
+            except (AttributeError, ValueError):
+                return ''
+        return ''
+
+    @staticmethod
+    def respuesta(envio_obj, items):
+        """
+        Cuerpo JSON de shipment_details para el envío.
+
+        Args:
+            envio_obj: Envio obtenido con envios()
+            items: lista de sus ItemDocumento, obtenidos con items()
+        """
+        cod = envio_obj.no_envio
+        if not items:
+            return {
+                'success': True,
+                'envio': {
+                    'codigo': envio_obj.no_envio,
+                    'estado': envio_obj.estado,
+                    'almacen': envio_obj.locacion if envio_obj.estado != 'No Recibido' and envio_obj.locacion else '',
+                    'dias_para_entrega': ServicioEta.dias_para_entrega(envio_obj),
+                    'foto_confirmacion': ServicioSeguimiento._foto_url(envio_obj),
+                },
+                'historial': [],
+                'mensaje': 'No se encontraron movimientos para este envío.'
+            }
+
+        historial = []
+        # Inicializar variables por si el loop no procesa ningún item
+        fecha = None
+        tipo = None
+        ultimo_item = ultimo_documento = None
+
+        for item in items:
+            doc = item.documento
+
+            if doc is None:
+                logger.warning('Documento no resuelto para ItemDocumento ID: %s. Omitiendo item.', item.id)
+                continue
+            ultimo_item, ultimo_documento = item, doc
+
+            # datos básicos
+            tipo = item.documento_type.model
+            detalle = ""
+
+            # Usamos getattr de forma segura
+            fecha_dt = getattr(doc, 'fecha_creacion', None)
+            fecha = fecha_dt.strftime('%d/%m/%Y %I:%M %p') if fecha_dt else 'N/A'
+
+            evento = ServicioSeguimiento.nombre_evento(tipo, item.devuelto, item.confirmado)
+
+            if tipo == 'entradarecibida':
+                locacion_nombre = getattr(getattr(doc, 'locacion_origen', None), 'nombre', 'Desconocida')
+                detalle = f"""Se da entrada al envío en el almacén <strong>{locacion_nombre}</strong>"""
+
+            elif tipo == 'transferenciaalmacen':
+                locacion_origen_nombre = getattr(getattr(doc, 'locacion_origen', None), 'nombre', 'Desconocido')
+                locacion_destino_nombre = getattr(getattr(doc, 'locacion_destino', None), 'nombre', 'Desconocido')
+
+                detalle = f"""El envio a arribado al almacén <strong>{locacion_destino_nombre}</strong> transferido desde el almacén <strong>{locacion_origen_nombre}</strong>."""
+
+            elif tipo == 'despachomensajero':
+                locacion_origen_nombre = getattr(getattr(doc, 'locacion_origen', None), 'nombre', 'Desconocido')
+                base_detalle = f"""El mensajero recogio el envio en el centro de distribucion <strong>{locacion_origen_nombre}</strong> y esta en proceso de entrega."""
+
+                if item.devuelto:
+                    detalle = base_detalle + "<br><br>El envío no fue entregado y se retorna al centro de distribucion."
+                elif item.confirmado:
+                    detalle = "Su envío fue entregado satisfactoriamente."
+                else:
+                    detalle = base_detalle
+
+            # Agregar el evento al historial
+            historial.append({
+                'evento': evento,
+                'fecha': fecha,
+                'detalle': detalle,
+                'tipo': tipo
+            })
+
+        if len(historial) == 0:
+            evento = 'Aduana'
+            detalle = 'El envío aún no ha sido recibido por el transportista.' if envio_obj.estado in ['No Recibido', 'Desaforado'] else f'Estado {envio_obj.estado} incorrecto.'
+            # Usar fecha actual si no hay fecha disponible
+            fecha_fallback = timezone.now().strftime('%d/%m/%Y %I:%M %p')
+            tipo_fallback = 'sin_tipo'
+
+            historial.append({
+                'evento': evento,
+                'fecha': fecha if fecha else fecha_fallback,
+                'detalle': detalle,
+                'tipo': tipo if tipo else tipo_fallback
+            })
+
+        # Ordenar historial (usando la fecha como cadena formateada)
+        historial.sort(key=lambda x: x['fecha'] or '', reverse=True)
+
+        # Estimación según la etapa del último documento y el historial de entregas
+        dias_para_entrega = ServicioEta.dias_para_entrega(envio_obj, ultimo_item, ultimo_documento)
+
+        # El historial solo se convierte a texto si DEBUG está habilitado
+        logger.debug('Historial completo para %s: %s', cod, historial)
+        logger.debug('Foto de entrega: %s', envio_obj.foto_entrega)
+
+        return {
+            'success': True,
+            'envio': {
+                'codigo': envio_obj.no_envio,
+                'estado': envio_obj.estado,
+                'almacen': envio_obj.locacion if envio_obj.estado != 'No Recibido' else '',
+                'dias_para_entrega': dias_para_entrega,
+                'foto_confirmacion': ServicioSeguimiento._foto_url(envio_obj),
+            },
+            'historial': historial,
+        }
@@ -0,0 +1,180 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.contrib.contenttypes.models import ContentType
+from hmpaquetesapp.models import DespachoMensajero, Envio, ItemDocumento
+from hmpaquetesapp.service.item_documento_service import items_despacho_actualizados
+from website_app.eventos import bus, canal_notify, notificar_envio
+from website_app.models import EnvioArchivado, OcupacionEnvio
+from website_app.service.liquidacion_service import ServicioLiquidacion
+from website_app.service.manifiesto_service import ServicioContadoresManifiesto
+from website_app.service.ocupacion_service import ServicioOcupacion
+
+
+@receiver(post_save, sender=Envio)
+def publicar_cambio_envio(sender, instance, created, update_fields=None, **kwargs):
+    """Avisa a los clientes que siguen el envío cuando puede haber cambiado su estado."""
+    if created or (update_fields is not None and 'estado' not in update_fields):
+        return
+    notificar_envio(instance.no_envio, 'estado', instance.estado)
+
+
+@receiver([post_save, post_delete], sender=ItemDocumento)
+def publicar_movimiento_envio(sender, instance, **kwargs):
+    """Un item nuevo, modificado o eliminado cambia el historial del envío."""
+    if not canal_notify() and not bus.tiene_suscriptores():
+        return
+    if ItemDocumento.envio.is_cached(instance):
+        no_envio = instance.envio.no_envio
+    else:
+        no_envio = Envio.objects.filter(pk=instance.envio_id).values_list('no_envio', flat=True).first()
+    if no_envio:
+        notificar_envio(no_envio, 'movimiento')
+
+
+@receiver(pre_save, sender=Envio)
+def recordar_estado_envio(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Guarda el manifiesto y el estado previos para actualizar los contadores en post_save."""
+    if raw or instance.pk is None:
+        instance._contador_previo = None
+        return
+    if update_fields is not None and not {'estado', 'manifiesto'} & set(update_fields):
+        instance._contador_previo = False
+        return
+    if not instance._state.adding and {'manifiesto_id', 'estado'} <= getattr(instance, '_valores_cargados', {}).keys():
+        # Valores con que se cargó la instancia (SeguimientoCambiosMixin), sin volver a consultar
+        instance._contador_previo = (instance.valor_cargado('manifiesto_id'), instance.valor_cargado('estado'))
+    else:
+        instance._contador_previo = Envio.objects.filter(pk=instance.pk).values_list('manifiesto_id', 'estado').first()
+
+
+@receiver(post_save, sender=Envio)
+def actualizar_contadores_manifiesto(sender, instance, created, raw=False, **kwargs):
+    """
+    Mantiene ContadorManifiesto al crear o cambiar de estado/manifiesto un envío.
+    Los update() masivos no pasan por aquí; reconciliar_contadores_manifiesto los corrige.
+    """
+    if raw:
+        return
+    previo = getattr(instance, '_contador_previo', None)
+    if previo is False:
+        return
+    transiciones = []
+    if previo:
+        manifiesto_previo, estado_previo = previo
+        if (manifiesto_previo, estado_previo) == (instance.manifiesto_id, instance.estado):
+            return
+        transiciones.append((manifiesto_previo, estado_previo, None))
+    transiciones.append((instance.manifiesto_id, None, instance.estado))
+    ServicioContadoresManifiesto.aplicar_transiciones(transiciones)
+
+
+@receiver(post_delete, sender=Envio)
+def descontar_envio_manifiesto(sender, instance, **kwargs):
+    ServicioContadoresManifiesto.aplicar_transicion(instance.manifiesto_id, instance.estado, None)
+
+
+@receiver(post_save, sender=ItemDocumento)
+def actualizar_ocupacion_item(sender, instance, created, raw=False, **kwargs):
+    """Un item nuevo es el último del envío; si se modifica uno existente se recalcula."""
+    if raw:
+        return
+    if created:
+        ServicioOcupacion.registrar_item(instance)
+    else:
+        ServicioOcupacion.recalcular_envio(instance.envio_id)
+
+
+@receiver(post_delete, sender=ItemDocumento)
+def recalcular_ocupacion_item(sender, instance, **kwargs):
+    ServicioOcupacion.recalcular_envio(instance.envio_id)
+
+
+@receiver(post_delete, sender=Envio)
+def eliminar_ocupacion_envio(sender, instance, **kwargs):
+    OcupacionEnvio.objects.filter(envio_id=instance.pk).delete()
+
+
+@receiver(items_despacho_actualizados)
+def aplicar_items_despacho(sender, accion, items, envios, **kwargs):
+    """Equivalente en bloque de las señales por fila para devoluciones y confirmaciones."""
+    ServicioContadoresManifiesto.aplicar_transiciones(
+        (manifiesto_id, anterior, nuevo) for _, _, manifiesto_id, anterior, nuevo in envios
+    )
+    envio_ids = [envio_id for envio_id, _, _, _, _ in envios]
+    if accion == 'despachar':
+        ServicioOcupacion.marcar_fuera_de_almacen(envio_ids)
+    else:
+        ServicioOcupacion.recalcular_envios(envio_ids)
+        ServicioLiquidacion.recalcular(ServicioLiquidacion.claves_de_items(items))
+    seguir = canal_notify() or bus.tiene_suscriptores()
+    if seguir:
+        for _, no_envio, _, anterior, nuevo in envios:
+            notificar_envio(no_envio, 'estado' if anterior != nuevo else 'movimiento', nuevo)
+
+
+def _es_item_despacho(item):
+    return item.documento_type_id == ContentType.objects.get_for_model(DespachoMensajero).pk
+
+
+@receiver(post_save, sender=ItemDocumento)
+def liquidar_item_despacho(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """
+    Un item de despacho confirmado o devuelto cambia la liquidación del mensajero ese día.
+    Si el item se movió a otro despacho, la fila del anterior la corrige reconciliar_liquidaciones.
+    """
+    if raw or not _es_item_despacho(instance):
+        return
+    if created and not (instance.confirmado or instance.devuelto):
+        return
+    if update_fields is not None and not {'confirmado', 'devuelto', 'envio'} & set(update_fields):
+        return
+    ServicioLiquidacion.recalcular(ServicioLiquidacion.claves_de_despachos([instance.documento_id]))
+
+
+@receiver(post_delete, sender=ItemDocumento)
+def descontar_item_despacho(sender, instance, **kwargs):
+    """
+    Un item borrado deja de contar, salvo que su envío esté archivado: la purga de lo
+    archivado no cambia lo que ya se liquidó.
+    """
+    if not _es_item_despacho(instance) or not (instance.confirmado or instance.devuelto):
+        return
+    if not EnvioArchivado.objects.filter(envio_id=instance.envio_id).exists():
+        ServicioLiquidacion.recalcular(ServicioLiquidacion.claves_de_despachos([instance.documento_id]))
+
+
+@receiver(post_save, sender=Envio)
+def liquidar_pago_envio(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """
+    Un cambio de pago_mensajero se refleja en los días en que el envío figura como entregado.
+    ServicioPagoMensajero.recalcular usa update() y no pasa por aquí: después de recalcular
+    los pagos hay que ejecutar reconciliar_liquidaciones.
+    """
+    if raw or created or (update_fields is not None and 'pago_mensajero' not in update_fields):
+        return
+    ServicioLiquidacion.recalcular(ServicioLiquidacion.claves_de_envios([instance.pk]))
+
+
+@receiver(pre_save, sender=DespachoMensajero)
+def recordar_mensajero_despacho(sender, instance, raw=False, **kwargs):
+    """Guarda la clave (mensajero, día) previa por si el despacho se reasigna a otro mensajero."""
+    instance._liquidacion_previa = set()
+    if raw or instance.pk is None:
+        return
+    instance._liquidacion_previa = ServicioLiquidacion.claves_de_despachos([instance.pk])
+
+
+@receiver(post_save, sender=DespachoMensajero)
+def liquidar_despacho(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        return
+    claves = ServicioLiquidacion.claves_de_despachos([instance.pk])
+    previas = getattr(instance, '_liquidacion_previa', set())
+    if claves != previas:
+        ServicioLiquidacion.recalcular(claves | previas)
+
+
+@receiver(post_delete, sender=DespachoMensajero)
+def descontar_despacho(sender, instance, **kwargs):
+    if instance.mensajero_id is not None and instance.fecha_creacion is not None:
+        ServicioLiquidacion.recalcular({ServicioLiquidacion.clave(instance.mensajero_id, instance.fecha_creacion)})
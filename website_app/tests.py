@@ -1,3 +1,901 @@
-from django.test import TestCase
+import json
+import logging
+import math
+import os
+import queue
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from functools import partial
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.db.models import Count
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, override_settings, tag
+from django.urls import reverse
+from django.utils import timezone
+from cotizacion_app.models import Cotizacion, Servicio
+from hmpaquetesapp.models import Auditoria, DespachoMensajero, Envio, ItemDocumento, Locacion, Mensajero, Persona
+from hmpaquetesapp.service.cache_service import CargaVersionada, en_carga
+from hmpaquetesapp.tests import crear_envios
+from website_app import instantanea, perfilado, urls
+from website_app.benchmark.datos import generar
+from website_app.metricas import SAVEPOINTS, Medicion
+from website_app.models import ContadorManifiesto, EnvioArchivado, LiquidacionDiariaMensajero, OcupacionEnvio, TiempoEntrega
+from website_app.presupuestos import consultas_de, de_vista, presupuesto, verificar
+from website_app.registro import ManejadorCola, OyenteCola
+from website_app.service.archivo_service import ServicioArchivo
+from website_app.service.despacho_service import PlanificadorDespacho
+from website_app.service.eta_service import MIN_MUESTRAS, MotorEta, Reservorio, ServicioEta
+from website_app.service.liquidacion_service import ServicioLiquidacion
+from website_app.service.ocupacion_service import ServicioOcupacion
+from website_app.service.manifiesto_service import MAX_CLAVES_INDIVIDUALES, ServicioContadoresManifiesto
+
+# Peticiones medidas por vista después de una de calentamiento
+REPETICIONES = 5
+# Envíos sintéticos sobre los que se miden los presupuestos
+ENVIOS_PRESUPUESTO = 2000
+
+
+def _codigos_envio():
+    """El envío con el historial más largo y uno de cada estado."""
+    envios = Envio.objects.annotate(eventos=Count('itemdocumento'))
+    codigos = [envios.order_by('-eventos', 'pk').values_list('no_envio', flat=True).first()]
+    for estado in Envio.objects.order_by().values_list('estado', flat=True).distinct():
+        codigos.append(Envio.objects.filter(estado=estado).order_by('pk').values_list('no_envio', flat=True).first())
+    return codigos
+
+
+def cargas_versionadas(clase=CargaVersionada):
+    """Subclases de CargaVersionada, incluidas las indirectas."""
+    for subclase in clase.__subclasses__():
+        yield subclase
+        yield from cargas_versionadas(subclase)
+
+
+def _carnet_prefijo():
+    return Persona.objects.order_by('pk').values_list('carnet_de_identificacion', flat=True).first()[:4]
+
+
+def _cotizaciones_pendientes():
+    return list(Cotizacion.objects.filter(atendido=False).order_by('pk').values_list('pk', flat=True)[:20])
+
+
+# nombre de la URL: función que devuelve una lista de peticiones
+# (método, ruta, datos, requiere staff). Las vistas sin entrada solo deben declarar presupuesto.
+PETICIONES = {
+    'index': lambda: [('get', reverse('website_app:index'), None, False)],
+    'about': lambda: [('get', reverse('website_app:about'), None, False)],
+    'services': lambda: [('get', reverse('website_app:services'), None, False)],
+    'goods_storage': lambda: [('get', reverse('website_app:goods_storage'), None, False)],
+    'air_freight_service': lambda: [('get', reverse('website_app:air_freight_service'), None, False)],
+    'land_transport_service': lambda: [('get', reverse('website_app:land_transport_service'), None, False)],
+    'sea_freight_service': lambda: [('get', reverse('website_app:sea_freight_service'), None, False)],
+    'contact': lambda: [('get', reverse('website_app:contact'), None, False)],
+    'shipment_details': lambda: [
+        ('get', reverse('website_app:shipment_details', args=[codigo]), None, False)
+        for codigo in _codigos_envio() + ['NOEXISTE']
+    ],
+    'insertar_cotizacion': lambda: [(
+        'post', reverse('website_app:insertar_cotizacion'),
+        {'nombre': 'Cliente', 'correo': 'cliente@example.com', 'descripcion': 'Prueba',
+         'servicios': Servicio.objects.filter(activo=True).values_list('pk', flat=True).first()},
+        False,
+    )],
+    'metricas': lambda: [('get', reverse('website_app:metricas'), None, True)],
+    'estado_manifiesto': lambda: [(
+        'get', reverse('website_app:estado_manifiesto', args=[Envio.objects.order_by('pk').values_list('manifiesto_id', flat=True).first()]),
+        None, True,
+    )],
+    'cotizaciones_pendientes': lambda: [('get', reverse('website_app:cotizaciones_pendientes'), None, True)],
+    'atender_cotizaciones': lambda: [
+        ('post', reverse('website_app:atender_cotizaciones'), {'ids': _cotizaciones_pendientes()}, True),
+    ],
+    'buscar_personas': lambda: [
+        ('get', reverse('website_app:buscar_personas'), {'q': consulta}, True)
+        for consulta in ('a', 'maria', _carnet_prefijo())
+    ],
+    'perfiles': lambda: [('get', reverse('website_app:perfiles'), None, True)],
+    'liquidacion_mensajeros': lambda: [
+        ('get', reverse('website_app:liquidacion_mensajeros'), {'desde': '2000-01-01', 'hasta': '2100-12-31'}, True),
+    ],
+}
+
+
+@tag('presupuestos')
+class PruebasPresupuesto(TestCase):
+    """
+    Cada vista de website_app/urls.py debe declarar un presupuesto (website_app.presupuestos)
+    y las que tienen una petición de ejemplo en PETICIONES no deben superarlo.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        generar(ENVIOS_PRESUPUESTO, semilla=1)
+        cls.staff = User.objects.create_user('presupuestos', 'presupuestos@example.com', 'x', is_staff=True)
+        Cotizacion.objects.bulk_create(
+            Cotizacion(nombre_cliente=f'Cliente {i}', email='cliente@example.com') for i in range(100)
+        )
+
+    def test_vistas_declaran_presupuesto(self):
+        for patron in urls.urlpatterns:
+            with self.subTest(vista=patron.name):
+                self.assertIsNotNone(de_vista(patron.callback), f"{patron.name} no declara presupuesto")
+
+    def peticiones(self):
+        """(nombre, presupuesto, ruta, función que hace la petición) de cada entrada de PETICIONES."""
+        for patron in urls.urlpatterns:
+            construir = PETICIONES.get(patron.name)
+            limite = de_vista(patron.callback)
+            if construir is None or limite is None:
+                continue
+            for metodo, ruta, datos, staff in construir():
+                cliente = Client()
+                if staff:
+                    cliente.force_login(self.staff)
+                yield patron.name, limite, ruta, partial(getattr(cliente, metodo), ruta, datos)
+
+    def test_presupuestos_en_frio(self):
+        """Un worker recién iniciado carga los datos en memoria sin superar el presupuesto."""
+        for nombre, limite, ruta, peticion in self.peticiones():
+            with self.subTest(vista=nombre, ruta=ruta):
+                cache.clear()
+                for clase in cargas_versionadas():
+                    clase._actual = None
+                medicion = Medicion()
+                with connection.execute_wrapper(medicion):
+                    respuesta = peticion()
+                self.assertLess(respuesta.status_code, 500)
+                self.assertLessEqual(
+                    consultas_de(medicion), limite.consultas,
+                    f"{nombre} hizo {consultas_de(medicion)} consultas en frío (presupuesto {limite.consultas})",
+                )
+
+    def test_presupuestos(self):
+        factor = getattr(settings, 'PRESUPUESTO_FACTOR_LATENCIA_PRUEBAS', 1.0)
+        for nombre, limite, ruta, peticion in self.peticiones():
+            with self.subTest(vista=nombre, ruta=ruta):
+                peticion()
+
+                latencias = []
+                consultas = 0
+                sentencias = []
+                for _ in range(REPETICIONES):
+                    medicion = Medicion()
+                    with connection.execute_wrapper(medicion):
+                        inicio = time.perf_counter()
+                        respuesta = peticion()
+                        latencias.append((time.perf_counter() - inicio) * 1000)
+                    if consultas_de(medicion) > consultas:
+                        consultas = consultas_de(medicion)
+                        sentencias = [sentencia for sentencia in medicion.sentencias if not sentencia[0].startswith(SAVEPOINTS)]
+                self.assertLess(respuesta.status_code, 500)
+
+                detalle = '\n'.join(f'  {sql}' for sql, _ in sentencias)
+                self.assertLessEqual(
+                    consultas, limite.consultas,
+                    f"{nombre} hizo {consultas} consultas (presupuesto {limite.consultas}):\n{detalle}",
+                )
+                if limite.latencia_ms is not None:
+                    mediana = statistics.median(latencias)
+                    self.assertLessEqual(
+                        mediana, limite.latencia_ms * factor,
+                        f"{nombre} tardó {mediana:.1f} ms (objetivo {limite.latencia_ms} ms)",
+                    )
+
+
+class PruebasBenchmark(SimpleTestCase):
+
+    def test_comando_con_pocos_envios(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            salida = os.path.join(directorio, 'benchmark.json')
+            proceso = subprocess.run(
+                [
+                    sys.executable, 'manage.py', 'benchmark_tracking', '--settings=HM_paquete.settings_benchmark',
+                    '--envios=300', '--lote=50', '--iteraciones=3', f'--salida={salida}',
+                ],
+                cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=600,
+            )
+            self.assertEqual(proceso.returncode, 0, proceso.stderr)
+            with open(salida, encoding='utf-8') as archivo:
+                resultado = json.load(archivo)
+        self.assertEqual(resultado['volumen']['Envio'], 300)
+        self.assertEqual(set(resultado['escenarios']), {'shipment_details', 'index', 'insertar_cotizacion'})
+        for medicion in resultado['escenarios'].values():
+            self.assertEqual(medicion['iteraciones'], 3)
+
+
+class PruebasVerificarPresupuesto(SimpleTestCase):
+
+    def _medicion(self, *sentencias):
+        medicion = Medicion()
+        for sql in sentencias:
+            medicion(lambda *args: None, sql, None, False, {})
+        return medicion
+
+    def test_cargas_en_memoria_no_cuentan(self):
+        medicion = Medicion()
+        token = en_carga.set(True)
+        try:
+            medicion(lambda *args: None, 'SELECT 1', None, False, {})
+        finally:
+            en_carga.reset(token)
+        medicion(lambda *args: None, 'SELECT 2', None, False, {})
+        self.assertEqual((medicion.consultas, consultas_de(medicion)), (2, 1))
+
+    def test_savepoints_no_cuentan(self):
+        vista = presupuesto(consultas=1)(lambda request: None)
+        medicion = self._medicion('SAVEPOINT "s1"', 'SELECT 1', 'RELEASE SAVEPOINT "s1"')
+        self.assertEqual(consultas_de(medicion), 1)
+        with self.assertNoLogs('website_app.presupuestos', 'WARNING'):
+            verificar(vista, 'vista', medicion, 1)
+
+    def test_exceso_de_consultas(self):
+        vista = presupuesto(consultas=1)(lambda request: None)
+        with self.assertLogs('website_app.presupuestos', 'WARNING'):
+            verificar(vista, 'vista', self._medicion('SELECT 1', 'SELECT 2'), 1)
+
+
+class PruebasMetricas(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('metricas', is_staff=True)
+        cls.usuario = User.objects.create_user('cliente')
+
+    def estado(self, usuario=None, **cabeceras):
+        cliente = Client()
+        if usuario is not None:
+            cliente.force_login(usuario)
+        return cliente.get(reverse('website_app:metricas'), **cabeceras).status_code
+
+    def test_solo_staff(self):
+        self.assertEqual(self.estado(), 403)
+        self.assertEqual(self.estado(self.usuario), 403)
+        self.assertEqual(self.estado(self.staff), 200)
+
+    @override_settings(METRICAS_TOKEN='secreto')
+    def test_token(self):
+        self.assertEqual(self.estado(HTTP_AUTHORIZATION='Bearer secreto'), 200)
+        self.assertEqual(self.estado(HTTP_AUTHORIZATION='Bearer otro'), 403)
+        self.assertEqual(self.estado(HTTP_AUTHORIZATION='Basic secreto'), 403)
+
+    @override_settings(METRICAS_TOKEN='')
+    def test_sin_token_configurado(self):
+        self.assertEqual(self.estado(HTTP_AUTHORIZATION='Bearer '), 403)
+
+
+class ManejadorLista(logging.Handler):
+
+    def __init__(self):
+        super().__init__()
+        self.mensajes = []
+
+    def emit(self, record):
+        self.mensajes.append(record.getMessage())
+
+
+class PruebasRegistro(SimpleTestCase):
+
+    def registro(self, mensaje):
+        return logging.LogRecord('website_app', logging.INFO, __file__, 1, mensaje, None, None)
+
+    def test_cola_llena_descarta(self):
+        manejador = ManejadorCola(queue.Queue(maxsize=1))
+        manejador.handle(self.registro('uno'))
+        manejador.handle(self.registro('dos'))
+        self.assertEqual(manejador.queue.qsize(), 1)
+        self.assertEqual(manejador.descartados, 1)
+
+    def test_oyente_nuevo_tras_fork(self):
+        destino = ManejadorLista()
+        manejador = ManejadorCola(queue.Queue(maxsize=5))
+        manejador.listener = oyente = OyenteCola(manejador.queue, destino)
+        cola_padre, hilo_padre = manejador.queue, oyente._thread
+        # Lo que haría el hijo tras os.fork(): cola y hilo propios
+        manejador._tras_fork()
+        cola_padre.put_nowait(oyente._sentinel)
+        hilo_padre.join()
+        self.assertIsNot(manejador.queue, cola_padre)
+        self.assertIs(oyente.queue, manejador.queue)
+        self.assertEqual(manejador.queue.maxsize, 5)
+        manejador.handle(self.registro('desde el hijo'))
+        oyente.stop()
+        self.assertEqual(destino.mensajes, ['desde el hijo'])
+
+
+class PruebasSeguimientoEnVivo(TestCase):
+
+    @override_settings(SERVIDOR_ASGI=False)
+    def test_wsgi_sin_flujo(self):
+        respuesta = Client().get(reverse('website_app:eventos_envio', args=['HM0001CU']))
+        self.assertEqual(respuesta.status_code, 204)
+        self.assertContains(Client().get(reverse('website_app:index')), 'const seguimientoEnVivo = false;')
+
+    @override_settings(SERVIDOR_ASGI=True)
+    def test_asgi(self):
+        respuesta = Client().get(reverse('website_app:eventos_envio', args=['NOEXISTE']))
+        self.assertEqual(respuesta.status_code, 404)
+        self.assertContains(Client().get(reverse('website_app:index')), 'const seguimientoEnVivo = true;')
+
+
+class PruebasContadoresManifiesto(TestCase):
+
+    def contadores(self, manifiesto_id):
+        return dict(
+            ContadorManifiesto.objects.filter(manifiesto_id=manifiesto_id, cantidad__gt=0).values_list('estado', 'cantidad')
+        )
+
+    def test_altas_cambios_y_bajas(self):
+        envios = crear_envios([1, 2, 3])
+        manifiesto_id = envios[0].manifiesto_id
+        self.assertEqual(self.contadores(manifiesto_id), {'No Recibido': 3})
+        envios[0].estado = 'Recibido'
+        envios[0].save()
+        envios[1].delete()
+        self.assertEqual(self.contadores(manifiesto_id), {'No Recibido': 1, 'Recibido': 1})
+        resumen = ServicioContadoresManifiesto.resumen(manifiesto_id)
+        self.assertEqual((resumen['total_envios'], resumen['recibidos']), (2, 1))
+
+    def test_lote_grande(self):
+        manifiestos = [crear_envios([1])[0].manifiesto_id for _ in range(MAX_CLAVES_INDIVIDUALES + 1)]
+        ServicioContadoresManifiesto.aplicar_transiciones(
+            [(manifiesto_id, 'No Recibido', 'Entregado') for manifiesto_id in manifiestos]
+        )
+        for manifiesto_id in manifiestos:
+            self.assertEqual(self.contadores(manifiesto_id), {'Entregado': 1})
+
+    def test_reconciliar(self):
+        envios = crear_envios([1, 2])
+        manifiesto_id = envios[0].manifiesto_id
+        self.assertEqual(ServicioContadoresManifiesto.reconciliar([manifiesto_id]), 0)
+        # update() no envía señales: los contadores quedan desfasados
+        Envio.objects.filter(pk=envios[0].pk).update(estado='Entregado')
+        self.assertEqual(ServicioContadoresManifiesto.reconciliar([manifiesto_id]), 2)
+        self.assertEqual(self.contadores(manifiesto_id), {'No Recibido': 1, 'Entregado': 1})
+
+
+class PruebasOcupacion(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        generar(300, semilla=2)
+
+    def ocupaciones(self):
+        return set(OcupacionEnvio.objects.values_list('envio_id', 'item_id', 'locacion_id'))
+
+    def test_reconstruir_coincide_con_incremental(self):
+        esperadas = self.ocupaciones()
+        self.assertTrue(esperadas)
+        OcupacionEnvio.objects.all().delete()
+        self.assertEqual(ServicioOcupacion.reconstruir(), len(esperadas))
+        self.assertEqual(self.ocupaciones(), esperadas)
+        envio_ids = [envio_id for envio_id, _, _ in esperadas][:20]
+        OcupacionEnvio.objects.filter(envio_id__in=envio_ids).delete()
+        for envio_id in envio_ids:
+            ServicioOcupacion.recalcular_envio(envio_id)
+        self.assertEqual(self.ocupaciones(), esperadas)
+
+    def test_reconstruir_por_lotes(self):
+        esperadas = self.ocupaciones()
+        with mock.patch('website_app.service.ocupacion_service.LOTE_ENVIOS', 7):
+            self.assertEqual(ServicioOcupacion.reconstruir(), len(esperadas))
+        self.assertEqual(self.ocupaciones(), esperadas)
+
+    def test_marcar_fuera_de_almacen_crea_las_que_faltan(self):
+        esperadas = {fila for fila in self.ocupaciones() if fila[2] is None}
+        envio_ids = sorted(envio_id for envio_id, _, _ in esperadas)[:30]
+        OcupacionEnvio.objects.filter(envio_id__in=envio_ids[::2]).delete()
+        OcupacionEnvio.objects.filter(envio_id__in=envio_ids[1::2]).update(locacion_id=1, item_id=0)
+        with mock.patch('website_app.service.ocupacion_service.LOTE_ENVIOS', 4):
+            self.assertEqual(ServicioOcupacion.marcar_fuera_de_almacen(envio_ids), len(envio_ids))
+        self.assertEqual(
+            set(OcupacionEnvio.objects.filter(envio_id__in=envio_ids).values_list('envio_id', 'item_id', 'locacion_id')),
+            {fila for fila in esperadas if fila[0] in envio_ids},
+        )
+
+    def test_ocupacion_coincide_con_envio(self):
+        nombres = dict(Locacion.objects.values_list('pk', 'nombre'))
+        ocupaciones = dict(OcupacionEnvio.objects.values_list('envio_id', 'locacion_id'))
+        for envio_id, estado, locacion in Envio.objects.filter(pk__in=ocupaciones).values_list('pk', 'estado', 'locacion'):
+            locacion_id = ocupaciones[envio_id]
+            with self.subTest(envio=envio_id, estado=estado):
+                if estado == 'Recibido':
+                    self.assertEqual(nombres[locacion_id], locacion)
+                elif estado in ('Enviado', 'Entregado'):
+                    self.assertIsNone(locacion_id)
+
+
+class PruebasSeguimiento(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        generar(300, semilla=2)
+        cls.central = Locacion.objects.get(es_almacen_central=True)
+
+    def envio(self, cod):
+        return Client().get(reverse('website_app:shipment_details', args=[cod])).json()['envio']
+
+    def test_almacen_y_dias_de_envio_locacion(self):
+        envio = Envio.objects.filter(estado='Recibido', locacion=self.central.nombre).first()
+        # La ocupación interna no cambia lo que ve el cliente
+        OcupacionEnvio.objects.filter(envio_id=envio.pk).update(locacion_id=None)
+        self.assertEqual(self.envio(envio.no_envio)['almacen'], self.central.nombre)
+        envio.itemdocumento_set.all().delete()
+        self.assertEqual(self.envio(envio.no_envio)['dias_para_entrega'], 7)
+        Envio.objects.filter(pk=envio.pk).update(locacion='Otro almacén')
+        respuesta = self.envio(envio.no_envio)
+        self.assertEqual((respuesta['almacen'], respuesta['dias_para_entrega']), ('Otro almacén', 5))
+
+
+class PruebasEta(SimpleTestCase):
+
+    def test_percentiles_por_rango(self):
+        reservorio = Reservorio()
+        for dias in range(100, 0, -1):
+            reservorio.agregar(dias, 1000, random.Random(1))
+        self.assertEqual(reservorio.percentiles(), (50.0, 80.0, 95.0))
+
+    def test_reservorio_acotado(self):
+        reservorio = Reservorio()
+        aleatorio = random.Random(1)
+        for dias in range(10000):
+            reservorio.agregar(dias, 50, aleatorio)
+        self.assertEqual((reservorio.vistos, len(reservorio.muestra)), (10000, 50))
+        # La muestra es uniforme: su mediana queda cerca de la del flujo
+        self.assertLess(abs(reservorio.percentiles()[0] - 5000), 1500)
+
+    def test_clave_mas_especifica_con_muestras(self):
+        motor = MotorEta([
+            ('entrada', 0, 0, 100, 5, 8, 12),
+            ('entrada', 1, 0, 50, 4, 6, 9),
+            ('entrada', 1, 7, MIN_MUESTRAS - 1, 1, 1, 1),
+            ('entrada', 2, 7, MIN_MUESTRAS, 2, 3, 4),
+        ])
+        self.assertEqual(motor.percentiles('entrada', 2, 7), (2, 3, 4))
+        self.assertEqual(motor.percentiles('entrada', 1, 7), (4, 6, 9))
+        self.assertEqual(motor.percentiles('entrada', 3, None), (5, 8, 12))
+        self.assertIsNone(motor.percentiles('despacho', 1, 7))
+
+    def test_dias_restantes(self):
+        motor = MotorEta([('despacho', 0, 0, 100, 2, 4, 7)])
+        ahora = timezone.make_aware(datetime(2024, 3, 10, 12))
+        casos = {0: 2, 1: 1, 2: 2, 3: 1, 5: 2, 6: 1, 9: 1}
+        for transcurridos, esperados in casos.items():
+            with self.subTest(transcurridos=transcurridos):
+                fecha = ahora - timedelta(days=transcurridos)
+                self.assertEqual(motor.dias_restantes('despacho', 3, 4, fecha, ahora), esperados)
+
+
+class PruebasCalculoEta(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        generar(600, semilla=3)
+
+    def test_calcular(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            resultado = ServicioEta.calcular(semilla=1)
+        self.assertGreater(resultado['items'], 0)
+        self.assertEqual(TiempoEntrega.objects.count(), resultado['filas'])
+        for fila in TiempoEntrega.objects.all():
+            with self.subTest(fila=str(fila)):
+                self.assertLessEqual(fila.p50, fila.p80)
+                self.assertLessEqual(fila.p80, fila.p95)
+        # Las claves generales agregan todas las muestras de su etapa
+        generales = dict(TiempoEntrega.objects.filter(origen_id=0, destino_id=0).values_list('etapa', 'muestras'))
+        por_origen = TiempoEntrega.objects.filter(destino_id=0).exclude(origen_id=0)
+        for etapa, muestras in generales.items():
+            self.assertEqual(sum(por_origen.filter(etapa=etapa).values_list('muestras', flat=True)), muestras)
+        # calcular_eta publica la versión nueva y el motor la carga
+        self.assertEqual(MotorEta.obtener().percentiles('entrada', 0, 0), tuple(
+            TiempoEntrega.objects.filter(etapa='entrada', origen_id=0, destino_id=0).values_list('p50', 'p80', 'p95').get()
+        ))
+
+
+class PruebasEmpaquetado(SimpleTestCase):
+
+    def pesos(self, cargas, pesos):
+        return [sorted((pesos[envio_id] for envio_id in carga.envios), reverse=True) for carga in cargas]
+
+    def test_best_fit_decreasing(self):
+        pesos = {1: 7, 2: 5, 3: 4, 4: 3, 5: 1}
+        cargas = PlanificadorDespacho.empaquetar(list(pesos.items()), 1, 2, 10, 40)
+        self.assertEqual(self.pesos(cargas, pesos), [[7, 3], [5, 4, 1]])
+        self.assertEqual([carga.peso for carga in cargas], [10, 10])
+
+    def test_limites(self):
+        pesos = {1: 80, 2: 1, 3: 1, 4: 1, 5: 1, 6: 1}
+        cargas = PlanificadorDespacho.empaquetar(list(pesos.items()), 1, 2, 60, 2)
+        # El envío más pesado que el límite va solo; los demás, de dos en dos
+        self.assertEqual(self.pesos(cargas, pesos), [[80], [1, 1], [1, 1], [1]])
+
+    def test_aleatorio(self):
+        aleatorio = random.Random(7)
+        pesos = {envio_id: round(aleatorio.uniform(0.2, 30), 2) for envio_id in range(500)}
+        cargas = PlanificadorDespacho.empaquetar(list(pesos.items()), 1, 2, 60, 40)
+        asignados = [envio_id for carga in cargas for envio_id in carga.envios]
+        self.assertEqual(sorted(asignados), sorted(pesos))
+        for carga in cargas:
+            self.assertLessEqual(carga.peso, 60 + 1e-9)
+            self.assertLessEqual(len(carga.envios), 40)
+        # Cota de best fit decreasing: 11/9 del óptimo más 6/9
+        self.assertLessEqual(len(cargas), 11 / 9 * math.ceil(sum(pesos.values()) / 60) + 1)
+
+    def test_planificar_por_municipio(self):
+        cargas, sin_provincia = PlanificadorDespacho.planificar(
+            [(1, 5, 10, 100), (2, 5, 10, 101), (3, 5, 10, 100), (4, 5, None, None), (5, None, 11, None)],
+            peso_maximo=60, envios_maximos=40,
+        )
+        self.assertEqual(sin_provincia, [4])
+        self.assertEqual(
+            [(carga.provincia_id, carga.municipio_id, sorted(carga.envios)) for carga in cargas],
+            [(10, 100, [1, 3]), (10, 101, [2]), (11, None, [5])],
+        )
+
+
+class PruebasDespachar(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        generar(600, semilla=4)
+        cls.usuario = User.objects.create_user('planificador')
+        cls.locacion_id = OcupacionEnvio.objects.filter(
+            envio_id__in=Envio.objects.filter(estado='Recibido', entrega_domicilio=True).values('pk')
+        ).values_list('locacion_id', flat=True).first()
+
+    def test_simular_y_despachar(self):
+        candidatos = set(PlanificadorDespacho.candidatos(self.locacion_id).values_list('pk', flat=True))
+        self.assertTrue(candidatos)
+        simulado = PlanificadorDespacho.despachar(self.locacion_id, self.usuario, simular=True)
+        self.assertEqual(simulado['despachos'], [])
+        self.assertEqual(set(PlanificadorDespacho.candidatos(self.locacion_id).values_list('pk', flat=True)), candidatos)
+        self.assertFalse(Auditoria.objects.exists())
+
+        mensajero_id = Mensajero.objects.values_list('pk', flat=True).first()
+        resultado = PlanificadorDespacho.despachar(self.locacion_id, self.usuario, mensajeros=[mensajero_id], ip='10.0.0.1')
+        despachados = {envio_id for carga in resultado['cargas'] for envio_id in carga.envios}
+        self.assertEqual(despachados | set(resultado['sin_provincia']), candidatos)
+        self.assertEqual(len(resultado['despachos']), len(resultado['cargas']))
+        self.assertEqual(
+            set(DespachoMensajero.objects.filter(pk__in=resultado['despachos']).values_list('mensajero_id', flat=True)), {mensajero_id},
+        )
+        self.assertEqual(set(Envio.objects.filter(pk__in=despachados).values_list('estado', flat=True)), {'Enviado'})
+        # Los envíos despachados salen del almacén
+        self.assertFalse(PlanificadorDespacho.candidatos(self.locacion_id).filter(pk__in=despachados).exists())
+        # Auditoría: un registro por despacho y uno por envío que cambió de estado
+        auditoria = Auditoria.objects.filter(usuario=self.usuario, ip='10.0.0.1')
+        self.assertEqual(
+            set(auditoria.filter(accion=Auditoria.Accion.DESPACHO).values_list('object_id', flat=True)),
+            set(resultado['despachos']),
+        )
+        self.assertEqual(
+            set(auditoria.filter(accion=Auditoria.Accion.CAMBIO_ESTADO_ENVIO).values_list('object_id', flat=True)),
+            despachados,
+        )
+        self.assertEqual(set(DespachoMensajero.objects.filter(pk__in=resultado['despachos']).values_list('usuario', flat=True)), {'planificador'})
+
+    @override_settings(PLANIFICADOR_DESPACHO={'PESO_MAXIMO': 1000, 'ENVIOS_MAXIMOS': 2})
+    def test_limites_de_settings(self):
+        self.assertEqual(PlanificadorDespacho.limites(), (1000.0, 2))
+        cargas, _ = PlanificadorDespacho.planificar([(n, 1, 10, 100) for n in range(5)])
+        self.assertEqual([len(carga.envios) for carga in cargas], [2, 2, 1])
+
+
+class PruebasArchivo(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        generar(300, semilla=5)
+        cls.ids = list(Envio.objects.filter(estado='Entregado').order_by('pk').values_list('pk', flat=True)[:10])
+
+    def respuesta(self, cod):
+        return Client().get(reverse('website_app:shipment_details', args=[cod])).json()
+
+    def test_archivar_no_borra(self):
+        self.assertEqual(ServicioArchivo.archivar_lote(self.ids + [Envio.objects.exclude(estado='Entregado').first().pk]), 10)
+        self.assertEqual(Envio.objects.filter(pk__in=self.ids).count(), 10)
+        self.assertEqual(EnvioArchivado.objects.count(), 10)
+        # Repetir no duplica ni vuelve a procesar
+        self.assertEqual(ServicioArchivo.archivar_lote(self.ids), 0)
+        self.assertFalse(ServicioArchivo.candidatos(dias=0).filter(pk__in=self.ids).exists())
+
+    def test_respuesta_archivada_identica(self):
+        codigos = list(Envio.objects.filter(pk__in=self.ids).values_list('no_envio', flat=True))
+        vivas = {cod: self.respuesta(cod) for cod in codigos}
+        ServicioArchivo.archivar_lote(self.ids)
+        self.assertEqual(ServicioArchivo.purgar(tamano_lote=3), 10)
+        self.assertFalse(Envio.objects.filter(pk__in=self.ids).exists())
+        self.assertFalse(ItemDocumento.objects.filter(envio_id__in=self.ids).exists())
+        for cod in codigos:
+            with self.subTest(cod=cod):
+                self.assertEqual(self.respuesta(cod.lower()), vivas[cod])
+
+    def test_purgar_solo_verificados(self):
+        con_item_nuevo, corrupto, sin_archivo = self.ids[7:]
+        ServicioArchivo.archivar_lote(self.ids[:9])
+        item = ItemDocumento.objects.filter(envio_id=con_item_nuevo).first()
+        item.pk = None
+        item.save()
+        EnvioArchivado.objects.filter(envio_id=corrupto).update(datos=b'no es zlib')
+        self.assertEqual(ServicioArchivo.purgar(), 7)
+        self.assertEqual(set(Envio.objects.filter(pk__in=self.ids).values_list('pk', flat=True)),
+                         {sin_archivo, con_item_nuevo, corrupto})
+        # Lo que queda no se vuelve a purgar
+        self.assertEqual(ServicioArchivo.purgar(), 0)
+
+    def test_comando_solo_copia_salvo_purgar(self):
+        call_command('archivar_envios', dias=0, stdout=StringIO())
+        self.assertTrue(Envio.objects.filter(pk__in=self.ids).exists())
+        salida = StringIO()
+        call_command('archivar_envios', dias=0, purgar=True, stdout=salida)
+        self.assertIn('Envíos purgados', salida.getvalue())
+        self.assertFalse(Envio.objects.filter(estado='Entregado', pk__in=self.ids).exists())
+
+
+def liquidaciones():
+    return {
+        (mensajero_id, fecha): (entregados, devueltos, total)
+        for mensajero_id, fecha, entregados, devueltos, total in LiquidacionDiariaMensajero.objects.values_list(
+            'mensajero_id', 'fecha', 'entregados', 'devueltos', 'total',
+        )
+    }
+
+
+class PruebasLiquidacion(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        generar(300, semilla=6)
+        cls.tipo = ContentType.objects.get_for_model(DespachoMensajero)
+
+    def items_confirmados(self):
+        return ItemDocumento.objects.filter(documento_type=self.tipo, confirmado=True, envio__estado='Entregado')
+
+    def test_reconciliar_corrige(self):
+        esperadas = liquidaciones()
+        self.assertTrue(esperadas)
+        primera, segunda = list(esperadas)[:2]
+        LiquidacionDiariaMensajero.objects.filter(mensajero_id=primera[0], fecha=primera[1]).update(entregados=0)
+        LiquidacionDiariaMensajero.objects.filter(mensajero_id=segunda[0], fecha=segunda[1]).delete()
+        self.assertEqual(ServicioLiquidacion.reconciliar(), 2)
+        self.assertEqual(liquidaciones(), esperadas)
+        self.assertEqual(ServicioLiquidacion.reconciliar(), 0)
+
+    def test_recalcula_por_senal(self):
+        item = self.items_confirmados().select_related('envio').first()
+        clave = ServicioLiquidacion.claves_de_items([item.pk]).pop()
+        entregados, devueltos, total = liquidaciones()[clave]
+        item.confirmado = False
+        item.save()
+        self.assertEqual(liquidaciones().get(clave, (0, 0, 0)), (entregados - 1, devueltos, total - item.envio.pago_mensajero))
+        self.assertEqual(ServicioLiquidacion.reconciliar(), 0)
+
+    def test_archivar_purgar_y_reconciliar(self):
+        esperadas = liquidaciones()
+        ids = list(self.items_confirmados().order_by('envio_id').values_list('envio_id', flat=True).distinct()[:40])
+        claves = ServicioLiquidacion.claves_de_envios(ids)
+        self.assertTrue(claves)
+        self.assertEqual(ServicioArchivo.archivar_lote(ids), len(ids))
+        self.assertEqual(ServicioArchivo.purgar_lote(ids), len(ids))
+        self.assertEqual(liquidaciones(), esperadas)
+        desde = min(fecha for _, fecha in claves)
+        self.assertEqual(ServicioLiquidacion.reconciliar(desde=desde), 0)
+        self.assertEqual(ServicioLiquidacion.reconciliar(), 0)
+        # Aunque las filas se pierdan, el archivo permite reconstruirlas
+        LiquidacionDiariaMensajero.objects.all().delete()
+        self.assertEqual(ServicioLiquidacion.reconciliar(), len(esperadas))
+        self.assertEqual(liquidaciones(), esperadas)
+
+    def test_conserva_dias_sin_despachos(self):
+        mensajero_id = Mensajero.objects.values_list('pk', flat=True).first()
+        LiquidacionDiariaMensajero.objects.create(
+            mensajero_id=mensajero_id, fecha=date(1999, 1, 1), entregados=3, total=Decimal('1200.00'),
+        )
+        esperadas = liquidaciones()
+        self.assertEqual(ServicioLiquidacion.reconciliar(), 0)
+        self.assertEqual(liquidaciones(), esperadas)
+
+
+class PruebasInstantanea(SimpleTestCase):
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.ruta = os.path.join(directorio.name, 'instantanea.bin')
+        instantanea._instantanea = None
+        self.addCleanup(setattr, instantanea, '_instantanea', None)
+
+    def fila(self, numero, estado='Recibido'):
+        return (f'HM{numero:08d}CU', estado, 'Almacén', 'Entrada', 'entradarecibida', '01/03/2024 10:00 AM')
+
+    def test_busqueda_binaria(self):
+        filas = [self.fila(numero) for numero in range(0, 2000, 2)]
+        random.Random(1).shuffle(filas)
+        filas += [self.fila(10, 'Enviado'), ('X' * 31, 'Recibido', '', '', '', '')]
+        self.assertEqual(instantanea.escribir(self.ruta, filas), 1000)
+        lector = instantanea.InstantaneaSeguimiento(self.ruta)
+        self.addCleanup(lector.cerrar)
+        for numero in (0, 2, 1000, 1998):
+            with self.subTest(numero=numero):
+                self.assertEqual(lector.buscar(f'hm{numero:08d}cu'), self.fila(numero))
+        # Fuera del rango, entre dos claves y demasiado larga
+        for numero in (-1, 1, 999, 1999, 5000):
+            with self.subTest(numero=numero):
+                self.assertIsNone(lector.buscar(f'HM{numero:08d}CU'))
+        self.assertIsNone(lector.buscar('X' * 31))
+        # Un código repetido conserva la última fila
+        self.assertEqual(lector.buscar('HM00000010CU')[1], 'Enviado')
+
+    def test_respuesta_degradada(self):
+        instantanea.escribir(self.ruta, [self.fila(1)])
+        with override_settings(SEGUIMIENTO_INSTANTANEA=self.ruta):
+            respuesta = instantanea.respuesta('hm00000001cu')
+            self.assertIsNone(instantanea.respuesta('HM00000002CU'))
+        self.assertIsNone(respuesta['envio']['dias_para_entrega'])
+        self.assertEqual(respuesta['envio']['almacen'], 'Almacén')
+        self.assertTrue(respuesta['posiblemente_desactualizado'])
+        self.assertEqual(len(respuesta['historial']), 1)
+
+    def test_reabre_al_reemplazar(self):
+        instantanea.escribir(self.ruta, [self.fila(1)])
+        with override_settings(SEGUIMIENTO_INSTANTANEA=self.ruta):
+            self.assertEqual(instantanea.obtener().cantidad, 1)
+            instantanea.escribir(self.ruta, [self.fila(1), self.fila(2)])
+            instantanea._revisada = 0.0
+            self.assertEqual(instantanea.obtener().cantidad, 2)
+
+
+class PruebasSeguimientoDegradado(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_envios([1])
+        cls.cod = Envio.objects.values_list('no_envio', flat=True).get()
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        ruta = os.path.join(directorio.name, 'instantanea.bin')
+        instantanea.escribir(ruta, [(self.cod, 'Instantánea', '', '', '', '')])
+        ajustes = override_settings(SEGUIMIENTO_INSTANTANEA=ruta, SEGUIMIENTO_FALLAS_DEGRADADO=3)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        instantanea._instantanea = None
+        instantanea._degradado_hasta = 0.0
+        instantanea._fallas.clear()
+        self.addCleanup(setattr, instantanea, '_instantanea', None)
+        self.addCleanup(setattr, instantanea, '_degradado_hasta', 0.0)
+        self.addCleanup(instantanea._fallas.clear)
+
+    def estado(self):
+        ruta = reverse('website_app:shipment_details', args=[self.cod])
+        return Client().get(ruta).json()['envio']['estado']
+
+    def fallar(self, excepcion=instantanea.ConsultasLentas):
+        return mock.patch('website_app.views.ServicioSeguimiento.envios', side_effect=excepcion)
+
+    def test_falla_aislada_no_degrada(self):
+        with self.fallar(), self.assertLogs('website_app', 'WARNING'):
+            self.assertEqual(self.estado(), 'Instantánea')
+        self.assertFalse(instantanea.modo_degradado_activo())
+        self.assertNotEqual(self.estado(), 'Instantánea')
+
+    def test_fallas_repetidas_degradan(self):
+        with self.fallar(), self.assertLogs('website_app', 'WARNING'):
+            for _ in range(3):
+                self.estado()
+        self.assertTrue(instantanea.modo_degradado_activo())
+        self.assertEqual(self.estado(), 'Instantánea')
+
+    def test_error_interno_sin_detalle(self):
+        with self.fallar(RuntimeError('secreto')), self.assertLogs('website_app', 'ERROR'):
+            respuesta = Client().get(reverse('website_app:shipment_details', args=[self.cod]))
+        self.assertEqual(respuesta.status_code, 500)
+        self.assertNotIn('secreto', respuesta.content.decode())
+
+
+class PruebasPerfilado(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('perfilador', is_staff=True)
+        cls.usuario = User.objects.create_user('curioso')
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        ajustes = override_settings(PERFILADO_DIRECTORIO=directorio.name)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def pedir(self, usuario=None, parametros='?perfilar=1', **cabeceras):
+        cliente = Client()
+        if usuario is not None:
+            cliente.force_login(usuario)
+        ruta = reverse('website_app:shipment_details', args=['NOEXISTE'])
+        return cliente.get(ruta + parametros, **cabeceras)
+
+    def token(self):
+        salida = StringIO()
+        call_command('firmar_perfilado', stdout=salida)
+        return salida.getvalue().splitlines()[0].removeprefix('X-Perfilar: ')
+
+    def test_sin_solicitud_no_perfila(self):
+        for usuario, parametros in ((None, '?perfilar=1'), (self.usuario, '?perfilar=1'), (self.staff, '')):
+            with self.subTest(usuario=usuario, parametros=parametros):
+                self.assertNotIn('X-Perfil', self.pedir(usuario, parametros))
+        self.assertEqual(perfilado.listar(), [])
+
+    def test_sin_solicitud_no_verifica_ni_analiza(self):
+        fabrica = RequestFactory()
+        with mock.patch.object(perfilado, 'firma_valida') as firma_valida:
+            for ruta in ('/seguimiento/HM1', '/seguimiento/HM1?pagina=2'):
+                with self.subTest(ruta=ruta):
+                    request = fabrica.get(ruta)
+                    self.assertFalse(perfilado.solicitado(request))
+                    # request.GET es una propiedad en caché: no se analizó la query
+                    self.assertNotIn('GET', request.__dict__)
+        firma_valida.assert_not_called()
+
+    def test_listado_desde_el_indice(self):
+        nombres = [self.pedir(self.staff)['X-Perfil'] for _ in range(2)]
+        with mock.patch.object(perfilado, 'leer', side_effect=AssertionError('no debe abrir informes')):
+            resumenes = perfilado.resumenes()
+        self.assertEqual([resumen['nombre'] for resumen in resumenes], nombres[::-1])
+        self.assertEqual(resumenes[0]['usuario'], 'perfilador')
+        self.assertNotIn('sentencias', resumenes[0])
+
+        # Sin índice se leen los informes
+        os.remove(os.path.join(perfilado.directorio(), perfilado.INDICE))
+        self.assertEqual(perfilado.resumenes(), resumenes)
+        cliente = Client()
+        cliente.force_login(self.staff)
+        self.assertContains(cliente.get(reverse('website_app:perfiles')), nombres[0])
+
+    def test_staff_con_parametro(self):
+        respuesta = self.pedir(self.staff)
+        informe = perfilado.leer(respuesta['X-Perfil'])
+        self.assertEqual(perfilado.listar(), [respuesta['X-Perfil']])
+        self.assertEqual(informe['usuario'], 'perfilador')
+        self.assertEqual(informe['estado'], respuesta.status_code)
+        self.assertEqual(informe['consultas'], len(informe['sentencias']))
+        self.assertGreater(informe['consultas'], 0)
+        self.assertIn('cumulative', informe['perfil'])
+
+    def test_cabecera_firmada(self):
+        respuesta = self.pedir(parametros='', HTTP_X_PERFILAR=self.token())
+        self.assertIsNone(perfilado.leer(respuesta['X-Perfil'])['usuario'])
+
+    def test_firma_invalida_o_caducada(self):
+        token = self.token()
+        self.assertNotIn('X-Perfil', self.pedir(self.staff, HTTP_X_PERFILAR=token + 'x'))
+        with override_settings(PERFILADO_FIRMA_SEGUNDOS=-1):
+            self.assertFalse(perfilado.firma_valida(token))
+            self.assertNotIn('X-Perfil', self.pedir(parametros='', HTTP_X_PERFILAR=token))
+        self.assertEqual(perfilado.listar(), [])
+
+    @override_settings(PERFILADO_MAX_INFORMES=2)
+    def test_descarta_los_mas_antiguos(self):
+        nombres = [self.pedir(self.staff)['X-Perfil'] for _ in range(3)]
+        self.assertEqual(perfilado.listar(), nombres[:0:-1])
+        self.assertIsNone(perfilado.leer(nombres[0]))
+        self.assertEqual([resumen['nombre'] for resumen in perfilado.resumenes()], nombres[:0:-1])
+        self.assertEqual(sorted(perfilado._leer_indice()), nombres[1:])
+
+    def test_nombre_invalido(self):
+        self.assertIsNone(perfilado.leer('../settings.json'))
+        cliente = Client()
+        cliente.force_login(self.staff)
+        self.assertEqual(cliente.get(reverse('website_app:perfil', args=['no-existe.json'])).status_code, 404)
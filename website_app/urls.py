@@ -14,5 +14,14 @@ urlpatterns = [
     path('sea_freight_service', views.sea_freight_service,name='sea_freight_service'),
     path('contact', views.contact, name='contact'),
     path('shipmentDetails/<str:cod>/', views.shipment_details, name='shipment_details'),
-    path('insertar-cotizacion', views.insertar_cotizacion, name='insertar_cotizacion')
+    path('shipmentEvents/<str:cod>/', views.eventos_envio, name='eventos_envio'),
+    path('insertar-cotizacion', views.insertar_cotizacion, name='insertar_cotizacion'),
+    path('metrics', views.metricas, name='metricas'),
+    path('manifiestos/<int:manifiesto_id>/estado', views.estado_manifiesto, name='estado_manifiesto'),
+    path('cotizaciones/pendientes', views.cotizaciones_pendientes, name='cotizaciones_pendientes'),
+    path('cotizaciones/atender', views.atender_cotizaciones, name='atender_cotizaciones'),
+    path('personas/buscar', views.buscar_personas, name='buscar_personas'),
+    path('perfiles', views.perfiles, name='perfiles'),
+    path('perfiles/<str:nombre>', views.perfil, name='perfil'),
+    path('mensajeros/liquidacion', views.liquidacion_mensajeros, name='liquidacion_mensajeros'),
 ]
\ No newline at end of file
@@ -1,220 +1,179 @@
+import asyncio
+import json
 import logging
+from datetime import date
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, get_object_or_404
-from django.http import HttpResponse, JsonResponse
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import DatabaseError, connection
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
-from hmpaquetesapp.models import Envio, ItemDocumento, Locacion
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET, require_POST
+from hmpaquetesapp.models import Envio
+from hmpaquetesapp.service.busqueda_persona_service import ServicioBusquedaPersona
 from cotizacion_app.service.cotizacion_service import ServicioCotizacion
-from cotizacion_app.models import Servicio, Cotizacion
+from cotizacion_app.models import Cotizacion
+from website_app import instantanea, perfilado
+from website_app.eventos import bus, iniciar_oyente
+from website_app.metricas import registro
+from website_app.presupuestos import presupuesto
+from website_app.service.liquidacion_service import ServicioLiquidacion
+from website_app.service.manifiesto_service import ServicioContadoresManifiesto
+from website_app.service.archivo_service import ServicioArchivo
+from website_app.service.seguimiento_service import ServicioSeguimiento
 
 logger = logging.getLogger(__name__)
 
+@presupuesto(consultas=0, latencia_ms=100)
 def index(request):
-    servicios = Servicio.objects.filter(activo=True)
+    servicios = ServicioCotizacion.listar_servicios_activos()
     contexto = {
         'servicios': servicios,
+        'seguimiento_en_vivo': getattr(settings, 'SERVIDOR_ASGI', False),
     }
     return render(request, 'website_app/index.html', contexto) 
 
+@presupuesto(consultas=0, latencia_ms=100)
 def about(request):
     return render(request, 'website_app/about.html') 
 
+@presupuesto(consultas=0, latencia_ms=100)
 def services(request):
     return render(request, 'website_app/service.html') 
 
+@presupuesto(consultas=0, latencia_ms=100)
 def goods_storage(request):
     return render(request, 'website_app/goods_storage.html')
     
+@presupuesto(consultas=0, latencia_ms=100)
 def air_freight_service(request):
     return render(request, 'website_app/air_freight_service.html')
 
+@presupuesto(consultas=0, latencia_ms=100)
 def land_transport_service(request):
     return render(request, 'website_app/land_transport_service.html')
 
+@presupuesto(consultas=0, latencia_ms=100)
 def sea_freight_service(request):
     return render(request, 'website_app/sea_freight_service.html')
 
+@presupuesto(consultas=0, latencia_ms=100)
 def contact(request):
     return render(request, 'website_app/contact.html')
 
+def _respuesta_degradada(cod):
+    respuesta = instantanea.respuesta(cod)
+    if respuesta is not None:
+        logger.info('Historial consultado', extra={'campos': {'codigo': cod, 'estado': respuesta['envio']['estado'], 'degradado': True}})
+    return respuesta
+
+@presupuesto(consultas=5, latencia_ms=200)
 def shipment_details(request, cod):
     """
     Obtiene el historial de un envío (Envio) buscando sus ItemsDocumento
     y utilizando la GenericForeignKey (item.documento) para cargar el documento asociado.
+    Los envíos archivados se responden desde EnvioArchivado con el mismo contenido.
+
+    Si la base de datos falla o tarda más de SEGUIMIENTO_UMBRAL_LENTO_MS se responde desde
+    la instantánea de seguimiento, marcando la respuesta como posiblemente desactualizada.
+    Tras varias fallas seguidas el proceso pasa a modo degradado y, mientras dure, consulta
+    primero la instantánea (ver instantanea.registrar_falla).
     """
+    if instantanea.modo_degradado_activo():
+        respuesta = _respuesta_degradada(cod)
+        if respuesta is not None:
+            return JsonResponse(respuesta, safe=False)
+
     try:
-        logger.info(f'Intentando obtener historial para el código: {cod}')
-        
-        envio_obj = Envio.objects.get(no_envio__iexact=cod)
-        
-        items = ItemDocumento.objects.filter(envio=envio_obj).select_related('documento_type').order_by('pk')
-        
-        logger.info(f'Items de documento encontrados: {items.count()}')
-        
-        if not items.exists():
-            # Calcular días para entrega
-            dias_para_entrega = 0
-            if envio_obj.estado == 'Recibido':
-                # envio_obj.locacion es un string, necesitamos buscar el objeto Locacion
-                locacion_obj = None
-                if envio_obj.locacion:
-                    try:
-                        locacion_obj = Locacion.objects.get(nombre=envio_obj.locacion)
-                    except Locacion.DoesNotExist:
-                        pass
-                
-                if locacion_obj and locacion_obj.es_almacen_central:
-                    dias_para_entrega = 7
-                else:
-                    dias_para_entrega = 5
-            elif envio_obj.estado == 'Enviado':
-                dias_para_entrega = 1
-            
-            # Obtener URL de foto de forma segura
-            foto_url = ''
-            if envio_obj.estado == 'Entregado' and envio_obj.foto_entrega:
-                try:
-                    foto_url = envio_obj.foto_entrega.url
-                except (AttributeError, ValueError):
-                    foto_url = ''
-            
-            return JsonResponse({ 
-                'success': True, 
-                'envio': {
-                    'codigo': envio_obj.no_envio,
-                    'estado': envio_obj.estado,
-                    'almacen': envio_obj.locacion if envio_obj.estado != 'No Recibido' and envio_obj.locacion else '',
-                    'dias_para_entrega': dias_para_entrega,
-                    'foto_confirmacion': foto_url,
-                },
-                'historial': [], 
-                'mensaje': 'No se encontraron movimientos para este envío.' 
-            }, safe=False)
-
-        historial = []
-        # Inicializar variables por si el loop no procesa ningún item
-        fecha = None
-        tipo = None
-        
-        for item in items:
-            doc = item.documento 
-            
-            if doc is None:
-                logger.info(f"Advertencia: Documento no resuelto para ItemDocumento ID: {item.id}. Omitiendo item.")
-                continue
-
-            # datos básicos
-            tipo = item.documento_type.model
-            evento = "Desconocido"
-            detalle = ""
-            
-            # Usamos getattr de forma segura
-            fecha_dt = getattr(doc, 'fecha_creacion', None)
-            fecha = fecha_dt.strftime('%d/%m/%Y %I:%M %p') if fecha_dt else 'N/A'
-
-            if tipo == 'entradarecibida':
-                evento = "Entrada"
-                locacion_nombre = getattr(getattr(doc, 'locacion_origen', None), 'nombre', 'Desconocida')
-                detalle = f"""Se da entrada al envío en el almacén <strong>{locacion_nombre}</strong>"""
-
-            elif tipo == 'transferenciaalmacen':
-                evento = "Transferencia"
-                locacion_origen_nombre = getattr(getattr(doc, 'locacion_origen', None), 'nombre', 'Desconocido')
-                locacion_destino_nombre = getattr(getattr(doc, 'locacion_destino', None), 'nombre', 'Desconocido')
-
-                detalle = f"""El envio a arribado al almacén <strong>{locacion_destino_nombre}</strong> transferido desde el almacén <strong>{locacion_origen_nombre}</strong>."""
-
-            elif tipo == 'despachomensajero':
-                locacion_origen_nombre = getattr(getattr(doc, 'locacion_origen', None), 'nombre', 'Desconocido')
-                base_detalle = f"""El mensajero recogio el envio en el centro de distribucion <strong>{locacion_origen_nombre}</strong> y esta en proceso de entrega."""
-                
-                if item.devuelto:
-                    evento = "Devolución"
-                    detalle = base_detalle + "<br><br>El envío no fue entregado y se retorna al centro de distribucion."
-                elif item.confirmado:
-                    evento = "Entrega Exitosa"
-                    detalle = "Su envío fue entregado satisfactoriamente."
-                else:
-                    evento = "Despachado a Mensajero"
-                    detalle = base_detalle
-                
-
-            # Agregar el evento al historial
-            historial.append({
-                'evento': evento,
-                'fecha': fecha,
-                'detalle': detalle,
-                'tipo': tipo
-            })
-
-        if len(historial) == 0:
-            evento = 'Aduana'
-            detalle = 'El envío aún no ha sido recibido por el transportista.' if envio_obj.estado in ['No Recibido', 'Desaforado'] else f'Estado {envio_obj.estado} incorrecto.'
-            # Usar fecha actual si no hay fecha disponible
-            fecha_fallback = timezone.now().strftime('%d/%m/%Y %I:%M %p')
-            tipo_fallback = 'sin_tipo'
-        
-            historial.append({
-                'evento': evento,
-                'fecha': fecha if fecha else fecha_fallback,
-                'detalle': detalle,
-                'tipo': tipo if tipo else tipo_fallback
-            })
-
-        # Ordenar historial (usando la fecha como cadena formateada)
-        historial.sort(key=lambda x: x['fecha'] or '', reverse=True)
-        
-        # logica para el calculo de dias para entrega
-        dias_para_entrega = 0
-        if envio_obj.estado == 'Recibido':
-            # envio_obj.locacion es un string, necesitamos buscar el objeto Locacion
-            locacion_obj = None
-            if envio_obj.locacion:
-                try:
-                    locacion_obj = Locacion.objects.get(nombre=envio_obj.locacion)
-                except Locacion.DoesNotExist:
-                    pass
-            
-            if locacion_obj and locacion_obj.es_almacen_central:
-                dias_para_entrega = 7
-            else:
-                dias_para_entrega = 5
-
-        elif envio_obj.estado == 'Enviado':
-            dias_para_entrega = 1
-
-        logger.info(f'Historial completo para {cod}: {historial}')
-        logger.info(f'Foto de entrega: {envio_obj.foto_entrega}')
-        
-        # Obtener URL de foto de forma segura
-        foto_url = ''
-        if envio_obj.estado == 'Entregado' and envio_obj.foto_entrega:
+        logger.debug('Intentando obtener historial para el código: %s', cod)
+
+        limite_consultas = instantanea.PresupuestoConsultas(getattr(settings, 'SEGUIMIENTO_UMBRAL_LENTO_MS', 2000))
+        with connection.execute_wrapper(limite_consultas):
             try:
-                foto_url = envio_obj.foto_entrega.url
-            except (AttributeError, ValueError):
-                foto_url = ''
-        
-        return JsonResponse({
-            'success': True, 
-            'envio': {
-                'codigo': envio_obj.no_envio,
-                'estado': envio_obj.estado,
-                'almacen': envio_obj.locacion if envio_obj.estado != 'No Recibido' else '',
-                'dias_para_entrega': dias_para_entrega,
-                'foto_confirmacion': foto_url,
-            },
-            'historial': historial, 
-            }, safe=False)
-    
-    except Envio.DoesNotExist:
-        # Manejar el caso de que el envío no exista
-        return JsonResponse({ 'success': False, 'error': f'Envío con código {cod} no encontrado'}, status=404)
+                # Si el almacén es central llega anotado, sin otra consulta a Locacion
+                envio_obj = ServicioSeguimiento.envios().get(no_envio__iexact=cod)
+            except Envio.DoesNotExist:
+                respuesta = ServicioArchivo.respuesta(cod)
+                if respuesta is not None:
+                    logger.info('Historial consultado', extra={'campos': {'codigo': cod, 'estado': respuesta['envio']['estado'], 'archivado': True}})
+                    return JsonResponse(respuesta, safe=False)
+                # Manejar el caso de que el envío no exista
+                return JsonResponse({ 'success': False, 'error': f'Envío con código {cod} no encontrado'}, status=404)
+
+            # Se evalúa una sola vez: sin COUNT ni EXISTS adicionales
+            items = list(ServicioSeguimiento.items([envio_obj.pk]))
+
+            logger.debug('Items de documento encontrados para %s: %d', cod, len(items))
+
+            respuesta = ServicioSeguimiento.respuesta(envio_obj, items)
+        logger.info('Historial consultado', extra={'campos': {'codigo': cod, 'estado': envio_obj.estado, 'eventos': len(respuesta['historial'])}})
+        return JsonResponse(respuesta, safe=False)
+
+    except DatabaseError:
+        logger.warning('Base de datos no disponible en shipment_details para %s', cod, exc_info=True)
+        instantanea.registrar_falla()
+        respuesta = _respuesta_degradada(cod)
+        if respuesta is not None:
+            return JsonResponse(respuesta, safe=False)
+        return JsonResponse({ 'success': False, 'error': 'El seguimiento no está disponible temporalmente, intente más tarde'}, status=503)
         
-    except Exception as e:
-        # Capturar cualquier otro error que pueda ocurrir durante el procesamiento
-        error_msg = f'Ocurrió un error interno: {str(e)}'
-        logger.error(f"Error en shipment_details: {error_msg}")
-        return JsonResponse({ 'success': False, 'error': error_msg}, status=500)
+    except Exception:
+        # El detalle queda en el registro; al cliente no se le muestra
+        logger.exception('Error en shipment_details para %s', cod)
+        return JsonResponse({ 'success': False, 'error': 'Ocurrió un error interno'}, status=500)
 
+@presupuesto(consultas=2)
+async def eventos_envio(request, cod):
+    """
+    Flujo server-sent events con los cambios de estado y movimientos de un envío.
+    Solo consulta la base de datos al conectar; después espera eventos del bus
+    y envía un comentario de latido cada SSE_LATIDO_SEGUNDOS.
+    Requiere un servidor ASGI (SERVIDOR_ASGI): con WSGI cada flujo bloquearía un worker,
+    así que se responde 204, que indica al EventSource que no vuelva a conectar.
+    """
+    if not getattr(settings, 'SERVIDOR_ASGI', False):
+        return HttpResponse(status=204)
+    envio = await sync_to_async(
+        lambda: Envio.objects.filter(no_envio__iexact=cod).values('no_envio', 'estado').first()
+    )()
+    if envio is None:
+        return JsonResponse({'success': False, 'error': f'Envío con código {cod} no encontrado'}, status=404)
+
+    iniciar_oyente()
+    suscripcion = bus.suscribir(envio['no_envio'], getattr(settings, 'SSE_MAX_CONEXIONES', 500))
+    if suscripcion is None:
+        return JsonResponse({'success': False, 'error': 'Demasiadas conexiones de seguimiento abiertas'}, status=503)
+
+    latido = getattr(settings, 'SSE_LATIDO_SEGUNDOS', 20)
+    duracion_maxima = getattr(settings, 'SSE_DURACION_MAXIMA_SEGUNDOS', 900)
+
+    async def flujo():
+        loop = asyncio.get_running_loop()
+        fin = loop.time() + duracion_maxima
+        try:
+            yield 'retry: 5000\n\n'
+            evento = {'codigo': envio['no_envio'], 'motivo': 'inicial', 'estado': envio['estado']}
+            yield f'event: envio\ndata: {json.dumps(evento)}\n\n'
+            # Al cumplirse la duración máxima se cierra el flujo y el navegador reconecta
+            while loop.time() < fin:
+                try:
+                    evento = await asyncio.wait_for(suscripcion.cola.get(), timeout=latido)
+                except asyncio.TimeoutError:
+                    yield ': latido\n\n'
+                    continue
+                yield f'event: envio\ndata: {json.dumps(evento)}\n\n'
+        finally:
+            bus.cancelar(suscripcion)
+
+    response = StreamingHttpResponse(flujo(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@presupuesto(consultas=3, latencia_ms=200)
 def insertar_cotizacion(request):
     if request.method != 'POST':
         return JsonResponse({'error': 'Método no permitido'}, status=405)
@@ -242,4 +201,119 @@ def insertar_cotizacion(request):
     except ValueError as e:
         return JsonResponse({'error': str(e)}, status=400)
     except Exception as e:
-        return JsonResponse({'error': 'Ocurrió un error al procesar la cotización'}, status=500)
\ No newline at end of file
+        return JsonResponse({'error': 'Ocurrió un error al procesar la cotización'}, status=500)
+
+def _token_metricas_valido(request):
+    token = getattr(settings, 'METRICAS_TOKEN', '')
+    tipo, _, valor = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    return bool(token) and tipo.lower() == 'bearer' and constant_time_compare(valor.strip(), token)
+
+
+@presupuesto(consultas=2, latencia_ms=100)
+@require_GET
+def metricas(request):
+    """
+    Métricas del proceso en formato de texto de Prometheus.
+    Requiere el token de METRICAS_TOKEN (Authorization: Bearer) o un usuario staff.
+    """
+    if not _token_metricas_valido(request) and not (request.user.is_active and request.user.is_staff):
+        return HttpResponseForbidden()
+    return HttpResponse(registro.exponer(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@presupuesto(consultas=4, latencia_ms=200)
+@require_GET
+@staff_member_required
+def estado_manifiesto(request, manifiesto_id):
+    """Progreso del manifiesto por estado, leído de los contadores incrementales."""
+    resumen = ServicioContadoresManifiesto.resumen(manifiesto_id)
+    if resumen is None:
+        return JsonResponse({'error': 'Manifiesto no encontrado'}, status=404)
+    return JsonResponse(resumen)
+
+
+@presupuesto(consultas=4, latencia_ms=200)
+@require_GET
+@staff_member_required
+def cotizaciones_pendientes(request):
+    """Bandeja de cotizaciones sin atender, paginada con ?cursor= y ?limite=."""
+    try:
+        limite = int(request.GET.get('limite', 50))
+        pagina = ServicioCotizacion.bandeja(request.GET.get('cursor'), limite)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(pagina)
+
+
+@presupuesto(consultas=4, latencia_ms=200)
+@require_GET
+@staff_member_required
+def buscar_personas(request):
+    """Destinatarios por nombre o carné (?q=), del más al menos relevante, paginados con ?cursor= y ?limite=."""
+    try:
+        limite = int(request.GET.get('limite', 20))
+        pagina = ServicioBusquedaPersona.buscar(request.GET.get('q', ''), request.GET.get('cursor'), limite)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(pagina)
+
+
+@presupuesto(consultas=3, latencia_ms=200)
+@require_POST
+@staff_member_required
+def atender_cotizaciones(request):
+    """Marca como atendidas las cotizaciones enviadas en el parámetro 'ids' (repetible)."""
+    try:
+        ids = [int(cotizacion_id) for cotizacion_id in request.POST.getlist('ids')]
+    except ValueError:
+        return JsonResponse({'error': 'Los ids de cotización deben ser números'}, status=400)
+    if not ids:
+        return JsonResponse({'error': 'No se indicaron cotizaciones'}, status=400)
+    return JsonResponse({'success': True, 'atendidas': ServicioCotizacion.marcar_atendidas(ids)})
+
+
+@presupuesto(consultas=4, latencia_ms=500)
+@require_GET
+@staff_member_required
+def perfiles(request):
+    """Informes del perfilado bajo demanda, del más reciente al más antiguo."""
+    contexto = {
+        **admin.site.each_context(request), 'title': 'Perfiles de peticiones', 'informes': perfilado.resumenes(),
+    }
+    return render(request, 'website_app/perfiles.html', contexto)
+
+
+@presupuesto(consultas=4, latencia_ms=500)
+@require_GET
+@staff_member_required
+def perfil(request, nombre):
+    informe = perfilado.leer(nombre)
+    if informe is None:
+        raise Http404('El perfil no existe o ya se descartó')
+    informe['sentencias'].sort(key=lambda sentencia: sentencia['ms'], reverse=True)
+    contexto = {**admin.site.each_context(request), 'title': f"Perfil de {informe['ruta']}", 'informe': informe}
+    return render(request, 'website_app/perfil.html', contexto)
+
+
+@presupuesto(consultas=4, latencia_ms=200)
+@require_GET
+@staff_member_required
+def liquidacion_mensajeros(request):
+    """
+    Liquidación por mensajero del período ?desde= ?hasta= (AAAA-MM-DD, por defecto el mes en curso),
+    opcionalmente de los mensajeros indicados en ?mensajero= (repetible).
+    """
+    hoy = timezone.localdate()
+    try:
+        desde = date.fromisoformat(request.GET['desde']) if 'desde' in request.GET else hoy.replace(day=1)
+        hasta = date.fromisoformat(request.GET['hasta']) if 'hasta' in request.GET else hoy
+        mensajero_ids = [int(mensajero_id) for mensajero_id in request.GET.getlist('mensajero')] or None
+    except ValueError:
+        return JsonResponse({'error': 'Fechas en formato AAAA-MM-DD y mensajeros numéricos'}, status=400)
+    if desde > hasta:
+        return JsonResponse({'error': 'desde debe ser anterior a hasta'}, status=400)
+    return JsonResponse({
+        'desde': desde,
+        'hasta': hasta,
+        'mensajeros': ServicioLiquidacion.reporte(desde, hasta, mensajero_ids),
+    })